@@ -6,19 +6,35 @@ Created on Wed Aug 30 20:23:06 2023
 """
 
 import os
-import sys
 import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
-import numpy as np
-import pyodbc as db
-import tkinter as tk
-from tkinter.ttk import *
 from exceldatahandler import ExcelDataHandler
 from sqldatahandler import SqlDataHandler
-from serverloginwindow import ServerLoginWindow
+from insertbatcher import InsertBatcher
+from bulkloader import SqlServerBulkLoader
+from loadmanifest import LoadManifest
+from sheetcache import SheetCache
+from routesheetpipeline import RoutesheetPipeline
+from sqlconnectionpool import SqlConnectionPool
+from parallelinserter import ParallelInserter
+from runreport import RunReport, NO_REPORT
+from routesheetvalidator import RoutesheetValidator, RoutesheetValidationError
+from discrepancyreport import ServiceDiscrepancyReport
+from servicefrequency import ServiceFrequencyParser, SERVICE_COLUMNS
+from routesheetwatcher import RoutesheetWatcher, is_excel_file
+from deltaloader import DeltaLoader
+from sqlbackend import SqliteBackend
+from sqliteconnector import SqliteConnector
+from resultexporter import ResultExporter
+from workmanifest import WorkManifest
 
-print("""
+#tkinter, pyodbc and the login window are imported where they are used, so
+#headless runs (see routesheetcli.py) start quickly and need no display
+
+BANNER = """
                                 _ _ _ _       
                                | (_) | |      
   __ _ _ __ _ __ ___   __ _  __| |_| | | ___  
@@ -57,7 +73,24 @@ path to the Excel files that you prepared earlier.
 
 5. Sit back and watch as your data is loaded into SQL Server.
 
-""")
+6. Large folders can be parsed on several CPU cores by passing parse_workers
+to main().  Loading into SQL Server still happens over the single connection.
+
+7. To load without the windows, for example as a scheduled job, run
+python routesheetcli.py --config <config.json>
+Add --watch --manifest-path <manifest.json> to keep running and load
+workbooks as they are saved to the folder.
+
+8. To check a folder without SQL Server, load it into a local SQLite file with
+python routesheetcli.py --config <config.json> --local-database staging.db --local-report-path discrepancies.csv
+and push it to the server once the report comes back clean.
+
+9. To spread a large folder over several machines, start one coordinator with
+python routesheetcli.py --config <config.json> --shard-directory <shared folder> --shard-role coordinator
+and a worker on every other machine with --shard-role worker.  The coordinator
+reserves the ImportID and runs the post load steps once every sheet is done.
+
+"""
 
       
 
@@ -80,14 +113,33 @@ def get_filenames_from_directory(directory: str) -> list:
 def filter_for_excel_files(files: list) -> list:
     '''Takes a collection of filenames and expels non-excel files.
        Returns collection of excel filenames.'''
-    for file in files:
-        #if not an excel file, remove from collection
-        if file.find('.xls') == -1:
-            files.remove(file)
-    return files
+    #built as a new list, removing from files while looping over it skipped the file after each removal
+    return [file for file in files if is_excel_file(file)]
+
+#compact types for the routesheet columns, see ExcelDataHandler.apply_schema()
+#Branch, Route, ServiceDay and ImportID are sheet constants and are stored once per sheet
+ROUTESHEET_SCHEMA = {'Latitude': 'float',
+                     'Longitude': 'float',
+                     'Quantity': 'integer',
+                     'ProductType': 'category',
+                     'Service': 'category',
+                     'ServiceFrequency': 'category'}
+
+#SQLite types of the local staging table by schema type, see open_local_staging()
+LOCAL_COLUMN_TYPES = {'float': 'REAL', 'integer': 'INTEGER'}
+
+#ServiceDiscrepancyReport.SQL written for SQLite, see run_local()
+LOCAL_DISCREPANCY_REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ServiceDiscrepancyReportLocal.SQL')
+
+#every branch is on the Texas gulf coast, coordinates outside this box are entry errors
+ROUTESHEET_COORDINATE_BOUNDS = {'Latitude': (25.8, 36.6), 'Longitude': (-106.7, -93.5)}
+
+def apply_routesheet_schema(exceldatahandler):
+       exceldatahandler.apply_schema(ROUTESHEET_SCHEMA)
 
 def add_required_columns(exceldatahandler, importid):
        #adds ImportID, Branch, Route, and ServiceDay columns - Armadillo specific
+       #each is the same on every row, so they are kept as sheet constants until insert
        add_route_column(exceldatahandler)
        add_branch_column(exceldatahandler)
        add_importid_column(exceldatahandler, importid)
@@ -95,11 +147,11 @@ def add_required_columns(exceldatahandler, importid):
        
 def add_route_column(exceldatahandler):
        route = exceldatahandler.get_sheetname()
-       exceldatahandler.insert_new_column_no_constraints(name='Route', value=route)
+       exceldatahandler.set_sheet_constant(name='Route', value=route)
        
 def add_branch_column(exceldatahandler):
        branch = parse_branch(exceldatahandler)
-       exceldatahandler.insert_new_column_no_constraints(name='Branch', value=branch)
+       exceldatahandler.set_sheet_constant(name='Branch', value=branch)
        
 def parse_branch(exceldatahandler):
        branch = ''
@@ -113,7 +165,7 @@ def parse_branch(exceldatahandler):
        return branch
     
 def add_importid_column(exceldatahandler, importid: int):
-    exceldatahandler.insert_new_column_no_constraints(name='ImportID', value=importid)
+    exceldatahandler.set_sheet_constant(name='ImportID', value=importid)
 
 def get_importid(sqldatahandler) -> int:
     #Unpack value from list of tuple returned by method
@@ -122,7 +174,7 @@ def get_importid(sqldatahandler) -> int:
 
 def add_serviceday_column(exceldatahandler):
        serviceday = get_serviceday(exceldatahandler)
-       exceldatahandler.insert_new_column_no_constraints(name='ServiceDay', value=serviceday)
+       exceldatahandler.set_sheet_constant(name='ServiceDay', value=serviceday)
 
 def get_serviceday(exceldatahandler):
        '''
@@ -138,22 +190,454 @@ def get_serviceday(exceldatahandler):
                      break
        return serviceday
 
-def main():  
+def read_routesheet(xls, sheet_name, run_report=None, filepath=''):
+    '''
+    Reads in a worksheet as a dataframe and throws out the empty rows and unnamed columns.
+    Empty cells are left as NaN and are inserted as NULL.
+    '''
+    run_report = run_report or NO_REPORT
+    with run_report.stage('parse', filepath, sheet_name) as measures:
+        dataframe = pd.read_excel(xls, sheet_name = sheet_name, dtype=object)
+        measures['rows'] = len(dataframe.index)
+    with run_report.stage('clean', filepath, sheet_name) as measures:
+        dataframe = dataframe.dropna(thresh=10)
+        dataframe.drop(labels = dataframe.columns[dataframe.columns.str.contains('unnamed',case=False)], axis = 'columns', inplace = True)
+        measures['rows'] = len(dataframe.index)
+    return dataframe
+
+def parse_workbook(filepath: str, importid: int, skip_sheets=(), cache_directory=None, run_report=None) -> list:
+    '''
+    Reads and cleans every sheet in a workbook and adds the required columns.
+    Returns a list of (sheet_name, dataframe, error) tuples, where error is the
+    formatted traceback of a sheet that could not be parsed, otherwise None.
+    Sheets named in skip_sheets are not read and come back as (sheet_name, None, None).
+    With a cache_directory, cleaned sheets are taken from and saved to a SheetCache,
+    and a workbook whose sheets are all cached is never opened.
+    Kept at module level so it can be handed to a process pool.
+    '''
+    return list(iter_parsed_sheets(filepath, importid, skip_sheets, cache_directory, run_report))
+
+def parse_workbook_with_report(filepath: str, importid: int, skip_sheets=(), cache_directory=None, trace_memory=False) -> tuple:
+    '''Runs parse_workbook() in a process pool worker and returns its stage timings along with the sheets.'''
+    run_report = RunReport(trace_memory=trace_memory)
+    run_report.start()
+    parsed_sheets = parse_workbook(filepath, importid, skip_sheets, cache_directory, run_report)
+    run_report.stop()
+    return parsed_sheets, run_report.stages
+
+def iter_parsed_sheets(filepath: str, importid: int, skip_sheets=(), cache_directory=None, run_report=None):
+    '''Generator behind parse_workbook() that yields each sheet as soon as it is parsed.'''
+    run_report = run_report or NO_REPORT
+    sheet_cache = SheetCache(cache_directory) if cache_directory else None
+    workbook = None
+    try:
+        sheet_names = sheet_cache.get_sheet_names(filepath) if sheet_cache else None
+        if sheet_names is None:
+            with run_report.stage('open_workbook', filepath, bytes=os.path.getsize(filepath)):
+                workbook = pd.ExcelFile(filepath)
+            sheet_names = workbook.sheet_names
+            if sheet_cache:
+                sheet_cache.put_sheet_names(filepath, sheet_names)
+    except Exception:
+        #sheet name is unknown when the workbook itself can't be opened
+        yield None, None, traceback.format_exc()
+        return
+
+    try:
+        for sheet_name in sheet_names:
+            if sheet_name in skip_sheets:
+                yield sheet_name, None, None
+                continue
+            try:
+                dataframe = None
+                if sheet_cache:
+                    with run_report.stage('cache_read', filepath, sheet_name) as measures:
+                        dataframe = sheet_cache.get(filepath, sheet_name)
+                        measures['rows'] = len(dataframe.index) if dataframe is not None else 0
+                if dataframe is None:
+                    if workbook is None:
+                        with run_report.stage('open_workbook', filepath, bytes=os.path.getsize(filepath)):
+                            workbook = pd.ExcelFile(filepath)
+                    dataframe = read_routesheet(workbook, sheet_name, run_report, filepath)
+                    if sheet_cache:
+                        sheet_cache.put(filepath, sheet_name, dataframe)
+                xl_data = ExcelDataHandler(dataframe, filepath, sheet_name)
+                with run_report.stage('apply_schema', filepath, sheet_name, rows=len(xl_data)):
+                    apply_routesheet_schema(xl_data)
+                with run_report.stage('add_required_columns', filepath, sheet_name, rows=len(xl_data)):
+                    add_required_columns(xl_data, importid)
+                parsed_sheet = (sheet_name, xl_data.get_dataframe(), None)
+            except Exception:
+                parsed_sheet = (sheet_name, None, traceback.format_exc())
+            yield parsed_sheet
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+def iter_parsed_workbooks(filepaths: list, importid: int, parse_workers: int = 1, skip_sheets=None, cache_directory=None,
+                          run_report=None):
+    '''
+    Yields (filepath, parsed_sheets) for each workbook in the order given.
+    When parse_workers is greater than 1, workbooks are parsed concurrently in a
+    process pool and handed back here so loading stays on a single connection.
+    skip_sheets optionally maps a filepath to the sheet names that should not be read.
+    Without a process pool, sheets are parsed lazily as the caller iterates them.
+    '''
+    run_report = run_report or NO_REPORT
+    skip_sheets = skip_sheets or {}
+    skip_sheets_per_file = [skip_sheets.get(filepath, set()) for filepath in filepaths]
+    if parse_workers > 1:
+        with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+            if not run_report.enabled:
+                yield from zip(filepaths, executor.map(parse_workbook, filepaths, repeat(importid),
+                                                       skip_sheets_per_file, repeat(cache_directory)))
+                return
+            #each worker times its own stages and sends them back with the sheets
+            parsed_workbooks = executor.map(parse_workbook_with_report, filepaths, repeat(importid),
+                                            skip_sheets_per_file, repeat(cache_directory), repeat(run_report.trace_memory))
+            for filepath, (parsed_sheets, stages) in zip(filepaths, parsed_workbooks):
+                run_report.extend(stages)
+                yield filepath, parsed_sheets
+    else:
+        for filepath, skip in zip(filepaths, skip_sheets_per_file):
+            yield filepath, iter_parsed_sheets(filepath, importid, skip, cache_directory, run_report)
+
+def stream_workbook(filepath: str, importid: int, chunk_size: int, skip_sheets=(), run_report=None):
+    '''
+    Streaming counterpart of parse_workbook().  Yields (sheet_name, chunks, error)
+    where chunks is a generator of dataframes of at most chunk_size rows with the
+    required columns added.  Rows are only read as the chunks are consumed.
+    '''
+    run_report = run_report or NO_REPORT
+    try:
+        with run_report.stage('open_workbook', filepath, bytes=os.path.getsize(filepath)):
+            workbook = ExcelDataHandler(pd.DataFrame(), filepath).open_workbook_read_only()
+    except Exception:
+        yield None, None, traceback.format_exc()
+        return
+
+    try:
+        for sheet_name in workbook.sheetnames:
+            if sheet_name in skip_sheets:
+                yield sheet_name, None, None
+                continue
+            yield sheet_name, iter_routesheet_chunks(workbook, filepath, sheet_name, importid, chunk_size, run_report), None
+    finally:
+        workbook.close()
+
+def iter_routesheet_chunks(workbook, filepath: str, sheet_name: str, importid: int, chunk_size: int, run_report=None):
+    run_report = run_report or NO_REPORT
+    xl_reader = ExcelDataHandler(pd.DataFrame(), filepath, sheet_name)
+    chunks = xl_reader.iter_sheet_chunks(chunk_size, workbook=workbook)
+    while True:
+        #streamed rows are read and cleaned together, so both count as parse
+        with run_report.stage('parse', filepath, sheet_name) as measures:
+            chunk = next(chunks, None)
+            measures['rows'] = len(chunk.index) if chunk is not None else 0
+        if chunk is None:
+            return
+        xl_data = ExcelDataHandler(chunk, filepath, sheet_name)
+        with run_report.stage('apply_schema', filepath, sheet_name, rows=len(xl_data)):
+            apply_routesheet_schema(xl_data)
+        with run_report.stage('add_required_columns', filepath, sheet_name, rows=len(xl_data)):
+            add_required_columns(xl_data, importid)
+        yield xl_data.get_dataframe()
+
+def iter_streamed_workbooks(filepaths: list, importid: int, chunk_size: int, skip_sheets=None, run_report=None):
+    '''Yields (filepath, streamed_sheets) for each workbook, see stream_workbook().'''
+    skip_sheets = skip_sheets or {}
+    for filepath in filepaths:
+        yield filepath, stream_workbook(filepath, importid, chunk_size, skip_sheets.get(filepath, set()), run_report)
+
+def load_routesheet(sql_data, xl_data, table: str, routesheets_failed_to_insert: list, run_report=None) -> bool:
+    '''
+    Inserts the sheet held by xl_data.  Failed sheets are added to routesheets_failed_to_insert.
+    Returns True when the sheet was committed.
+    '''
+    run_report = run_report or NO_REPORT
+    file = os.path.basename(xl_data.get_filepath())
+    current_sheet = xl_data.get_sheetname()
+    try:
+        with run_report.stage('staging', file, current_sheet, rows=len(xl_data)):
+            sql_data.add_dataframe_to_insert(xl_data.get_dataframe(), table)
+        with run_report.stage('insert', file, current_sheet, rows=len(xl_data)):
+            sql_data.bulk_insert_rows_to_table(xl_data[:1], table)
+        print(f'{file} - {current_sheet} inserted successfully into {table}\n\n')
+        return True
+    except:
+        traceback.print_exc()
+        report_failed_routesheets([f'{file} - {current_sheet}'], table, routesheets_failed_to_insert)
+        return False
+
+def report_failed_routesheets(sheet_labels: list, table: str, routesheets_failed_to_insert: list):
+    '''Records each failed sheet once and prints the usual hints for tracking down the problem.'''
+    for sheet_label in sheet_labels:
+        if sheet_label in routesheets_failed_to_insert:
+            continue
+        routesheets_failed_to_insert.append(sheet_label)
+        print(f'{sheet_label} failed to be inserted into {table}\n'
+            + 'This most commonly indicates one of the following issues:\n'
+            + ' *Column misalignment: look for rows where the lat/longs dont line up with the rest\n'
+            + ' *Longitudes have the negative sign (-) in the wrong spot: this seems to happen from time to time\n'
+            + ' *Duplicate column headers: one must be changed or deleted, otherwise the insert statement gets jacked up\n'
+            + f'Please go back and examine {sheet_label} for inconsistancies'
+            + ' in the column headers and the data.\n\n')
+
+def skip_loaded_workbooks(manifest, filepaths: list) -> tuple:
+    '''
+    Hashes each workbook and checks it against the load manifest.  Returns the
+    filepaths that still need loading, the content hash of each one, and the
+    sheets of each one that are already loaded and can be skipped.
+    '''
+    filepaths_to_load = []
+    workbook_hashes = {}
+    skip_sheets = {}
+    for filepath in filepaths:
+        content_hash = manifest.hash_workbook(filepath)
+        if manifest.is_workbook_loaded(content_hash):
+            print(f'Skipping {os.path.basename(filepath)}, it is unchanged and already loaded\n')
+            continue
+        filepaths_to_load.append(filepath)
+        workbook_hashes[filepath] = content_hash
+        skip_sheets[filepath] = manifest.loaded_sheets(content_hash)
+    return filepaths_to_load, workbook_hashes, skip_sheets
+
+class RoutesheetLoader():
+    '''
+    Loads parsed or streamed routesheets for one ImportID through a single
+    SqlDataHandler.  Keeps the list of sheets that failed to insert and, when a
+    LoadManifest is given, records each sheet as committed or failed.
+    inserter is an optional InsertBatcher or ParallelInserter that takes over
+    the inserts, otherwise each sheet is inserted and committed on its own.
+    validator is an optional RoutesheetValidator that quarantines bad rows
+    before they are inserted, and discrepancy_report an optional
+    ServiceDiscrepancyReport that aggregates the rows as they are loaded.
+    service_parser is an optional ServiceFrequencyParser that adds the parsed
+    Service codes to each sheet as numeric columns.
+    '''
+
+    def __init__(self, sql_data, table: str, importid: int, inserter=None, manifest=None, run_report=None, validator=None,
+                 discrepancy_report=None, service_parser=None):
+        self.sql_data = sql_data
+        self.table = table
+        self.importid = importid
+        self.inserter = inserter
+        self.manifest = manifest
+        self.run_report = run_report or NO_REPORT
+        self.validator = validator
+        self.discrepancy_report = discrepancy_report
+        self.service_parser = service_parser
+
+        #Report failed inserts upon completion
+        self.routesheets_failed_to_insert = []
+
+        #key is '{file} - {sheet}', value is (content hash, sheet name, filepath) for the manifest
+        self.sheet_sources = {}
+
+    def load_workbook(self, filepath: str, parsed_sheets, content_hash=None):
+        '''
+        parsed_sheets holds (sheet_name, sheet_data, error) tuples as given by
+        parse_workbook() or stream_workbook().  sheet_data is a dataframe, a
+        generator of dataframe chunks, or None for a sheet that is already loaded.
+        '''
+        file = os.path.basename(filepath)
+        sheet_names = []
+        had_parse_error = False
+
+        for current_sheet, sheet_data, parse_error in parsed_sheets:
+            sheet_label = f'{file} - {current_sheet}' if current_sheet is not None else file
+            if current_sheet is not None:
+                sheet_names.append(current_sheet)
+                if content_hash:
+                    self.sheet_sources[sheet_label] = (content_hash, current_sheet, filepath)
+
+            if sheet_data is None and not parse_error:
+                #without a manifest the sheet was left to another shard, see load_work_unit()
+                if self.manifest:
+                    print(f'Skipping {sheet_label}, already loaded\n')
+                continue
+
+            print(f'Currently working on: {sheet_label}\n')
+
+            if parse_error:
+                had_parse_error = True
+                print(parse_error)
+                print(f'{sheet_label} could not be read from the workbook\n\n')
+                self.routesheets_failed_to_insert.append(sheet_label)
+                self.update_manifest(failed=[sheet_label])
+                continue
+
+            #whole sheets arrive as one dataframe, streamed sheets as a generator of chunks
+            chunks = [sheet_data] if isinstance(sheet_data, pd.DataFrame) else sheet_data
+            self.load_sheet(filepath, current_sheet, sheet_label, chunks)
+
+        #recorded last so a workbook only counts as known once all its sheets were seen,
+        #and not at all when it could not be read, so it is tried again on the next run
+        if self.manifest and content_hash and sheet_names and not had_parse_error:
+            self.manifest.record_workbook(content_hash, filepath, sheet_names)
+
+    def load_sheet(self, filepath: str, current_sheet: str, sheet_label: str, chunks):
+        try:
+            for dataframe in chunks:
+                #parsed before validation so the new columns are checked against the field map too
+                if self.service_parser:
+                    with self.run_report.stage('parse_service_codes', filepath, current_sheet, rows=len(dataframe.index)):
+                        dataframe = self.service_parser.add_columns(dataframe)
+
+                if self.validator:
+                    with self.run_report.stage('validate', filepath, current_sheet, rows=len(dataframe.index)):
+                        dataframe = self.validator.validate(dataframe, sheet_label)
+
+                if self.discrepancy_report:
+                    with self.run_report.stage('discrepancy_report', filepath, current_sheet, rows=len(dataframe.index)):
+                        self.discrepancy_report.add_rows(dataframe, sheet_label)
+
+                #a fresh handler per chunk, since set_dataframe() empties the previous
+                #dataframe in place and a ParallelInserter may still be holding it
+                xl_data = ExcelDataHandler(dataframe, filepath, current_sheet)
+
+                if not xl_data: #don't attempt an import if routesheet doesnt actually contain data
+                    continue
+
+                if self.inserter:
+                    self.report_failures(self.inserter.add_sheet(xl_data.get_dataframe(), sheet_label, sheet_complete=False))
+                elif load_routesheet(self.sql_data, xl_data, self.table, self.routesheets_failed_to_insert, self.run_report):
+                    self.update_manifest(committed=[sheet_label])
+                    return
+                else:
+                    self.update_manifest(failed=[sheet_label])
+                    return
+        except RoutesheetValidationError as error:
+            print(f'{error}\n')
+            self.report_failures([sheet_label])
+            if self.inserter:
+                self.inserter.fail_sheet(sheet_label)
+        except Exception:
+            #streamed sheets are read as they load, so reading can fail part way through
+            traceback.print_exc()
+            self.report_failures([sheet_label])
+            if self.inserter:
+                self.inserter.fail_sheet(sheet_label)
+
+        if self.inserter:
+            self.inserter.complete_sheet(sheet_label)
+            self.update_manifest(committed=self.inserter.pop_committed_sheets())
+        elif sheet_label not in self.routesheets_failed_to_insert:
+            #nothing to insert, but the sheet is done
+            self.update_manifest(committed=[sheet_label])
+
+    def finish(self) -> list:
+        '''Flushes any batched rows.  Returns the sheets that failed to insert.'''
+        if self.inserter:
+            self.report_failures(self.inserter.flush())
+            self.update_manifest(committed=self.inserter.pop_committed_sheets())
+        return self.routesheets_failed_to_insert
+
+    def report_failures(self, sheet_labels: list):
+        report_failed_routesheets(sheet_labels, self.table, self.routesheets_failed_to_insert)
+        self.update_manifest(failed=sheet_labels)
+
+    def update_manifest(self, committed=(), failed=()):
+        '''Marks sheets in the load manifest by label, if a manifest is in use, and in the discrepancy report.'''
+        if self.discrepancy_report:
+            for sheet_label in committed:
+                self.discrepancy_report.commit_sheet(sheet_label)
+            for sheet_label in failed:
+                self.discrepancy_report.discard_sheet(sheet_label)
+        if not self.manifest:
+            return
+        for sheet_label in committed:
+            self.manifest.mark_committed(*self.sheet_sources[sheet_label], self.importid)
+        for sheet_label in failed:
+            if sheet_label in self.sheet_sources:
+                self.manifest.mark_failed(*self.sheet_sources[sheet_label], self.importid)
+
+def main(parse_workers: int = 1, chunk_rows=None, chunk_bytes=None, bulk_staging_directory=None, manifest_path=None,
+         cache_directory=None, stream_chunk_size=None, pipeline_queue_size=None, insert_workers=None,
+         report_path=None, trace_memory=False, profile_path=None, quarantine_path=None,
+         discrepancy_report_path=None, discrepancy_state_path=None, parse_service_codes=False, delta=False):
     '''
     Begin by connecting to the SQL Server Database.  This is done first so the
     connection is made one time no matter how many Excel files need to be read in.
+
+    parse_workers sets how many processes read and clean workbooks at once.
+    chunk_rows and chunk_bytes switch from one commit per sheet to chunked
+    commits that batch rows across sheets with the same columns.
+    bulk_staging_directory switches inserts to BULK INSERT from csv staging
+    files written there; it must be readable by the SQL Server service.
+    manifest_path keeps a record of committed sheets so reruns of the same
+    folder only load new, changed or previously failed sheets.  Each sheet is
+    then committed in one transaction, so chunked or streamed sheets are held
+    until they are complete and a failed sheet never leaves rows behind.
+    cache_directory keeps cleaned sheets as Arrow files so unchanged sheets are
+    not parsed out of the xlsx again (requires pyarrow).  To clear it, run
+    python sheetcache.py <cache_directory> --invalidate [workbook ...]
+    stream_chunk_size reads sheets row by row in chunks of that many rows and
+    loads each chunk as it is read, keeping memory flat for very large sheets.
+    Streaming reads one workbook at a time and does not use the sheet cache.
+    pipeline_queue_size reads sheets on a background thread while inserts run,
+    holding at most that many parsed sheets (or chunks) in between.
+    insert_workers opens that many pooled connections and inserts sheets in
+    parallel, partitioned by Branch.  Each sheet is its own transaction, so
+    chunk_rows and chunk_bytes do not apply in this mode.
+    report_path times every stage of each file and sheet (open, parse, clean,
+    add_required_columns, staging, insert) and writes the timings there as
+    csv when it ends in .csv, otherwise as JSON.  trace_memory adds the peak
+    memory of each stage from tracemalloc, which slows the run down, and
+    profile_path dumps cProfile stats of the run there for pstats or snakeviz.
+    quarantine_path validates every sheet before it is inserted.  Rows with
+    misaligned columns, misplaced minus signs or coordinates out of range are
+    written to that csv with the reasons and the rest of the sheet is loaded.
+    Sheets with duplicate or unmapped headers are quarantined whole.
+    discrepancy_report_path builds ServiceDiscrepancyReport.SQL's report from
+    the rows as they load and writes it there as csv at the end of the run.
+    discrepancy_state_path keeps the aggregates between runs, so a run that
+    reloads one branch or day still reports on the whole table.  To rebuild
+    the report from the state, run
+    python discrepancyreport.py <state_path> <report_path> [--branch ...] [--day ...]
+    parse_service_codes adds VisitsPerDay, DaysPerWeek, FrequencyDaysPerWeek,
+    IsOnCall and ServiceUnparsed columns parsed from Service and ServiceFrequency, for
+    ServiceDiscrepancyReportNormalized.SQL.  They must be in the field map and
+    the table.  Codes that could not be parsed are listed at the end, and
+    UnparsedServiceCodes.SQL lists them from the table.
+    delta compares each sheet with the rows already loaded for its branch,
+    day and route, and only inserts, updates or retires the rows that
+    changed, see DeltaLoader.  The table needs RowKey, RowHash and
+    RetiredImportID columns.  Each sheet is its own transaction, so
+    chunk_rows, chunk_bytes and insert_workers do not apply in this mode.
     '''
+    print(BANNER)
+
     field_map = {'input_field': 'mapped_field'}
+    table = '{table}'
     
+    from serverloginwindow import ServerLoginWindow
     sql_data = SqlDataHandler(field_map=field_map)
     server_login = ServerLoginWindow(sql_data)
 
+    if bulk_staging_directory:
+        sql_data.set_bulk_loader(SqlServerBulkLoader(), bulk_staging_directory)
+
+    directory_path = prompt_for_directory()
+
+    run_load(sql_data, table, directory_path, parse_workers=parse_workers, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes,
+             manifest_path=manifest_path, cache_directory=cache_directory, stream_chunk_size=stream_chunk_size,
+             pipeline_queue_size=pipeline_queue_size, insert_workers=insert_workers, report_path=report_path,
+             trace_memory=trace_memory, profile_path=profile_path, quarantine_path=quarantine_path,
+             discrepancy_report_path=discrepancy_report_path, discrepancy_state_path=discrepancy_state_path,
+             parse_service_codes=parse_service_codes, delta=delta)
+
+    print(FAREWELL)
+
+def prompt_for_directory() -> str:
     '''
     Prompt user to enter path to folder containing Excel files needing to be 
     loaded into the SQL Server Database.  For each Excel file, read in each
     sheet in the workbook as a Pandas Dataframe.  ExcelDataHandler passes the
     Excel data to SqlDataHandler which loads it into the SQL Server Database.
     '''
+    import tkinter as tk
+    from tkinter.ttk import Frame, Label, Entry, Button
 
     #initialize gui window
     root = tk.Tk()
@@ -169,69 +653,126 @@ def main():
     Button(frame, text='Submit', command=root.destroy).grid(column=1, row=2)  
     root.mainloop()
 
-    directory_path = directory_input.get()
-    routesheets_files = get_excel_filenames_from_directory(directory_path)
+    return directory_input.get()
 
-    xl_data = ExcelDataHandler()    
+def run_headless(connection_string: str, directory_path: str, field_map: dict, table: str, importid=None,
+                 bulk_staging_directory=None, watch=False, poll_interval=2.0, settle_seconds=5.0, shard_directory=None,
+                 shard_role='worker', shard_worker=None, stale_seconds=3600.0, **load_options) -> list:
+    '''
+    Loads a folder without any windows, for scheduled jobs.  Connects with
+    connection_string, then runs the same load as main().  importid is looked
+    up from dbo.MostRecentImport unless given.  load_options are the options
+    of main(), see there.  Returns the sheets that failed to insert.
+    watch keeps running and loads workbooks as they change instead, see
+    watch_routesheet_folder().
+    shard_directory shares the load with other processes or hosts through a
+    work manifest in that folder, as the coordinator or a worker depending on
+    shard_role, see run_shard_coordinator() and run_shard_worker().
+    '''
+    import pyodbc as db
 
-    time_start = time.perf_counter() # benchmarking runtime: total_duration = time_end - time_start
+    sql_data = SqlDataHandler(field_map=field_map)
+    sql_data.set_sql_connector(db.connect(connection_string))
+    sql_data.set_connection_string(connection_string)
 
-    #Set ImportID for this batch of routesheets.
-    #Must be done before looping over files to ensure entire batch is loaded with same ID.
-    importid = get_importid(sql_data) 
+    if bulk_staging_directory:
+        sql_data.set_bulk_loader(SqlServerBulkLoader(), bulk_staging_directory)
 
-    #Report failed inserts upon completion
-    routesheets_failed_to_insert = []
-    
-    #for each workbook in the given directory, 
-    #read in worksheet as a dataframe.
-    for file in routesheets_files:
+    try:
+        if watch:
+            watch_routesheet_folder(sql_data, table, directory_path, poll_interval=poll_interval,
+                                    settle_seconds=settle_seconds, **load_options)
+            return []
+        if shard_directory and shard_role == 'coordinator':
+            return run_shard_coordinator(sql_data, table, directory_path, shard_directory, importid, shard_worker,
+                                         poll_interval, stale_seconds, **load_options)
+        if shard_directory:
+            return run_shard_worker(sql_data, directory_path, shard_directory, shard_worker, poll_interval, stale_seconds,
+                                    **load_options)
+        return run_load(sql_data, table, directory_path, importid, **load_options)
+    finally:
+        sql_data.sql_connector.close()
 
-        filepath = f'{directory_path}\{file}'
-        
-        workbook = pd.ExcelFile(filepath)
-        sheet_names = workbook.sheet_names
+def open_local_staging(database_path: str, field_map: dict, table: str):
+    '''
+    Creates an empty routesheet table in the SQLite file database_path, with
+    a column for every field in field_map, and returns a SqlDataHandler
+    connected to it.  Coordinates, quantities, ImportID and the parsed service
+    columns are numeric, everything else is text.
+    '''
+    header_types = dict(ROUTESHEET_SCHEMA, ImportID='integer', **dict.fromkeys(SERVICE_COLUMNS, 'integer'))
+    field_types = {}
+    for header, field in field_map.items():
+        field_types.setdefault(field, LOCAL_COLUMN_TYPES.get(header_types.get(header)))
 
-        with workbook as xls:
-        
-            for current_sheet in sheet_names:
-                print(f'Currently working on: {file} - {current_sheet}\n')
-
-                #temporarily suppress Pandas FutureWarning about use of pd.dataframe.replace()
-                with warnings.catch_warnings():
-                    warnings.simplefilter('ignore', category = FutureWarning)
-
-                    #Read in dataframe and throw out all of the empty rows
-                    dataframe = pd.read_excel(xls, sheet_name = current_sheet, dtype=object).dropna(thresh=10).replace(np.nan, 0)                        
-                    dataframe.drop(labels = dataframe.columns[dataframe.columns.str.contains('unnamed',case=False)], axis = 'columns', inplace = True)
-                                    
-                    xl_data.set_dataframe(dataframe)
-                    xl_data.set_filepath(filepath)
-                    xl_data.set_sheetname(current_sheet)
-                    add_required_columns(xl_data, importid)
+    backend = SqliteBackend()
+    sql_data = SqlDataHandler(field_map=field_map)
+    sql_data.set_backend(backend)
+    sql_data.set_sql_connector(SqliteConnector(database_path))
+    sql_data.set_connection_string(database_path)
+    backend.create_schema(sql_data.cursor, table, field_types, importid_field=field_map.get('ImportID', 'ImportID'))
+    return sql_data
 
+def run_local(database_path: str, directory_path: str, field_map: dict, table: str, importid=None,
+              local_report_path=None, **load_options) -> list:
+    '''
+    Loads a folder into a local SQLite file instead of SQL Server, so a folder
+    of workbooks can be checked on a laptop before it is pushed to the server.
+    The table is created from field_map and starts empty on every run.
+    local_report_path runs ServiceDiscrepancyReportLocal.SQL over the
+    loaded table once loading is done and writes it there, as parquet
+    if it ends in .parquet, otherwise as csv.  load_options are the options
+    of main(), apart from bulk_staging_directory, insert_workers,
+    manifest_path and delta, which need SQL Server.
+    Returns the sheets that failed to insert.
+    '''
+    sql_data = open_local_staging(database_path, field_map, table)
+    try:
+        routesheets_failed_to_insert = run_load(sql_data, table, directory_path, importid, **load_options)
+        if local_report_path:
+            rows = ResultExporter(sql_data).export_query_file(LOCAL_DISCREPANCY_REPORT, local_report_path,
+                                                              sql_data.backend.table_name(table))
+            print(f'{rows} service discrepancies written to {local_report_path}')
+        return routesheets_failed_to_insert
+    finally:
+        sql_data.sql_connector.close()
 
-                    if xl_data: #don't attempt an import if routesheet doesnt actually contain data
-                        try:
-                            for row in xl_data:
-                                sql_data.add_row_to_insert(row)
-                            sql_data.insert_rows_to_table(xl_data[:1], '{table}')
-                            print(f'{file} - {current_sheet} inserted successfully into {table}\n\n')
-                        except:
-                            traceback.print_exc()
-                            routesheets_failed_to_insert.append(f'{file} - {current_sheet}')
-                            print(f'{file} - {current_sheet} failed to be inserted into {table}\n'
-                                + 'This most commonly indicates one of the following issues:\n'
-                                + ' *Column misalignment: look for rows where the lat/longs dont line up with the rest\n'
-                                + ' *Longitudes have the negative sign (-) in the wrong spot: this seems to happen from time to time\n'
-                                + ' *Duplicate column headers: one must be changed or deleted, otherwise the insert statement gets jacked up\n'  
-                                + f'Please go back and examine {file} - {current_sheet} for inconsistancies'
-                                + ' in the column headers and the data.\n\n')
-                        finally:
-                            continue
-                
-                
-        workbook.close()
+def run_load(sql_data, table: str, directory_path: str, importid=None, parse_workers: int = 1, chunk_rows=None,
+             chunk_bytes=None, manifest_path=None, cache_directory=None, stream_chunk_size=None,
+             pipeline_queue_size=None, insert_workers=None, report_path=None, trace_memory=False, profile_path=None,
+             quarantine_path=None, discrepancy_report_path=None, discrepancy_state_path=None,
+             parse_service_codes=False, delta=False) -> list:
+    '''
+    Loads every workbook in directory_path through sql_data, which must
+    already be connected, reports on the run and runs the post load steps.
+    Returns the sheets that failed to insert.
+    '''
+    routesheets_files = get_excel_filenames_from_directory(directory_path)
+    routesheets_filepaths = [os.path.join(directory_path, file) for file in routesheets_files]
+
+    time_start = time.perf_counter() # benchmarking runtime: total_duration = time_end - time_start
+
+    run_report = RunReport(enabled=bool(report_path or trace_memory or profile_path),
+                           trace_memory=trace_memory, profile_path=profile_path)
+    run_report.start()
+
+    #Set ImportID for this batch of routesheets.
+    #Must be done before looping over files to ensure entire batch is loaded with same ID.
+    if importid is None:
+        importid = get_importid(sql_data) 
+
+    routesheets_failed_to_insert = load_routesheet_files(sql_data, table, routesheets_filepaths, importid, parse_workers,
+                                                         chunk_rows, chunk_bytes, manifest_path, cache_directory,
+                                                         stream_chunk_size, pipeline_queue_size, insert_workers,
+                                                         run_report=run_report, quarantine_path=quarantine_path,
+                                                         discrepancy_report_path=discrepancy_report_path,
+                                                         discrepancy_state_path=discrepancy_state_path,
+                                                         parse_service_codes=parse_service_codes, delta=delta)
+
+    run_report.stop()
+    run_report.print_summary()
+    if report_path:
+        run_report.write(report_path)
 
     # benchmarking runtime
     time_end = time.perf_counter() 
@@ -240,25 +781,282 @@ def main():
     print(f'Total runtime: {total_duration} seconds\n'
           + f'Routesheet import {importid} complete.\n\n')
 
+    run_post_load_procedures(routesheets_failed_to_insert)
+    return routesheets_failed_to_insert
+
+def run_post_load_procedures(routesheets_failed_to_insert: list):
     if routesheets_failed_to_insert:
         print(f'Please check on the following routesheets that failed to insert:\n {routesheets_failed_to_insert}')
     else:
         #Run stored procs to tie up loose ends:
-        
-        #change missing values replaced by 0 to NULL in {table}
-        try:
-            print('Here, a stored procedure would be executed to null the zero values that were just inserted.')
-        except:
-            print('Problem running procedure, please execute in SSMS')
+        #(empty cells are inserted as NULL, so they no longer need to be nulled afterwards)
 
         #update IDs in identity tables
         try:
             print('And here, a stored procedure is run that aggregates the inserted data, populates a series of tables with that data, and assigns primary keys.')
         except:
             print('Problem running procedure, please execute in SSMS')
+
+def run_shard_coordinator(sql_data, table: str, directory_path: str, shard_directory: str, importid=None,
+                          shard_worker=None, poll_interval=2.0, stale_seconds=3600.0, **load_options) -> list:
+    '''
+    Coordinates a load shared by several workers, see WorkManifest.  Reserves
+    the ImportID once, publishes a unit per sheet of every workbook in
+    directory_path to shard_directory and then loads sheets alongside the
+    workers started with run_shard_worker().  Only once every sheet is done
+    does it print the run summary and run the post load steps, as run_load()
+    does for a single process.  shard_directory must be a new or empty folder
+    that every worker can reach.  Returns the sheets that failed on any worker.
+    '''
+    time_start = time.perf_counter()
+
+    #reserved once here, every worker loads under the ImportID in the job
+    if importid is None:
+        importid = get_importid(sql_data)
+
+    work_manifest = WorkManifest(shard_directory, shard_worker, stale_seconds)
+    job = work_manifest.publish(importid, table, list_work_units(directory_path))
+    print(f'Published {len(job["units"])} sheets as import {importid} to {shard_directory}\n')
+
+    #returns once every unit has a result, whoever loaded it
+    run_shard_worker(sql_data, directory_path, shard_directory, work_manifest.worker, poll_interval, stale_seconds,
+                     **load_options)
+
+    results = [result for unit, result in sorted(work_manifest.results().items())]
+    routesheets_failed_to_insert = [sheet_label for result in results for sheet_label in result['failed']]
+
+    worker_summaries = {}
+    for result in results:
+        worker_summary = worker_summaries.setdefault(result['worker'], {'sheets': 0, 'failed': 0, 'seconds': 0.0})
+        worker_summary['sheets'] += 1
+        worker_summary['failed'] += result['status'] == 'failed'
+        worker_summary['seconds'] += result['seconds']
+    print(f'Sharded load summary: {len(results)} sheets loaded by {len(worker_summaries)} workers')
+    for worker, worker_summary in sorted(worker_summaries.items()):
+        print(f' worker {worker}: {worker_summary["sheets"]} sheets, {worker_summary["failed"]} failed, '
+              + f'{round(worker_summary["seconds"], 4)} seconds')
+
+    total_duration = round(time.perf_counter() - time_start, 4)
+    print(f'Total runtime: {total_duration} seconds\n'
+          + f'Routesheet import {importid} complete.\n\n')
+
+    run_post_load_procedures(routesheets_failed_to_insert)
+    return routesheets_failed_to_insert
+
+def run_shard_worker(sql_data, directory_path: str, shard_directory: str, shard_worker=None, poll_interval=2.0,
+                     stale_seconds=3600.0, **load_options) -> list:
+    '''
+    Loads sheets of a shared load until every sheet is done, see WorkManifest.
+    Waits for the coordinator to publish the job, then claims and loads one
+    sheet at a time under the job's table and ImportID.  While the sheets left
+    are claimed by other workers it keeps polling, so it can take over any
+    claim that goes stale.  directory_path is this host's path to the
+    routesheet folder.  load_options are the options of load_routesheet_files().
+    Returns the sheets this worker failed to insert.
+    '''
+    work_manifest = WorkManifest(shard_directory, shard_worker, stale_seconds)
+    print(f'Worker {work_manifest.worker} waiting for a job in {shard_directory}\n')
+    job = work_manifest.wait_for_job(poll_interval)
+
+    routesheets_failed_to_insert = []
+    while not work_manifest.is_finished():
+        unit = work_manifest.claim()
+        if unit is None:
+            time.sleep(poll_interval)
+            continue
+
+        time_start = time.perf_counter()
+        failed_sheets = load_work_unit(sql_data, directory_path, job, unit, **load_options)
+        if work_manifest.is_superseded(unit):
+            print(f'{unit["file"]} - {unit["sheet"]} took longer than stale_seconds and was claimed again while it loaded, '
+                  + f'its rows may be in import {job["importid"]} twice\n')
+        work_manifest.record(unit, failed_sheets, time.perf_counter() - time_start)
+        routesheets_failed_to_insert.extend(failed_sheets)
+
+    print(f'Worker {work_manifest.worker} done, every sheet of import {job["importid"]} is loaded\n')
+    return routesheets_failed_to_insert
+
+def list_work_units(directory_path: str) -> list:
+    '''
+    Returns a (filename, sheet name) unit per sheet of every workbook in the
+    folder.  A workbook whose sheets can't be listed is a single unit with no
+    sheet name, so the worker that loads it reports why it failed.
+    '''
+    units = []
+    for filename in get_excel_filenames_from_directory(directory_path):
+        try:
+            sheet_names = ExcelDataHandler(pd.DataFrame(), os.path.join(directory_path, filename)).get_sheet_names()
+        except Exception:
+            sheet_names = [None]
+        units.extend((filename, sheet_name) for sheet_name in sheet_names)
+    return units
+
+def load_work_unit(sql_data, directory_path: str, job: dict, unit: dict, **load_options) -> list:
+    '''Loads the sheet of one unit, or the whole workbook when it has no sheet name.  Returns the sheets that failed.'''
+    filepath = os.path.join(directory_path, unit['file'])
+    skip_sheets = {}
+    if unit['sheet'] is not None:
+        #the other sheets of the workbook are units of their own
+        skip_sheets[filepath] = {other['sheet'] for other in job['units']
+                                 if other['file'] == unit['file'] and other['sheet'] != unit['sheet']}
+    return load_routesheet_files(sql_data, job['table'], [filepath], job['importid'], skip_sheets=skip_sheets,
+                                 **load_options)
+
+def watch_routesheet_folder(sql_data, table: str, directory_path: str, manifest_path: str, poll_interval=2.0,
+                            settle_seconds=5.0, **load_options):
+    '''
+    Keeps sql_data's connection open and loads workbooks as they are added to
+    or saved in directory_path and its subfolders, until interrupted with
+    Ctrl+C.  Each batch of workbooks that settled in one poll looks up its
+    ImportID when it starts, as a run of main() does.  The manifest skips the sheets that are already loaded, so
+    restarting the watcher does not reload the folder.  An edited workbook
+    loads all of its sheets again, as on a rerun.  A batch that stops with an
+    error, such as a workbook deleted before it was read or a dropped
+    connection, is printed and its workbooks are marked failed in the
+    manifest and tried again on a later poll, while watching goes on.
+    load_options are the options of load_routesheet_files().
+    '''
+    if not manifest_path:
+        raise ValueError('Watching a folder needs a manifest_path to know which sheets are loaded')
+    watcher = RoutesheetWatcher(directory_path, poll_interval, settle_seconds)
+    print(f'Watching {directory_path} for new or changed routesheets, press Ctrl+C to stop\n')
+    try:
+        for routesheets_filepaths in watcher.iter_batches():
+            time_start = time.perf_counter()
+            importid = None
+            try:
+                importid = get_importid(sql_data)
+                routesheets_failed_to_insert = load_routesheet_files(sql_data, table, routesheets_filepaths, importid,
+                                                                     manifest_path=manifest_path, **load_options)
+            except Exception:
+                traceback.print_exc()
+                print(f'Loading {len(routesheets_filepaths)} workbooks failed, they will be tried again once they settle\n')
+                manifest = LoadManifest(manifest_path)
+                for filepath in routesheets_filepaths:
+                    manifest.mark_workbook_failed(filepath, importid)
+                watcher.forget(routesheets_filepaths)
+                continue
+            print(f'Loaded {len(routesheets_filepaths)} workbooks as import {importid} in '
+                  + f'{round(time.perf_counter() - time_start, 4)} seconds\n')
+            run_post_load_procedures(routesheets_failed_to_insert)
+    except KeyboardInterrupt:
+        print('Stopped watching')
+
+def load_routesheet_files(sql_data, table: str, routesheets_filepaths: list, importid: int, parse_workers: int = 1,
+                          chunk_rows=None, chunk_bytes=None, manifest_path=None, cache_directory=None,
+                          stream_chunk_size=None, pipeline_queue_size=None, insert_workers=None,
+                          connection_pool=None, run_report=None, quarantine_path=None,
+                          discrepancy_report_path=None, discrepancy_state_path=None, parse_service_codes=False,
+                          delta=False, skip_sheets=None) -> list:
+    '''
+    Reads, cleans and inserts the given workbooks under one ImportID through
+    sql_data, which must already be connected.  Takes the same options as
+    main(), see there.  connection_pool is an optional SqlConnectionPool for
+    insert_workers, otherwise one is opened from sql_data's connection string.
+    Either way the pool is closed once loading is done.
+    skip_sheets optionally maps a filepath to sheet names that should not be
+    read, on top of those the manifest skips.
+    Returns the sheets that failed to insert.
+    '''
+    #Load only the changed rows of each sheet in delta mode.
+    #Insert in parallel over pooled connections when insert_workers is given.
+    #Otherwise batch rows across sheets when a chunk size is given, or commit per sheet.
+    #Streamed sheets always go through the batcher so staged rows stay bounded.
+    #With a manifest a sheet is never split over commits, so one marked failed left nothing behind to duplicate.
+    inserter = None
+    if delta:
+        if insert_workers or chunk_rows or chunk_bytes:
+            print('Delta loads commit one sheet at a time, insert_workers, chunk_rows and chunk_bytes are ignored\n')
+            insert_workers = None
+        inserter = DeltaLoader(sql_data, table, importid, run_report=run_report)
+    elif insert_workers:
+        connection_pool = connection_pool or SqlConnectionPool(sql_data.connection_string, size=insert_workers)
+        inserter = ParallelInserter(sql_data, connection_pool, table, workers=insert_workers, run_report=run_report,
+                                    whole_sheets=bool(manifest_path))
+    elif chunk_rows or chunk_bytes or stream_chunk_size:
+        inserter = InsertBatcher(sql_data, table, chunk_rows=chunk_rows or stream_chunk_size, chunk_bytes=chunk_bytes,
+                                 run_report=run_report, whole_sheets=bool(manifest_path))
+
+    #Skip workbooks and sheets the manifest says are already loaded
+    manifest = None
+    workbook_hashes = {}
+    skip_sheets = {filepath: set(sheet_names) for filepath, sheet_names in (skip_sheets or {}).items()}
+    if manifest_path:
+        manifest = LoadManifest(manifest_path)
+        routesheets_filepaths, workbook_hashes, loaded_sheets = skip_loaded_workbooks(manifest, routesheets_filepaths)
+        for filepath, sheet_names in loaded_sheets.items():
+            skip_sheets[filepath] = skip_sheets.get(filepath, set()) | sheet_names
+
+    validator = None
+    if quarantine_path:
+        validator = RoutesheetValidator(sql_data.field_map, quarantine_path,
+                                        numeric_columns=[column for column, column_type in ROUTESHEET_SCHEMA.items()
+                                                         if column_type in ('float', 'integer')],
+                                        coordinate_bounds=ROUTESHEET_COORDINATE_BOUNDS)
+
+    discrepancy_report = None
+    if discrepancy_report_path or discrepancy_state_path:
+        discrepancy_report = ServiceDiscrepancyReport(discrepancy_state_path)
+
+    service_parser = ServiceFrequencyParser() if parse_service_codes else None
+
+    loader = RoutesheetLoader(sql_data, table, importid, inserter, manifest, run_report, validator, discrepancy_report,
+                              service_parser)
+
+    #for each workbook in the given directory, 
+    #read in worksheets as dataframes (in parallel when parse_workers > 1,
+    #or chunk by chunk when streaming) and load them over the single connection.
+    if stream_chunk_size:
+        workbooks = iter_streamed_workbooks(routesheets_filepaths, importid, stream_chunk_size, skip_sheets, run_report)
+    else:
+        workbooks = iter_parsed_workbooks(routesheets_filepaths, importid, parse_workers, skip_sheets, cache_directory,
+                                          run_report)
+
+    #overlap reading with inserting
+    if pipeline_queue_size:
+        workbooks = RoutesheetPipeline(workbooks, queue_size=pipeline_queue_size)
+
+    for filepath, parsed_sheets in workbooks:
+        loader.load_workbook(filepath, parsed_sheets, workbook_hashes.get(filepath))
+
+    routesheets_failed_to_insert = loader.finish()
+
+    if insert_workers:
+        inserter.close()
+        connection_pool.close_all()
+        insert_summary = inserter.summary()
+        print(f'Parallel insert summary: {insert_summary["rows"]} rows in {insert_summary["inserts"]} inserts')
+        for worker_summary in insert_summary['workers']:
+            print(f' worker {worker_summary["worker"]}: {worker_summary["rows"]} rows, {worker_summary["inserts"]} inserts, '
+                  + f'{worker_summary["seconds"]} seconds, partitions {worker_summary["partitions"]}')
+
+    if delta:
+        delta_summary = inserter.summary()
+        print(f'Delta load summary: {delta_summary["rows"]} rows read, {delta_summary["inserted"]} inserted, '
+              + f'{delta_summary["updated"]} updated, {delta_summary["retired"]} retired, '
+              + f'{delta_summary["unchanged"]} unchanged')
+
+    if validator and validator.quarantined_rows:
+        print(f'{sum(validator.quarantined_rows.values())} rows failed validation, see {quarantine_path}:')
+        for sheet_label, quarantined_rows in validator.quarantined_rows.items():
+            print(f' {sheet_label}: {quarantined_rows} rows')
+
+    if service_parser and service_parser.unparsed_codes:
+        print(f'{sum(service_parser.unparsed_codes.values())} rows have a Service code that could not be parsed '
+              + f'({SERVICE_COLUMNS[-1]} = 1):')
+        for (service, service_frequency), rows in service_parser.unparsed_codes.most_common():
+            print(f' Service {service!r}, ServiceFrequency {service_frequency!r}: {rows} rows')
+
+    if discrepancy_report:
+        discrepancy_report.save_state()
+        if discrepancy_report_path:
+            discrepancies = discrepancy_report.write_report(discrepancy_report_path)
+            print(f'Service discrepancy report: {discrepancies} products written to {discrepancy_report_path}')
+
+    return routesheets_failed_to_insert
             
 
-print("""
+FAREWELL = """
 
 Thank you for using Armadillo Routesheet ETL!
 
@@ -267,7 +1065,7 @@ Thank you for using Armadillo Routesheet ETL!
           /:'////' `::>/|/ 
         .',  ||||   `/( e\\          
     -==~-'`-Xm````-mr' `-_\\ 
-""")
+"""
     
             
 if __name__ == '__main__':
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:31:40 2026
+
+@author: cjmauro
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from sqldatahandler import SqlDataHandler
+from sqliteconnector import SqliteConnector
+from sqlconnectionpool import SqlConnectionPool
+from bulkloader import SqliteBulkLoader
+from runreport import RunReport
+from servicefrequency import SERVICE_COLUMNS
+from routesheetgenerator import RoutesheetGenerator, ROUTESHEET_COLUMNS, BRANCHES, SERVICE_DAYS
+from armadillo_routesheets_etl import load_routesheet_files, get_excel_filenames_from_directory
+
+
+#columns add_required_columns() puts in front of every sheet
+REQUIRED_COLUMNS = ('ServiceDay', 'ImportID', 'Branch', 'Route')
+BENCHMARK_TABLE = 'Routesheets'
+BENCHMARK_IMPORTID = 1
+
+
+def build_field_map() -> dict:
+       #the benchmark table uses the routesheet headers as its field names
+       return {field: field for field in REQUIRED_COLUMNS + ROUTESHEET_COLUMNS + SERVICE_COLUMNS}
+
+
+def create_benchmark_database(database: str, field_map: dict) -> SqlDataHandler:
+       '''Creates an empty routesheet table in a new SQLite file and returns a handler connected to it.'''
+       if os.path.exists(database):
+              os.remove(database)
+       sql_connector = SqliteConnector(database)
+       sql_data = SqlDataHandler(sql_connector, field_map)
+       sql_data.set_connection_string(database)
+       field_definitions = ', '.join(f'{field} TEXT' for field in dict.fromkeys(field_map.values()))
+       sql_data.cursor.execute(f'CREATE TABLE {BENCHMARK_TABLE} ({field_definitions})')
+       return sql_data
+
+
+def run_benchmark(filepaths: list, database: str, load_options: dict, bulk=False, trace_memory=False) -> dict:
+       '''
+       Loads the workbooks into a fresh SQLite database the same way main() does
+       and returns the end to end time and rows/sec along with the totals of
+       each stage from the run report.
+       '''
+       sql_data = create_benchmark_database(database, build_field_map())
+       if bulk:
+              sql_data.set_bulk_loader(SqliteBulkLoader())
+
+       connection_pool = None
+       if load_options.get('insert_workers'):
+              connection_pool = SqlConnectionPool(database, size=load_options['insert_workers'], connect=SqliteConnector)
+
+       run_report = RunReport(trace_memory=trace_memory)
+       run_report.start()
+       time_start = time.perf_counter()
+       routesheets_failed_to_insert = load_routesheet_files(sql_data, BENCHMARK_TABLE, filepaths, BENCHMARK_IMPORTID,
+                                                            connection_pool=connection_pool, run_report=run_report,
+                                                            **load_options)
+       total_duration = time.perf_counter() - time_start
+       run_report.stop()
+
+       rows = sql_data.cursor.execute(f'SELECT COUNT(*) FROM {BENCHMARK_TABLE}').fetchone()[0]
+       sql_data.sql_connector.close()
+       return {'seconds': round(total_duration, 4),
+               'rows': rows,
+               'rows_per_second': round(rows / total_duration, 1) if total_duration else None,
+               'failed_sheets': routesheets_failed_to_insert,
+               'stages': run_report.summarize()}
+
+
+def summarize_runs(runs: list) -> dict:
+       '''Median of each measure over the repeated runs, so one slow run doesn't skew a comparison.'''
+       stage_names = dict.fromkeys(stage_name for run in runs for stage_name in run['stages'])
+       stages = {}
+       for stage_name in stage_names:
+              stage_runs = [run['stages'].get(stage_name, {}) for run in runs]
+              stages[stage_name] = {'seconds': round(statistics.median(stage.get('seconds', 0) for stage in stage_runs), 4),
+                                    'rows_per_second': round(statistics.median(stage.get('rows_per_second') or 0 for stage in stage_runs), 1)}
+       return {'seconds': round(statistics.median(run['seconds'] for run in runs), 4),
+               'rows': runs[-1]['rows'],
+               'rows_per_second': round(statistics.median(run['rows_per_second'] or 0 for run in runs), 1),
+               'stages': stages}
+
+
+def print_benchmark(summary: dict, runs: list):
+       print(f'\nEnd to end: {summary["rows"]} rows in {summary["seconds"]} seconds, '
+             + f'{summary["rows_per_second"]} rows/sec (median of {len(runs)} runs)')
+       for stage_name, stage in summary['stages'].items():
+              print(f' {stage_name}: {stage["seconds"]} seconds' + (f', {stage["rows_per_second"]} rows/sec' if stage['rows_per_second'] else ''))
+       failed_sheets = sorted({sheet_label for run in runs for sheet_label in run['failed_sheets']})
+       if failed_sheets:
+              print(f'Sheets that failed to insert: {failed_sheets}')
+
+
+
+if __name__ == '__main__':
+       parser = argparse.ArgumentParser(description='Benchmark the routesheet ETL against a local SQLite database '
+                                                    + 'using synthetic routesheets.')
+       parser.add_argument('--directory', help='load the workbooks already in this folder instead of generating them')
+       parser.add_argument('--keep', help='generate the workbooks into this folder and keep them')
+       parser.add_argument('--branches', nargs='+', default=list(BRANCHES))
+       parser.add_argument('--days', type=int, default=5, help='number of service days, starting Monday')
+       parser.add_argument('--routes', type=int, default=4, help='routes (sheets) per workbook')
+       parser.add_argument('--rows', type=int, default=200, help='approximate rows per route sheet')
+       parser.add_argument('--seed', type=int, default=0)
+       parser.add_argument('--repeat', type=int, default=3, help='number of timed runs')
+       parser.add_argument('--bulk', action='store_true', help='load through SqliteBulkLoader')
+       parser.add_argument('--trace-memory', action='store_true')
+       parser.add_argument('--parse-workers', type=int, default=1)
+       parser.add_argument('--chunk-rows', type=int)
+       parser.add_argument('--chunk-bytes', type=int)
+       parser.add_argument('--cache-directory', help='note that runs after the first read from a warm cache')
+       parser.add_argument('--stream-chunk-size', type=int)
+       parser.add_argument('--pipeline-queue-size', type=int)
+       parser.add_argument('--insert-workers', type=int)
+       parser.add_argument('--parse-service-codes', action='store_true')
+       parser.add_argument('--output', help='write the results of every run to this JSON file')
+       args = parser.parse_args()
+
+       work_directory = tempfile.mkdtemp(prefix='routesheet_benchmark_')
+       try:
+              directory = args.directory
+              if not directory:
+                     directory = args.keep or os.path.join(work_directory, 'workbooks')
+                     generator = RoutesheetGenerator(args.branches, SERVICE_DAYS[:args.days], args.routes, args.rows, seed=args.seed)
+                     time_start = time.perf_counter()
+                     generator.write_workbooks(directory)
+                     print(f'Generated workbooks in {directory} in {round(time.perf_counter() - time_start, 2)} seconds')
+              filepaths = [os.path.join(directory, file) for file in get_excel_filenames_from_directory(directory)]
+              if not filepaths:
+                     print(f'No workbooks found in {directory}')
+                     sys.exit(1)
+
+              load_options = {'parse_workers': args.parse_workers,
+                              'chunk_rows': args.chunk_rows,
+                              'chunk_bytes': args.chunk_bytes,
+                              'cache_directory': args.cache_directory,
+                              'stream_chunk_size': args.stream_chunk_size,
+                              'pipeline_queue_size': args.pipeline_queue_size,
+                              'insert_workers': args.insert_workers,
+                              'parse_service_codes': args.parse_service_codes}
+
+              runs = []
+              for run in range(args.repeat):
+                     result = run_benchmark(filepaths, os.path.join(work_directory, 'benchmark.db'), load_options,
+                                            args.bulk, args.trace_memory)
+                     print(f'Run {run + 1}: {result["rows"]} rows in {result["seconds"]} seconds, {result["rows_per_second"]} rows/sec')
+                     runs.append(result)
+
+              summary = summarize_runs(runs)
+              print_benchmark(summary, runs)
+
+              if args.output:
+                     with open(args.output, 'w', encoding='utf-8') as output_file:
+                            json.dump({'workbooks': len(filepaths),
+                                       'options': dict(load_options, bulk=args.bulk),
+                                       'summary': summary,
+                                       'runs': runs}, output_file, indent=1)
+                     print(f'Results written to {args.output}')
+       finally:
+              shutil.rmtree(work_directory, ignore_errors=True)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:24:51 2026
+
+@author: cjmauro
+"""
+
+import csv
+import shutil
+import subprocess
+
+
+#every value is written after this prefix, so an empty field can only be a None and is loaded as NULL,
+#while an empty string is written as the prefix alone and loads as ''
+VALUE_PREFIX = '.'
+
+
+def write_staging_file(rows, staging_path: str, num_columns: int):
+       '''
+       Writes staged parameter rows to a csv file.  The header row holds
+       positional column names (c0, c1, ...) so the file can be loaded into a
+       staging table no matter what the sheet headers were.  Double quotes are
+       scrubbed from the data beforehand, so standard csv quoting is unambiguous.
+       Values carry VALUE_PREFIX, which the loaders strip again.
+       '''
+       with open(staging_path, 'w', newline='', encoding='utf-8') as staging_file:
+              writer = csv.writer(staging_file, lineterminator='\n')
+              writer.writerow(staging_column_names(num_columns))
+              writer.writerows([None if value is None else f'{VALUE_PREFIX}{value}' for value in row] for row in rows)
+
+
+def staging_column_names(num_columns: int) -> list:
+       return [f'c{position}' for position in range(num_columns)]
+
+
+
+class SqlServerBulkLoader():
+       '''
+       Loads a staging file with BULK INSERT into a session temp table, then
+       moves it into the target table with one set-based INSERT ... SELECT.
+       BULK INSERT reads the file from the server side, so the staging
+       directory must be a path the SQL Server service account can read.
+       '''
+
+       def __init__(self, staging_table='#RoutesheetStaging'):
+              self.staging_table = staging_table
+
+
+       def load(self, sqldatahandler, staging_path: str, table_name: str, field_names: list):
+              cursor = sqldatahandler.cursor
+              staging_columns = staging_column_names(len(field_names))
+              #MAX so no value is cut short, the INSERT ... SELECT converts them to the table's types
+              column_definitions = ', '.join(f'{column} NVARCHAR(MAX)' for column in staging_columns)
+
+              sqldatahandler.sql_connector.autocommit = False
+              try:
+                     cursor.execute(f"IF OBJECT_ID('tempdb..{self.staging_table}') IS NOT NULL DROP TABLE {self.staging_table}")
+                     cursor.execute(f'CREATE TABLE {self.staging_table} ({column_definitions})')
+                     #None is written as an empty field, which KEEPNULLS loads as NULL, STUFF() leaves NULL as it is
+                     cursor.execute(f"BULK INSERT {self.staging_table} FROM '{staging_path}' "
+                                    + "WITH (FORMAT = 'CSV', FIRSTROW = 2, FIELDTERMINATOR = ',', ROWTERMINATOR = '0x0a', CODEPAGE = '65001', KEEPNULLS, TABLOCK)")
+                     staged_values = ', '.join(f"STUFF({column}, 1, {len(VALUE_PREFIX)}, '')" for column in staging_columns)
+                     cursor.execute(f'INSERT INTO {table_name} ({", ".join(field_names)}) '
+                                    + f'SELECT {staged_values} FROM {self.staging_table}')
+                     cursor.execute(f'DROP TABLE {self.staging_table}')
+              except:
+                     cursor.rollback()
+                     raise
+              else:
+                     cursor.commit()
+              finally:
+                     sqldatahandler.sql_connector.autocommit = True
+
+
+
+class SqliteBulkLoader():
+       '''
+       Stand-in for SqlServerBulkLoader against a SqliteConnector.  Uses the
+       sqlite3 command line shell's .import when it is installed, which reads
+       the file natively like BULK INSERT does, otherwise reads the csv in
+       Python and inserts it in a single transaction.
+       '''
+
+       def __init__(self, staging_table='RoutesheetStaging', sqlite_executable=None):
+              self.staging_table = staging_table
+              self.sqlite_executable = sqlite_executable or shutil.which('sqlite3')
+
+
+       def load(self, sqldatahandler, staging_path: str, table_name: str, field_names: list):
+              staging_columns = staging_column_names(len(field_names))
+              #.import reads empty fields as '', which the staging file only writes for None
+              staged_values = ', '.join(f"substr(NULLIF({column}, ''), {len(VALUE_PREFIX) + 1})" for column in staging_columns)
+              move_statement = (f'INSERT INTO {table_name} ({", ".join(field_names)}) '
+                                + f'SELECT {staged_values} FROM {self.staging_table}')
+              database = sqldatahandler.sql_connector.database
+
+              #the shell takes a single quoted argument literally, a path holding a quote is read in Python instead
+              if self.sqlite_executable and database != ':memory:' and "'" not in str(staging_path):
+                     #the shell opens its own connection, so anything pending must be committed first
+                     sqldatahandler.sql_connector.commit()
+                     import_script = (f'DROP TABLE IF EXISTS {self.staging_table};\n'
+                                      + 'BEGIN;\n'
+                                      + f".import --csv '{staging_path}' {self.staging_table}\n"
+                                      + f'{move_statement};\n'
+                                      + f'DROP TABLE {self.staging_table};\n'
+                                      + 'COMMIT;\n')
+                     result = subprocess.run([self.sqlite_executable, '-bail', database], input=import_script,
+                                             text=True, capture_output=True)
+                     if result.returncode:
+                            raise RuntimeError(f'sqlite3 .import into {table_name} failed: {result.stderr.strip()}')
+              else:
+                     self.load_without_shell(sqldatahandler, staging_path, table_name, field_names)
+
+
+       def load_without_shell(self, sqldatahandler, staging_path: str, table_name: str, field_names: list):
+              placeholders = ', '.join('?' for field in field_names)
+              insert_statement = f'INSERT INTO {table_name} ({", ".join(field_names)}) VALUES ({placeholders})'
+              cursor = sqldatahandler.cursor
+
+              sqldatahandler.sql_connector.autocommit = False
+              try:
+                     with open(staging_path, newline='', encoding='utf-8') as staging_file:
+                            reader = csv.reader(staging_file)
+                            next(reader) #skip positional header
+                            cursor.executemany(insert_statement, ([value[len(VALUE_PREFIX):] if value != '' else None for value in row]
+                                                                  for row in reader))
+              except:
+                     cursor.rollback()
+                     raise
+              else:
+                     cursor.commit()
+              finally:
+                     sqldatahandler.sql_connector.autocommit = True
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:04:26 2026
+
+@author: cjmauro
+"""
+
+import os
+import json
+import argparse
+import traceback
+import numpy as np
+import pandas as pd
+from runreport import NO_REPORT
+
+
+#columns the table needs for delta loads, next to the mapped routesheet fields
+#RowKey and RowHash are BIGINT, RetiredImportID takes the same type as ImportID
+ROW_KEY = 'RowKey'
+ROW_HASH = 'RowHash'
+RETIRED_IMPORTID = 'RetiredImportID'
+DELTA_STAGING_TABLE = '#RoutesheetDelta'
+
+
+class DeltaLoader():
+       '''
+       Loads only what changed in a re-imported sheet instead of inserting every
+       row again.  Each row gets two 64 bit hashes, computed for the whole sheet
+       at once with pd.util.hash_pandas_object() on the values as they would be
+       inserted:
+
+        *RowKey, from key_columns plus the row's occurrence among rows with the
+         same key, so a product serviced twice a day keeps two rows
+        *RowHash, from every mapped column except ImportID
+
+       A sheet's scope is its scope_columns (Branch, ServiceDay and Route).  The
+       hashes stored for the scope's live rows are read back and compared
+       locally, and only new, changed and missing rows are sent to the
+       #RoutesheetDelta staging table.  One MERGE then inserts the new rows,
+       updates the changed ones (their ImportID becomes this import's) and
+       retires the missing ones by setting RetiredImportID, all in the sheet's
+       transaction.  Unchanged rows are not touched and keep their ImportID.
+
+       The table needs RowKey, RowHash and RetiredImportID columns, ideally
+       indexed on the scope columns plus RowKey.  Rows loaded before delta mode
+       have no RowKey and are left alone, so retire them once before the first
+       delta load.  Queries on the table should filter RetiredImportID IS NULL.
+
+       Takes the place of an InsertBatcher in RoutesheetLoader.  Parts of a
+       streamed sheet are held until the sheet is complete, since a row can
+       only be retired once the whole sheet has been seen.
+       '''
+
+       def __init__(self, sqldatahandler, table_name: str, importid: int, key_columns=('JobKey', 'ProductType'),
+                    scope_columns=('Branch', 'ServiceDay', 'Route'), run_report=None):
+
+              self.sqldatahandler = sqldatahandler
+              self.table_name = table_name
+              self.importid = importid
+              self.key_columns = tuple(key_columns)
+              self.scope_columns = tuple(scope_columns)
+
+              #key is the sheet label, value is the list of dataframes added so far
+              self.pending_sheets = {}
+
+              self.committed_sheets = []
+              self.failed_sheets = set()
+              self.new_failures = []
+
+              #one dict per sheet: sheet, rows, inserted, updated, retired, unchanged
+              self.delta_log = []
+
+              self.run_report = run_report or NO_REPORT
+
+
+       def add_sheet(self, dataframe, sheet_label: str, sheet_complete=True) -> list:
+              '''Holds a sheet, or part of one, until it is complete.  Returns sheets found to have failed since the last call.'''
+              if sheet_label not in self.failed_sheets:
+                     self.pending_sheets.setdefault(sheet_label, []).append(dataframe)
+              if sheet_complete:
+                     self.complete_sheet(sheet_label)
+              return self.pop_new_failures()
+
+
+       def complete_sheet(self, sheet_label: str):
+              dataframes = self.pending_sheets.pop(sheet_label, None)
+              if not dataframes:
+                     return
+              dataframe = pd.concat(dataframes) if len(dataframes) > 1 else dataframes[0]
+              dataframe.attrs = dataframes[0].attrs
+              try:
+                     self.load_sheet(dataframe, sheet_label)
+              except:
+                     traceback.print_exc()
+                     print(f'Delta load of {sheet_label} into {self.table_name} failed and was rolled back.\n\n')
+                     self.fail_sheet(sheet_label)
+              else:
+                     self.committed_sheets.append(sheet_label)
+
+
+       def fail_sheet(self, sheet_label: str):
+              self.pending_sheets.pop(sheet_label, None)
+              if sheet_label not in self.failed_sheets:
+                     self.failed_sheets.add(sheet_label)
+                     self.new_failures.append(sheet_label)
+
+
+       def flush(self) -> list:
+              '''Every sheet is loaded when it completes, so this only hands back the failures.'''
+              return self.pop_new_failures()
+
+
+       def pop_new_failures(self) -> list:
+              new_failures, self.new_failures = self.new_failures, []
+              return new_failures
+
+
+       def pop_committed_sheets(self) -> list:
+              committed_sheets, self.committed_sheets = self.committed_sheets, []
+              return committed_sheets
+
+
+       def load_sheet(self, dataframe, sheet_label: str):
+              with self.run_report.stage('staging', sheet=sheet_label, rows=len(dataframe.index)):
+                     field_names = self.sqldatahandler.get_insert_plan(dataframe, self.table_name)['field_names']
+                     rows = self.sqldatahandler.build_values_to_insert_frame(dataframe, self.table_name)
+                     scope = self.get_scope(dataframe, field_names, rows)
+                     row_keys, row_hashes = self.hash_rows(dataframe, field_names, rows)
+
+              with self.run_report.stage('delta_diff', sheet=sheet_label, rows=len(rows)):
+                     stored_hashes = self.read_stored_hashes(scope)
+                     changes = self.diff_rows(row_keys, row_hashes, stored_hashes)
+
+              log_entry = {'sheet': sheet_label,
+                           'rows': len(rows),
+                           'inserted': int(changes['inserted'].sum()),
+                           'updated': int(changes['updated'].sum()),
+                           'retired': len(changes['retired']),
+                           'unchanged': int((~changes['inserted'] & ~changes['updated']).sum())}
+              self.delta_log.append(log_entry)
+              if not (log_entry['inserted'] or log_entry['updated'] or log_entry['retired']):
+                     print(f'{sheet_label} is unchanged, nothing to load\n')
+                     return
+
+              changed = changes['inserted'] | changes['updated']
+              delta_rows = [row + (row_key, row_hash, 'upsert') for row, row_key, row_hash, is_changed
+                            in zip(rows, row_keys.tolist(), row_hashes.tolist(), changed) if is_changed]
+              delta_rows += [(None,) * len(field_names) + (row_key, None, 'retire') for row_key in changes['retired']]
+
+              with self.run_report.stage('insert', sheet=sheet_label, rows=len(delta_rows)):
+                     self.merge_delta(field_names, scope, delta_rows)
+              print(f'{sheet_label}: {log_entry["inserted"]} rows inserted, {log_entry["updated"]} updated, '
+                    + f'{log_entry["retired"]} retired and {log_entry["unchanged"]} unchanged in {self.table_name}\n')
+
+
+       def get_scope(self, dataframe, field_names: list, rows: list) -> dict:
+              '''Returns {table field: bound value} for the scope columns, which must be sheet constants.'''
+              sheet_constants = self.sqldatahandler.get_sheet_constants(dataframe)
+              scope = {}
+              for column in self.scope_columns:
+                     if column not in sheet_constants:
+                            raise ValueError(f'Delta loads are scoped by {column}, which must be a sheet constant')
+                     #constants lead every staged row
+                     position = list(sheet_constants).index(column)
+                     scope[field_names[position]] = rows[0][position] if rows else sheet_constants[column]
+              return scope
+
+
+       def hash_rows(self, dataframe, field_names: list, rows: list) -> tuple:
+              '''Returns the RowKey and RowHash of every row as int64 arrays.'''
+              external_fields = [field.strip() for field in self.sqldatahandler.get_external_fields(dataframe)]
+
+              #hashed as text, since inferring dtypes per sheet would turn an int column with one NULL into
+              #floats and change the hash of every other row in it
+              values = pd.DataFrame([[self.normalize_value(value) for value in row] for row in rows],
+                                    columns=range(len(field_names)), dtype=object)
+              if values.empty:
+                     return np.array([], dtype='int64'), np.array([], dtype='int64')
+
+              #ImportID changes on every run, so it can't be part of the content
+              content_positions = [position for position, field in enumerate(external_fields) if field != 'ImportID']
+              row_hashes = pd.util.hash_pandas_object(values[content_positions], index=False)
+
+              key_positions = [external_fields.index(column) for column in self.key_columns if column in external_fields]
+              if len(key_positions) != len(self.key_columns):
+                     raise ValueError(f'Delta loads need the key columns {list(self.key_columns)} on every sheet')
+              keys = values[key_positions].astype(str)
+              keys['occurrence'] = keys.groupby(key_positions, sort=False).cumcount()
+              row_keys = pd.util.hash_pandas_object(keys, index=False)
+
+              #stored as BIGINT, so the unsigned hashes are reinterpreted as signed
+              return row_keys.to_numpy().view('int64'), row_hashes.to_numpy().view('int64')
+
+
+       def normalize_value(self, value):
+              #None and NaN are both NULL, everything else is hashed as the text it is bound as
+              if value is None or (isinstance(value, float) and np.isnan(value)):
+                     return None
+              return str(value)
+
+
+       def read_stored_hashes(self, scope: dict) -> pd.Series:
+              '''Returns the RowHash of the scope's live rows, indexed by RowKey.'''
+              where = ' AND '.join(f'{field} = ?' for field in scope)
+              select_statement = self.sqldatahandler.create_select_statement(
+                     f'{ROW_KEY}, {ROW_HASH}', self.table_name,
+                     f'{where} AND {ROW_KEY} IS NOT NULL AND {RETIRED_IMPORTID} IS NULL')
+              stored = [tuple(row) for row in self.sqldatahandler.iter_result_set(select_statement, *scope.values())]
+              return pd.Series([row[1] for row in stored], index=[row[0] for row in stored], dtype='int64')
+
+
+       def diff_rows(self, row_keys, row_hashes, stored_hashes) -> dict:
+              '''Returns boolean arrays of the new and changed rows, and the RowKeys that are no longer on the sheet.'''
+              stored_hashes = stored_hashes[~stored_hashes.index.duplicated()]
+              known = stored_hashes.index.get_indexer(row_keys)
+              inserted = known == -1
+              updated = np.zeros(len(row_keys), dtype=bool)
+              updated[~inserted] = stored_hashes.to_numpy()[known[~inserted]] != row_hashes[~inserted]
+              retired = stored_hashes.index.difference(pd.Index(row_keys)).tolist()
+              return {'inserted': inserted, 'updated': updated, 'retired': retired}
+
+
+       def merge_delta(self, field_names: list, scope: dict, delta_rows: list):
+              '''Stages the changed rows in #RoutesheetDelta and applies them with one MERGE, in one transaction.'''
+              cursor = self.sqldatahandler.cursor
+              staging_fields = field_names + [ROW_KEY, ROW_HASH]
+              try:
+                     self.sqldatahandler.sql_connector.autocommit = False
+                     self.create_staging_table(cursor, staging_fields)
+                     cursor.fast_executemany = True
+                     cursor.executemany(f'INSERT INTO {DELTA_STAGING_TABLE} ({",".join(staging_fields)},DeltaAction) '
+                                        + f'VALUES ({",".join("?" for field in staging_fields)},?)', delta_rows)
+                     cursor.execute(self.create_merge_statement(field_names, scope), *scope.values(), self.importid)
+                     cursor.execute(f'DROP TABLE {DELTA_STAGING_TABLE}')
+              except:
+                     cursor.rollback()
+                     raise
+              else:
+                     cursor.commit()
+              finally:
+                     self.sqldatahandler.sql_connector.autocommit = True
+                     cursor.fast_executemany = False
+
+
+       def create_staging_table(self, cursor, staging_fields: list):
+              cursor.execute(f"IF OBJECT_ID('tempdb..{DELTA_STAGING_TABLE}') IS NOT NULL DROP TABLE {DELTA_STAGING_TABLE}")
+              cursor.execute(f'SELECT TOP 0 {",".join(staging_fields)} INTO {DELTA_STAGING_TABLE} FROM {self.table_name}')
+              cursor.execute(f'ALTER TABLE {DELTA_STAGING_TABLE} ADD DeltaAction VARCHAR(6)')
+
+
+       def create_merge_statement(self, field_names: list, scope: dict) -> str:
+              #the target is narrowed to the sheet's live rows, so only they can be matched or retired
+              scope_filter = ' AND '.join(f'{field} = ?' for field in scope)
+
+              #SQL Server allows a second WHEN MATCHED only when one of the two deletes, so retired and
+              #changed rows share one UPDATE and a retired row keeps its values
+              updates = ', '.join(f"{field} = CASE source.DeltaAction WHEN 'retire' THEN target.{field} ELSE source.{field} END"
+                                  for field in field_names + [ROW_HASH])
+              inserted_fields = ','.join(field_names + [ROW_KEY, ROW_HASH])
+              inserted_values = ','.join(f'source.{field}' for field in field_names + [ROW_KEY, ROW_HASH])
+              return (f'WITH LiveRows AS (SELECT * FROM {self.table_name} WHERE {scope_filter} AND {RETIRED_IMPORTID} IS NULL) '
+                      + f'MERGE LiveRows AS target USING {DELTA_STAGING_TABLE} AS source ON target.{ROW_KEY} = source.{ROW_KEY} '
+                      + f"WHEN MATCHED AND (source.DeltaAction = 'retire' OR target.{ROW_HASH} <> source.{ROW_HASH}) "
+                      + f"THEN UPDATE SET {RETIRED_IMPORTID} = CASE source.DeltaAction WHEN 'retire' THEN ? ELSE target.{RETIRED_IMPORTID} END, "
+                      + f'{updates} '
+                      + f"WHEN NOT MATCHED BY TARGET AND source.DeltaAction = 'upsert' THEN INSERT ({inserted_fields}) VALUES ({inserted_values});")
+
+
+       def check_merge_statement(self, field_names: list):
+              '''
+              Runs the MERGE for field_names against the server once, on an empty
+              staging table and a scope that matches no rows, and rolls it back.
+              Raises the server's error if the statement does not compile.
+              '''
+              cursor = self.sqldatahandler.cursor
+
+              #the MERGE of load_sheet() is scoped on the table fields the scope columns map to, see get_scope()
+              field_map = self.sqldatahandler.field_map
+              unmapped_columns = [column for column in self.scope_columns if column not in field_map]
+              if unmapped_columns:
+                     raise KeyError(f'No field map entry for the scope columns {unmapped_columns}')
+              scope = dict.fromkeys(field_map[column] for column in self.scope_columns)
+              try:
+                     self.sqldatahandler.sql_connector.autocommit = False
+                     self.create_staging_table(cursor, field_names + [ROW_KEY, ROW_HASH])
+                     cursor.execute(self.create_merge_statement(field_names, scope), *scope.values(), self.importid)
+              finally:
+                     cursor.rollback()
+                     self.sqldatahandler.sql_connector.autocommit = True
+
+
+       def summary(self) -> dict:
+              '''Totals of the delta log for the run.'''
+              return {measure: sum(log_entry[measure] for log_entry in self.delta_log)
+                      for measure in ('rows', 'inserted', 'updated', 'retired', 'unchanged')}
+
+
+
+if __name__ == '__main__':
+       from routesheetcli import CONNECTION_STRING_VARIABLE
+
+       parser = argparse.ArgumentParser(description='Check that the delta MERGE compiles against a table, without changing it.')
+       parser.add_argument('table', help='table delta loads go into, with RowKey, RowHash and RetiredImportID columns')
+       parser.add_argument('field_map', help='JSON file mapping Excel headers to table fields')
+       parser.add_argument('--connection-string', default=os.environ.get(CONNECTION_STRING_VARIABLE),
+                           help=f'ODBC connection string, defaults to ${CONNECTION_STRING_VARIABLE}')
+       args = parser.parse_args()
+
+       if not args.connection_string:
+              parser.error('a connection string is required')
+
+       import pyodbc as db
+       from sqldatahandler import SqlDataHandler
+
+       with open(args.field_map, encoding='utf-8') as field_map_file:
+              field_map = json.load(field_map_file)
+       sql_data = SqlDataHandler(db.connect(args.connection_string), field_map)
+       try:
+              DeltaLoader(sql_data, args.table, importid=0).check_merge_statement(list(dict.fromkeys(field_map.values())))
+       finally:
+              sql_data.sql_connector.close()
+       print(f'The delta MERGE compiles against {args.table}')
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:02:47 2026
+
+@author: cjmauro
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from exceldatahandler import SHEET_CONSTANTS
+
+
+#RouteServices is grouped on these, the Ord window is partitioned on all but Branch and ServiceDay
+GROUP_COLUMNS = ['JobKey', 'ProductType', 'Branch', 'Service', 'ServiceDay', 'Latitude', 'Longitude']
+PARTITION_COLUMNS = ['JobKey', 'ProductType', 'Service', 'Latitude', 'Longitude']
+REPORT_COLUMNS = ['Branch', 'JobKey', 'ServiceDays', 'ProductType', 'Quantity', 'NumberOfServices', 'RequiredNumberOfServices']
+SERVICE_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+class ServiceDiscrepancyReport():
+       '''
+       Builds the same result as ServiceDiscrepancyReport.SQL while sheets are
+       loaded instead of rescanning the Routesheets table.  Each sheet is
+       reduced to one row per RouteServices group (JobKey, ProductType, Branch,
+       Service, ServiceDay, Latitude, Longitude) holding its COUNT(ProductType)
+       and the MAX of the expected occurrences, and only those small aggregates
+       are kept.  The Quantity, Ord and MaxOrd rules are then applied to the
+       aggregates with vectorized group-bys when the report is built.
+
+       Rows are held as pending until their sheet commits, and a sheet that is
+       loaded again replaces what it added before.  With a state_path the
+       aggregates are saved between runs, so a rerun that only loads a changed
+       branch or day still reports on everything.
+       '''
+
+       def __init__(self, state_path=None):
+
+              self.state_path = state_path
+
+              #key is the sheet label, value is a dataframe of its group aggregates
+              self.sheet_aggregates = {}
+              self.pending_aggregates = {}
+
+              if state_path and os.path.exists(state_path):
+                     self.load_state()
+
+
+       def add_rows(self, dataframe, sheet_label: str):
+              '''Aggregates a sheet, or one chunk of it, and holds it until commit_sheet() is called.'''
+              aggregates = self.aggregate_rows(dataframe)
+              if aggregates is None:
+                     return
+              if sheet_label in self.pending_aggregates:
+                     aggregates = self.merge_aggregates([self.pending_aggregates[sheet_label], aggregates])
+              self.pending_aggregates[sheet_label] = aggregates
+
+
+       def commit_sheet(self, sheet_label: str):
+              #the sheet is in the table now, so what it adds replaces what it added last time
+              self.sheet_aggregates[sheet_label] = self.pending_aggregates.pop(sheet_label, self.empty_aggregates())
+
+
+       def discard_sheet(self, sheet_label: str):
+              self.pending_aggregates.pop(sheet_label, None)
+
+
+       def aggregate_rows(self, dataframe):
+              rows = self.expand_rows(dataframe)
+              if rows is None or rows.empty:
+                     return None
+
+              #WHERE Jobkey LIKE '[0-9][^/]%' AND [Route] NOT LIKE '%Inactive%'
+              jobkeys = rows['JobKey'].astype(str)
+              keep = (rows['JobKey'].notna() & jobkeys.str.match(r'[0-9][^/]')
+                      & ~rows['Route'].astype(str).str.contains('inactive', case=False, regex=False))
+              rows = rows[keep.to_numpy()]
+              if rows.empty:
+                     return None
+
+              rows = rows.assign(product_count=rows['ProductType'].notna().astype('int64'),
+                                 max_ord=self.expected_occurrences(rows['Service'], rows['ServiceFrequency']))
+              rows = rows.astype({column: object for column in GROUP_COLUMNS})
+              return (rows.groupby(GROUP_COLUMNS, dropna=False, sort=False, observed=True)
+                          .agg(product_count=('product_count', 'sum'), max_ord=('max_ord', 'max'))
+                          .reset_index())
+
+
+       def expand_rows(self, dataframe):
+              #only the columns the report uses, with the sheet constants as real columns
+              columns = {str(column).strip(): position for position, column in reversed(list(enumerate(dataframe.columns)))}
+              sheet_constants = dataframe.attrs.get(SHEET_CONSTANTS, {})
+              rows = {}
+              for name in GROUP_COLUMNS + ['ServiceFrequency', 'Route']:
+                     if name in sheet_constants:
+                            rows[name] = np.full(len(dataframe.index), sheet_constants[name], dtype=object)
+                     elif name in columns:
+                            rows[name] = dataframe.iloc[:, columns[name]].to_numpy(dtype=object)
+                     else:
+                            return None
+              rows = pd.DataFrame(rows)
+              for name in ('Latitude', 'Longitude'):
+                     #the table stores coordinates as numbers, so 29.1 and '29.10' are the same place
+                     numeric = pd.to_numeric(rows[name], errors='coerce')
+                     rows[name] = numeric.astype(object).where(numeric.notna(), rows[name])
+              return rows
+
+
+       def expected_occurrences(self, services, service_frequencies):
+              '''The MaxOrd CASE, evaluated on every row at once.  Frequencies that don't start with a digit give NaN.'''
+              service = services.astype(str).where(services.notna(), None)
+              text = service.fillna('')
+              upper = text.str.upper()
+              frequency_digit = pd.to_numeric(service_frequencies.astype(str).str[:1].where(service_frequencies.notna()),
+                                              errors='coerce')
+              twice_daily = self.like_twice_daily(text)
+              once_only = (upper.str.contains('EOW', regex=False) | upper.str.contains(r'AS.*NEEDED', regex=True)
+                           | upper.str.contains(r'ON.*CALL', regex=True) | (upper.str.rstrip() == '')
+                           | (upper.str.rstrip() == 'NONE') | (upper.str.rstrip() == '%OAM%')
+                           | (upper.str.rstrip() == '1M') | (upper.str.rstrip() == 'MONTHLY')) & service.notna()
+              return np.select([twice_daily.to_numpy(), once_only.to_numpy()],
+                               [(frequency_digit * 2).to_numpy(dtype='float64'), np.ones(len(services.index))],
+                               default=frequency_digit.to_numpy(dtype='float64'))
+
+
+       def like_twice_daily(self, text):
+              #[Service] LIKE '_[xX]2%'
+              return text.str.match(r'.[xX]2', case=True)
+
+
+       def like_times_weekly(self, text):
+              #[Service] LIKE '_[xX]%'
+              return text.str.match(r'.[xX]', case=True)
+
+
+       def merge_aggregates(self, aggregates: list):
+              aggregates = [aggregate for aggregate in aggregates if not aggregate.empty]
+              if not aggregates:
+                     return self.empty_aggregates()
+              merged = pd.concat(aggregates, ignore_index=True).astype({column: object for column in GROUP_COLUMNS})
+              return (merged.groupby(GROUP_COLUMNS, dropna=False, sort=False)
+                            .agg(product_count=('product_count', 'sum'), max_ord=('max_ord', 'max'))
+                            .reset_index())
+
+
+       def empty_aggregates(self):
+              return pd.DataFrame(columns=GROUP_COLUMNS + ['product_count', 'max_ord'])
+
+
+       def build_report(self, branches=None, service_days=None):
+              '''
+              Returns the discrepancy report as a dataframe with the columns of the
+              SQL report.  branches and service_days narrow it to products in those
+              branches or serviced on those days, for checking one reloaded slice.
+              '''
+              groups = self.merge_aggregates(list(self.sheet_aggregates.values()))
+              if groups.empty:
+                     return pd.DataFrame(columns=REPORT_COLUMNS)
+
+              groups['Quantity'] = self.calculate_quantity(groups['Service'], groups['product_count'])
+
+              #ROW_NUMBER() OVER (PARTITION BY Jobkey, ProductType, [Service], Latitude, Longitude)
+              #the SQL orders only by the partition, Branch and ServiceDay make it repeatable here
+              groups['branch_order'] = groups['Branch'].astype(str)
+              groups['day_order'] = groups['ServiceDay'].map(lambda day: SERVICE_DAYS.index(day) if day in SERVICE_DAYS else len(SERVICE_DAYS))
+              groups = groups.sort_values(['branch_order', 'day_order'], kind='stable')
+              groups['Ord'] = groups.groupby(PARTITION_COLUMNS, dropna=False, sort=False).cumcount() + 1
+              groups = groups.rename(columns={'max_ord': 'MaxOrd'})
+
+              report = (groups.groupby(['Branch', 'Quantity', 'ProductType', 'JobKey', 'MaxOrd'], dropna=False, sort=False)
+                              .agg(ServiceDays=('ServiceDay', lambda days: ', '.join(str(day) for day in days)),
+                                   NumberOfServices=('Ord', 'max'))
+                              .reset_index()
+                              .rename(columns={'MaxOrd': 'RequiredNumberOfServices'}))
+
+              #HAVING MAX(Ord) != MaxOrd, where a NULL MaxOrd never matches
+              report = report[report['RequiredNumberOfServices'].notna()
+                              & (report['NumberOfServices'] != report['RequiredNumberOfServices'])]
+
+              if branches:
+                     report = report[report['Branch'].isin(list(branches))]
+              if service_days:
+                     report = report[report['ServiceDays'].map(lambda days: any(day in days.split(', ') for day in service_days))]
+              report = report.astype({'RequiredNumberOfServices': 'int64'})
+              return report[REPORT_COLUMNS].sort_values(['Branch', 'JobKey'], key=lambda column: column.astype(str)).reset_index(drop=True)
+
+
+       def calculate_quantity(self, services, product_counts):
+              '''
+              The Quantity CASE: products serviced several times a week appear on
+              several sheets.  Where SQL Server would fail on a Service that doesn't
+              start with a digit (or starts with 0), the count is used as it is.
+              '''
+              text = services.astype(str).where(services.notna(), '')
+              digit = pd.to_numeric(text.str.strip().str[:1], errors='coerce')
+              counts = product_counts.astype('int64')
+              twice_daily = self.like_twice_daily(text) & (digit > 0)
+              times_weekly = self.like_times_weekly(text) & ~self.like_twice_daily(text) & (digit > 0)
+              with np.errstate(divide='ignore', invalid='ignore'):
+                     quantity = np.select([twice_daily.to_numpy(), times_weekly.to_numpy()],
+                                          [counts.to_numpy() // (digit * 2).fillna(1).to_numpy(dtype='int64'),
+                                           counts.to_numpy() // digit.fillna(1).to_numpy(dtype='int64')],
+                                          default=counts.to_numpy())
+              return pd.Series(quantity, index=services.index, dtype='int64')
+
+
+       def write_report(self, report_path: str, branches=None, service_days=None) -> int:
+              '''Writes the report to a csv.  Returns the number of discrepancies.'''
+              report = self.build_report(branches, service_days)
+              report.to_csv(report_path, index=False)
+              return len(report.index)
+
+
+       def save_state(self):
+              if not self.state_path:
+                     return
+              state = {sheet_label: json.loads(aggregates.to_json(orient='records'))
+                       for sheet_label, aggregates in self.sheet_aggregates.items()}
+              temp_path = f'{self.state_path}.tmp'
+              with open(temp_path, 'w', encoding='utf-8') as state_file:
+                     json.dump(state, state_file)
+              os.replace(temp_path, self.state_path)
+
+
+       def load_state(self):
+              with open(self.state_path, encoding='utf-8') as state_file:
+                     state = json.load(state_file)
+              self.sheet_aggregates = {sheet_label: pd.DataFrame(records, columns=GROUP_COLUMNS + ['product_count', 'max_ord'])
+                                       for sheet_label, records in state.items()}
+
+
+
+if __name__ == '__main__':
+       parser = argparse.ArgumentParser(description='Build the service discrepancy report from the state saved by a load.')
+       parser.add_argument('state_path', help='aggregate state saved by the ETL (discrepancy_state_path)')
+       parser.add_argument('report_path', help='csv file to write the report to')
+       parser.add_argument('--branch', nargs='*', help='only report on these branches')
+       parser.add_argument('--day', nargs='*', help='only report on products serviced on these days')
+       args = parser.parse_args()
+
+       if not os.path.exists(args.state_path):
+              print(f'No saved state at {args.state_path}')
+              sys.exit(1)
+       discrepancy_report = ServiceDiscrepancyReport(args.state_path)
+       discrepancies = discrepancy_report.write_report(args.report_path, args.branch, args.day)
+       print(f'{discrepancies} discrepancies written to {args.report_path}')
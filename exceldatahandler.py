@@ -7,6 +7,14 @@ Created on Fri Sep  8 10:13:52 2023
 
 import pandas as pd
 
+#cell values pandas reads as missing by default, plus Excel error values
+MISSING_CELL_VALUES = frozenset(('', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                                 '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+                                 '#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!'))
+
+#key of dataframe.attrs holding the values that are the same on every row of a sheet
+SHEET_CONSTANTS = 'sheet_constants'
+
 class ExcelDataHandler():
        
        def __init__(self, dataframe = pd.DataFrame(), filepath = '', sheetname = ''):
@@ -75,3 +83,145 @@ class ExcelDataHandler():
 
        def get_dataframe(self):
               return self.dataframe
+
+       def set_sheet_constant(self, name, value):
+              '''
+              Adds a column whose value is the same on every row without repeating
+              it per row.  The value is kept once in dataframe.attrs, which pandas
+              carries through slicing and pickling, and SqlDataHandler expands it
+              in front of the other columns when the rows are bound.  Like
+              insert_new_column_no_constraints(), the newest one comes first.
+              '''
+              sheet_constants = {field: field_value for field, field_value in self.get_sheet_constants().items() if field != name}
+              self.dataframe.attrs[SHEET_CONSTANTS] = {name: value, **sheet_constants}
+
+       def get_sheet_constants(self) -> dict:
+              return self.dataframe.attrs.get(SHEET_CONSTANTS, {})
+
+       def expand_sheet_constants(self):
+              '''Returns a copy of the dataframe with the sheet constants inserted as real columns.'''
+              dataframe = self.dataframe.copy(deep=False)
+              for position, (name, value) in enumerate(self.get_sheet_constants().items()):
+                     dataframe.insert(loc=position, column=name, value=value, allow_duplicates=True)
+              dataframe.attrs.pop(SHEET_CONSTANTS, None)
+              return dataframe
+
+       def apply_schema(self, schema: dict):
+              '''
+              Converts the columns named in schema in place.  'float' and 'integer'
+              columns become numeric arrays and 'category' columns keep each
+              distinct value once, which takes far less memory than object cells.
+              A column holding anything that doesn't fit its type is left as it is,
+              so the bad cells still reach the server and get reported.  Numeric
+              columns are only converted when every cell still renders as the same
+              text, so values bound to character fields don't change.
+              '''
+              for position in range(self.dataframe.shape[1]):
+                     column_type = schema.get(str(self.dataframe.columns[position]).strip())
+                     if not column_type:
+                            continue
+                     converted = self.convert_column(self.dataframe.iloc[:, position], column_type)
+                     if converted is not None:
+                            self.dataframe.isetitem(position, converted)
+
+       def convert_column(self, column, column_type: str):
+              if column_type == 'category':
+                     return None if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+              numeric = pd.to_numeric(column, errors='coerce')
+              if (numeric.isna() & column.notna()).any():
+                     return None
+              numeric = numeric.astype('float64')
+              candidates = [numeric]
+              if (numeric.dropna() == numeric.dropna().round()).all():
+                     #nullable integers keep empty cells as NULL without turning the rest into floats
+                     integers = numeric.astype('Int64' if numeric.isna().any() else 'int64')
+                     candidates.insert(0 if column_type == 'integer' else 1, integers)
+              for converted in candidates:
+                     if self.renders_same(column, converted):
+                            return converted
+              return None
+
+       def renders_same(self, column, converted) -> bool:
+              #a whole number read as 29 was bound as '29' and must not become '29.0'
+              present = column.notna().to_numpy()
+              original = column[present].map(str) if column.dtype == object else column[present].astype(str)
+              return original.tolist() == converted[present].astype(str).tolist()
+
+       def get_sheet_names(self) -> list:
+              workbook = self.open_workbook_read_only()
+              try:
+                     return list(workbook.sheetnames)
+              finally:
+                     workbook.close()
+
+       def open_workbook_read_only(self):
+              import openpyxl
+              return openpyxl.load_workbook(self.filepath, read_only=True, data_only=True, keep_links=False)
+
+       def iter_sheet_chunks(self, chunk_size=5000, thresh=10, workbook=None):
+              '''
+              Streams the sheet named by sheetname out of the workbook at filepath
+              and yields object-dtype dataframes of at most chunk_size rows.
+              Gives the same rows as read_excel(...).dropna(thresh=thresh) with the
+              unnamed columns dropped and empty cells as None, but rows are filtered as they are
+              read so memory stays flat no matter how big the sheet is.
+              An already open read-only openpyxl workbook can be passed in to
+              avoid reopening it for every sheet.
+              '''
+              opened_here = workbook is None
+              if opened_here:
+                     workbook = self.open_workbook_read_only()
+              try:
+                     worksheet = workbook[self.sheetname]
+                     worksheet.reset_dimensions() #some writers save the wrong sheet size
+                     rows = worksheet.iter_rows(values_only=True)
+
+                     header = next(rows, None)
+                     if header is None:
+                            return
+
+                     column_names = self.build_column_names(header)
+                     kept_positions = [position for position, name in enumerate(column_names) if 'unnamed' not in str(name).lower()]
+                     kept_names = [column_names[position] for position in kept_positions]
+
+                     #rows are indexed like read_excel does, by their position below the header
+                     chunk = []
+                     chunk_index = []
+                     for row_position, row in enumerate(rows):
+                            values = [self.convert_cell(value) for value in row]
+                            if sum(value is not None for value in values) < thresh:
+                                   continue
+                            values.extend([None] * (len(column_names) - len(values)))
+                            chunk.append([values[position] for position in kept_positions])
+                            chunk_index.append(row_position)
+                            if len(chunk) == chunk_size:
+                                   yield pd.DataFrame(chunk, columns=kept_names, index=chunk_index, dtype=object)
+                                   chunk = []
+                                   chunk_index = []
+                     if chunk:
+                            yield pd.DataFrame(chunk, columns=kept_names, index=chunk_index, dtype=object)
+              finally:
+                     if opened_here:
+                            workbook.close()
+
+       def convert_cell(self, value):
+              #match how pandas reads cells: missing values become None, whole floats become int
+              if value is None or (isinstance(value, str) and value in MISSING_CELL_VALUES):
+                     return None
+              if isinstance(value, float) and value.is_integer():
+                     return int(value)
+              return value
+
+       def build_column_names(self, header) -> list:
+              #blank headers become 'Unnamed: n' and repeats get .1, .2, ... like pandas
+              column_names = []
+              seen = {}
+              for position, value in enumerate(header):
+                     name = self.convert_cell(value)
+                     name = f'Unnamed: {position}' if name is None else name
+                     if name in seen:
+                            seen[name] += 1
+                            name = f'{name}.{seen[name]}'
+                     seen.setdefault(name, 0)
+                     column_names.append(name)
+              return column_names
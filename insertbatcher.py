@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:40 2026
+
+@author: cjmauro
+"""
+
+import traceback
+from runreport import NO_REPORT
+
+
+class InsertBatcher():
+       '''
+       Collects staged rows across sheets that share a column signature and
+       inserts them through SqlDataHandler in chunks, one commit per chunk.
+       A chunk is flushed once it holds chunk_rows rows or roughly chunk_bytes
+       bytes of parameter data, whichever comes first.  Every flushed chunk is
+       recorded in chunk_log along with the sheets it contained, so a failed
+       chunk can be traced back to its sheets.
+
+       With whole_sheets a sheet's rows are held until the sheet is complete
+       and then go into one chunk, flushing the chunk before it if they don't
+       fit, so no sheet is ever split over two commits.  A load manifest needs
+       this, otherwise a sheet can be partly committed and still be marked
+       failed, and a rerun would insert the committed part twice.  Chunks can
+       then grow past chunk_rows or chunk_bytes by the size of one sheet.
+       '''
+
+       def __init__(self, sqldatahandler, table_name: str, chunk_rows=10000, chunk_bytes=None, run_report=None,
+                    whole_sheets=False):
+
+              #handler that owns the connection and builds the insert statements
+              self.sqldatahandler = sqldatahandler
+              self.table_name = table_name
+
+              #a chunk is full when either limit is reached, None disables a limit
+              self.chunk_rows = chunk_rows
+              self.chunk_bytes = chunk_bytes
+
+              #key is the column signature (tuple of column headers)
+              #value is the chunk currently being filled for that signature
+              self.pending_chunks = {}
+
+              #one dict per flushed chunk: table, sheets, rows, bytes, committed
+              self.chunk_log = []
+
+              #sheets fully handed to add_sheet() that are not yet known to be committed
+              self.added_sheets = []
+              self.failed_sheets = set()
+
+              #key is the sheet label, value is {'header', 'signature', 'rows', 'bytes'} held until the sheet is complete
+              self.whole_sheets = whole_sheets
+              self.held_sheets = {}
+
+              #failures found by complete_sheet(), handed back by the next add_sheet() or flush()
+              self.new_failures = []
+
+              #optional RunReport timing the staging and insert of each chunk
+              self.run_report = run_report or NO_REPORT
+
+
+       def add_sheet(self, dataframe, sheet_label: str, sheet_complete=True) -> list:
+              '''
+              Stages a cleaned sheet.  Returns the labels of sheets belonging to
+              any chunk that was flushed and failed while adding this one.
+              A sheet added in several parts passes sheet_complete=False and calls
+              complete_sheet() once its last part is in.
+              '''
+              signature = self.sqldatahandler.get_external_fields(dataframe)
+              with self.run_report.stage('staging', sheet=sheet_label, rows=len(dataframe.index)):
+                     rows = self.sqldatahandler.build_values_to_insert_frame(dataframe, self.table_name)
+                     row_bytes = [self.estimate_row_bytes(row) for row in rows] if self.chunk_bytes else None
+              if self.whole_sheets:
+                     return self.hold_sheet(dataframe, signature, rows, row_bytes, sheet_label, sheet_complete)
+              failed_sheets = []
+
+              start = 0
+              while start < len(rows):
+                     chunk = self.pending_chunks.get(signature)
+                     if chunk is None:
+                            chunk = self.new_chunk(dataframe)
+                            self.pending_chunks[signature] = chunk
+
+                     fit = self.count_rows_that_fit(chunk, row_bytes, start, len(rows))
+                     if fit:
+                            chunk['rows'].extend(rows[start:start + fit])
+                            chunk['bytes'] += sum(row_bytes[start:start + fit]) if row_bytes else 0
+                            if sheet_label not in chunk['sheets']:
+                                   chunk['sheets'].append(sheet_label)
+                            start += fit
+
+                     if not fit or self.chunk_is_full(chunk):
+                            failed_sheets.extend(self.flush_chunk(signature))
+
+              if sheet_complete:
+                     self.complete_sheet(sheet_label)
+              return failed_sheets
+
+
+       def hold_sheet(self, dataframe, signature, rows: list, row_bytes, sheet_label: str, sheet_complete: bool) -> list:
+              if sheet_label not in self.failed_sheets:
+                     held_sheet = self.held_sheets.setdefault(sheet_label, {'header': dataframe.iloc[:0], 'signature': signature,
+                                                                            'rows': [], 'bytes': 0})
+                     held_sheet['rows'].extend(rows)
+                     held_sheet['bytes'] += sum(row_bytes) if row_bytes else 0
+              if sheet_complete:
+                     self.complete_sheet(sheet_label)
+              return self.pop_new_failures()
+
+
+       def complete_sheet(self, sheet_label: str):
+              #from here on the sheet counts as committed once its pending rows are
+              if sheet_label not in self.added_sheets:
+                     self.added_sheets.append(sheet_label)
+
+              held_sheet = self.held_sheets.pop(sheet_label, None)
+              if held_sheet and held_sheet['rows']:
+                     self.new_failures.extend(self.add_whole_sheet(held_sheet, sheet_label))
+
+
+       def add_whole_sheet(self, held_sheet: dict, sheet_label: str) -> list:
+              failed_sheets = []
+              signature = held_sheet['signature']
+              chunk = self.pending_chunks.get(signature)
+              if chunk and chunk['rows'] and not self.sheet_fits(chunk, held_sheet):
+                     failed_sheets.extend(self.flush_chunk(signature))
+                     chunk = None
+              if chunk is None:
+                     chunk = self.new_chunk(held_sheet['header'])
+                     self.pending_chunks[signature] = chunk
+
+              chunk['rows'].extend(held_sheet['rows'])
+              chunk['bytes'] += held_sheet['bytes']
+              chunk['sheets'].append(sheet_label)
+              if self.chunk_is_full(chunk):
+                     failed_sheets.extend(self.flush_chunk(signature))
+              return failed_sheets
+
+
+       def fail_sheet(self, sheet_label: str):
+              #rows held for a sheet that fails part way through are dropped, not committed with the next chunk
+              self.held_sheets.pop(sheet_label, None)
+              self.failed_sheets.add(sheet_label)
+
+
+       def pop_new_failures(self) -> list:
+              new_failures, self.new_failures = self.new_failures, []
+              return new_failures
+
+
+       def flush(self) -> list:
+              '''Inserts every pending chunk.  Returns the labels of sheets in failed chunks.'''
+              failed_sheets = self.pop_new_failures()
+              for signature in list(self.pending_chunks):
+                     failed_sheets.extend(self.flush_chunk(signature))
+              return failed_sheets
+
+
+       def pop_committed_sheets(self) -> list:
+              '''
+              Returns the labels of sheets whose rows have all been committed since
+              the last call.  A sheet still waiting in a pending chunk, or one that
+              was part of a failed chunk, is not included.
+              '''
+              pending_sheets = {sheet_label for chunk in self.pending_chunks.values() for sheet_label in chunk['sheets']}
+              committed_sheets = [sheet_label for sheet_label in self.added_sheets
+                                  if sheet_label not in pending_sheets and sheet_label not in self.failed_sheets]
+              self.added_sheets = [sheet_label for sheet_label in self.added_sheets if sheet_label in pending_sheets]
+              return committed_sheets
+
+
+       def flush_chunk(self, signature) -> list:
+              chunk = self.pending_chunks.pop(signature)
+              log_entry = {'table': self.table_name,
+                           'sheets': chunk['sheets'],
+                           'rows': len(chunk['rows']),
+                           'bytes': chunk['bytes'],
+                           'committed': False}
+              self.chunk_log.append(log_entry)
+
+              self.sqldatahandler.rows_to_insert.extend(chunk['rows'])
+              try:
+                     with self.run_report.stage('insert', sheet=', '.join(chunk['sheets']), rows=log_entry['rows'],
+                                                bytes=log_entry['bytes'] or None):
+                            self.sqldatahandler.bulk_insert_rows_to_table(chunk['header'], self.table_name)
+              except:
+                     traceback.print_exc()
+                     print(f'Chunk of {log_entry["rows"]} rows failed to insert into {self.table_name}.\n'
+                           + f'It contained rows from: {chunk["sheets"]}\n\n')
+                     self.failed_sheets.update(chunk['sheets'])
+                     return chunk['sheets']
+              else:
+                     log_entry['committed'] = True
+                     print(f'Chunk of {log_entry["rows"]} rows committed to {self.table_name} from: {chunk["sheets"]}\n')
+                     return []
+
+
+       def new_chunk(self, dataframe) -> dict:
+              #an empty frame carries the header that create_insert_statement() needs
+              return {'header': dataframe.iloc[:0], 'rows': [], 'bytes': 0, 'sheets': []}
+
+
+       def count_rows_that_fit(self, chunk, row_bytes, start: int, end: int) -> int:
+              fit = end - start
+              if self.chunk_rows:
+                     fit = min(fit, self.chunk_rows - len(chunk['rows']))
+              if self.chunk_bytes and row_bytes:
+                     budget = self.chunk_bytes - chunk['bytes']
+                     rows_within_budget = 0
+                     for size in row_bytes[start:start + fit]:
+                            #an empty chunk always takes one row so oversized rows still get inserted
+                            if size > budget and (rows_within_budget or chunk['rows']):
+                                   break
+                            budget -= size
+                            rows_within_budget += 1
+                     fit = rows_within_budget
+              return max(fit, 0)
+
+
+       def sheet_fits(self, chunk, held_sheet) -> bool:
+              if self.chunk_rows and len(chunk['rows']) + len(held_sheet['rows']) > self.chunk_rows:
+                     return False
+              if self.chunk_bytes and chunk['bytes'] + held_sheet['bytes'] > self.chunk_bytes:
+                     return False
+              return True
+
+
+       def chunk_is_full(self, chunk) -> bool:
+              if self.chunk_rows and len(chunk['rows']) >= self.chunk_rows:
+                     return True
+              if self.chunk_bytes and chunk['bytes'] >= self.chunk_bytes:
+                     return True
+              return False
+
+
+       def estimate_row_bytes(self, row) -> int:
+              #staged values are strings, anything else is counted by its string form
+              return sum(len(value) if isinstance(value, str) else len(str(value)) for value in row)
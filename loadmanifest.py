@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:05:37 2026
+
+@author: cjmauro
+"""
+
+import os
+import json
+import hashlib
+
+
+class LoadManifest():
+       '''
+       Keeps a JSON record of which routesheets have been committed, keyed by
+       the workbook's content hash and sheet name, along with the ImportID they
+       were loaded under.  Reruns check the manifest to skip unchanged sheets
+       that are already loaded and pick up only new, changed or failed ones.
+       A workbook that is edited gets a new hash, so all of its sheets load again.
+       '''
+
+       def __init__(self, manifest_path: str):
+
+              self.manifest_path = str(manifest_path)
+
+              #key is the content hash, value is {'file': path, 'sheets': [sheet names]}
+              self.workbooks = {}
+
+              #key is '<content hash>::<sheet name>'
+              #value is {'file', 'sheet', 'importid', 'status'} where status is 'committed' or 'failed'
+              self.sheets = {}
+
+              if os.path.exists(self.manifest_path):
+                     self.load()
+
+
+       def load(self):
+              with open(self.manifest_path, encoding='utf-8') as manifest_file:
+                     manifest = json.load(manifest_file)
+              self.workbooks = manifest.get('workbooks', {})
+              self.sheets = manifest.get('sheets', {})
+
+
+       def save(self):
+              #write to a temp file first so a crash never leaves a half written manifest
+              temp_path = f'{self.manifest_path}.tmp'
+              with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+                     json.dump({'workbooks': self.workbooks, 'sheets': self.sheets}, manifest_file, indent=1)
+              os.replace(temp_path, self.manifest_path)
+
+
+       def hash_workbook(self, filepath: str) -> str:
+              content_hash = hashlib.sha256()
+              with open(filepath, 'rb') as workbook:
+                     for block in iter(lambda: workbook.read(1024 * 1024), b''):
+                            content_hash.update(block)
+              return content_hash.hexdigest()
+
+
+       def sheet_key(self, content_hash: str, sheet_name: str) -> str:
+              return f'{content_hash}::{sheet_name}'
+
+
+       def record_workbook(self, content_hash: str, filepath: str, sheet_names: list):
+              self.workbooks[content_hash] = {'file': str(filepath), 'sheets': list(sheet_names)}
+              self.save()
+
+
+       def is_sheet_loaded(self, content_hash: str, sheet_name: str) -> bool:
+              sheet = self.sheets.get(self.sheet_key(content_hash, sheet_name))
+              return bool(sheet) and sheet['status'] == 'committed'
+
+
+       def is_workbook_loaded(self, content_hash: str) -> bool:
+              #only known once every sheet name of the workbook has been recorded
+              workbook = self.workbooks.get(content_hash)
+              if not workbook or not workbook['sheets']:
+                     #all() of no sheets is True, a workbook without sheets was never loaded
+                     return False
+              return all(self.is_sheet_loaded(content_hash, sheet_name) for sheet_name in workbook['sheets'])
+
+
+       def loaded_sheets(self, content_hash: str) -> set:
+              return {sheet['sheet'] for key, sheet in self.sheets.items()
+                      if key.startswith(f'{content_hash}::') and sheet['status'] == 'committed'}
+
+
+       def mark_committed(self, content_hash: str, sheet_name: str, filepath: str, importid: int):
+              self.mark_sheet(content_hash, sheet_name, filepath, importid, 'committed')
+
+
+       def mark_failed(self, content_hash: str, sheet_name: str, filepath: str, importid: int):
+              self.mark_sheet(content_hash, sheet_name, filepath, importid, 'failed')
+
+
+       def mark_workbook_failed(self, filepath: str, importid):
+              '''
+              Marks the sheets of a workbook that are not committed as failed, for
+              a load that stopped before it got to them.  A workbook that can no
+              longer be read, or whose sheets were never listed, is marked failed
+              as a whole under the sheet name '*'.  importid is None if the load
+              stopped before one was looked up.
+              '''
+              try:
+                     content_hash = self.hash_workbook(filepath)
+              except OSError:
+                     content_hash = ''
+              sheet_names = self.workbooks.get(content_hash, {}).get('sheets')
+              if not sheet_names:
+                     self.mark_failed(content_hash, '*', filepath, importid)
+                     return
+              for sheet_name in sheet_names:
+                     if not self.is_sheet_loaded(content_hash, sheet_name):
+                            self.mark_failed(content_hash, sheet_name, filepath, importid)
+
+
+       def mark_sheet(self, content_hash: str, sheet_name: str, filepath: str, importid: int, status: str):
+              self.sheets[self.sheet_key(content_hash, sheet_name)] = {'file': str(filepath),
+                                                                        'sheet': str(sheet_name),
+                                                                        'importid': None if importid is None else int(importid),
+                                                                        'status': status}
+              self.save()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:26:12 2026
+
+@author: cjmauro
+"""
+
+import time
+import queue
+import threading
+import traceback
+import pandas as pd
+from runreport import NO_REPORT
+
+
+class ParallelInserter():
+       '''
+       Spreads sheet inserts across worker threads, each holding its own pooled
+       connection and committing its own transactions.  Sheets are partitioned
+       by partition_column (Branch by default) so every partition always goes to
+       the same worker, and the results of all workers are merged into one run
+       summary.
+
+       Has the same interface as InsertBatcher (add_sheet, complete_sheet,
+       fail_sheet, pop_committed_sheets, flush) so RoutesheetLoader can use
+       either one.  Inserts finish asynchronously, so failures are reported by
+       whichever later call notices them.
+
+       A sheet added in parts is inserted one part at a time, unless
+       whole_sheets holds the parts until the sheet is complete and inserts
+       them in one transaction, as a load manifest needs.
+       '''
+
+       def __init__(self, sqldatahandler, connection_pool, table_name: str, workers=None,
+                    partition_column='Branch', queue_size=2, run_report=None, whole_sheets=False):
+
+              #template handler: workers copy its field map and bulk loader onto their own connection
+              self.sqldatahandler = sqldatahandler
+              self.connection_pool = connection_pool
+              self.table_name = table_name
+              self.partition_column = partition_column
+
+              #every worker holds a connection for its lifetime, so never run more workers than connections
+              self.workers = min(workers or connection_pool.size, connection_pool.size)
+
+              #bounded per worker queues keep parsed sheets from piling up ahead of the inserts
+              self.task_queues = [queue.Queue(maxsize=queue_size) for worker in range(self.workers)]
+
+              #key is the partition value, value is the index of the worker that owns it
+              self.partitions = {}
+
+              self.lock = threading.Lock()
+
+              #one dict per insert: sheet, partition, worker, rows, seconds, committed
+              self.results = []
+
+              #key is the sheet label, value is {'pending', 'failed', 'complete'}
+              self.sheet_states = {}
+              self.new_failures = []
+
+              #key is the sheet label, value is the list of dataframes added so far
+              self.whole_sheets = whole_sheets
+              self.held_sheets = {}
+
+              #optional RunReport, workers record their staging and insert stages in it
+              self.run_report = run_report or NO_REPORT
+
+              self.threads = [threading.Thread(target=self.run_worker, args=(worker,), name=f'insert-worker-{worker}', daemon=True)
+                              for worker in range(self.workers)]
+              for thread in self.threads:
+                     thread.start()
+
+
+       def add_sheet(self, dataframe, sheet_label: str, sheet_complete=True) -> list:
+              '''Queues a sheet (or part of one) for insert.  Returns sheets found to have failed since the last call.'''
+              if self.whole_sheets:
+                     with self.lock:
+                            failed = self.sheet_states.get(sheet_label, {}).get('failed')
+                     if not failed:
+                            self.held_sheets.setdefault(sheet_label, []).append(dataframe)
+              else:
+                     self.queue_sheet(dataframe, sheet_label)
+              if sheet_complete:
+                     self.complete_sheet(sheet_label)
+              return self.pop_new_failures()
+
+
+       def queue_sheet(self, dataframe, sheet_label: str):
+              partition = self.get_partition(dataframe)
+              worker = self.get_worker(partition)
+
+              with self.lock:
+                     sheet_state = self.sheet_states.setdefault(sheet_label, {'pending': 0, 'failed': False, 'complete': False})
+                     sheet_state['pending'] += 1
+
+              self.task_queues[worker].put((dataframe, sheet_label, partition))
+
+
+       def complete_sheet(self, sheet_label: str):
+              dataframes = self.held_sheets.pop(sheet_label, None)
+              if dataframes:
+                     dataframe = pd.concat(dataframes) if len(dataframes) > 1 else dataframes[0]
+                     dataframe.attrs = dataframes[0].attrs
+                     self.queue_sheet(dataframe, sheet_label)
+              with self.lock:
+                     self.sheet_states.setdefault(sheet_label, {'pending': 0, 'failed': False, 'complete': False})['complete'] = True
+
+
+       def fail_sheet(self, sheet_label: str):
+              self.held_sheets.pop(sheet_label, None)
+              with self.lock:
+                     self.sheet_states.setdefault(sheet_label, {'pending': 0, 'failed': False, 'complete': False})['failed'] = True
+
+
+       def pop_committed_sheets(self) -> list:
+              '''Returns sheets whose inserts have all committed since the last call.'''
+              committed_sheets = []
+              with self.lock:
+                     for sheet_label, sheet_state in list(self.sheet_states.items()):
+                            if sheet_state['complete'] and not sheet_state['pending']:
+                                   if not sheet_state['failed']:
+                                          committed_sheets.append(sheet_label)
+                                   del self.sheet_states[sheet_label]
+              return committed_sheets
+
+
+       def flush(self) -> list:
+              '''Waits for every queued insert to finish.  Returns sheets found to have failed since the last call.'''
+              for task_queue in self.task_queues:
+                     task_queue.join()
+              return self.pop_new_failures()
+
+
+       def close(self):
+              #stop the workers and hand their connections back to the pool
+              for task_queue in self.task_queues:
+                     task_queue.put(None)
+              for thread in self.threads:
+                     thread.join()
+
+
+       def run_worker(self, worker: int):
+              sql_connector = None
+              sql_data = None
+              try:
+                     sql_connector = self.connection_pool.acquire()
+                     sql_data = self.sqldatahandler.copy_with_connector(sql_connector)
+              except Exception:
+                     #keep taking tasks so they are reported as failed instead of hanging flush()
+                     traceback.print_exc()
+                     print(f'Insert worker {worker} could not connect, its sheets will fail.\n')
+
+              try:
+                     while True:
+                            task = self.task_queues[worker].get()
+                            try:
+                                   if task is None:
+                                          break
+                                   self.insert_sheet(sql_data, worker, *task)
+                            finally:
+                                   self.task_queues[worker].task_done()
+              finally:
+                     if sql_connector is not None:
+                            self.connection_pool.release(sql_connector)
+
+
+       def insert_sheet(self, sql_data, worker: int, dataframe, sheet_label: str, partition):
+              time_start = time.perf_counter()
+              committed = False
+              try:
+                     rows = len(dataframe.index)
+                     with self.run_report.stage('staging', sheet=sheet_label, rows=rows):
+                            sql_data.add_dataframe_to_insert(dataframe, self.table_name)
+                     with self.run_report.stage('insert', sheet=sheet_label, rows=rows):
+                            sql_data.bulk_insert_rows_to_table(dataframe.iloc[:0], self.table_name)
+                     committed = True
+              except:
+                     traceback.print_exc()
+                     if sql_data:
+                            sql_data.rows_to_insert.clear()
+
+              with self.lock:
+                     self.results.append({'sheet': sheet_label,
+                                          'partition': partition,
+                                          'worker': worker,
+                                          'rows': len(dataframe.index),
+                                          'seconds': round(time.perf_counter() - time_start, 4),
+                                          'committed': committed})
+                     sheet_state = self.sheet_states[sheet_label]
+                     sheet_state['pending'] -= 1
+                     if not committed and not sheet_state['failed']:
+                            sheet_state['failed'] = True
+                            self.new_failures.append(sheet_label)
+
+
+       def pop_new_failures(self) -> list:
+              with self.lock:
+                     new_failures = self.new_failures
+                     self.new_failures = []
+              return new_failures
+
+
+       def get_partition(self, dataframe):
+              sheet_constants = self.sqldatahandler.get_sheet_constants(dataframe)
+              if self.partition_column in sheet_constants:
+                     return sheet_constants[self.partition_column]
+              if self.partition_column in dataframe.columns and len(dataframe.index):
+                     partition = dataframe[self.partition_column].iloc[0]
+                     #a duplicated header gives back a row of values, use the first
+                     return partition.iloc[0] if hasattr(partition, 'iloc') else partition
+              return None
+
+
+       def get_worker(self, partition) -> int:
+              if partition is None:
+                     #unpartitioned sheets go to the least busy worker
+                     return min(range(self.workers), key=lambda worker: self.task_queues[worker].qsize())
+              with self.lock:
+                     if partition not in self.partitions:
+                            self.partitions[partition] = len(self.partitions) % self.workers
+                     return self.partitions[partition]
+
+
+       def summary(self) -> dict:
+              '''Merges the per insert results into totals for the run and for each worker.'''
+              with self.lock:
+                     results = list(self.results)
+              workers = []
+              for worker in range(self.workers):
+                     worker_results = [result for result in results if result['worker'] == worker]
+                     workers.append({'worker': worker,
+                                     'partitions': sorted({str(result['partition']) for result in worker_results}),
+                                     'inserts': len(worker_results),
+                                     'rows': sum(result['rows'] for result in worker_results if result['committed']),
+                                     'seconds': round(sum(result['seconds'] for result in worker_results), 4)})
+              return {'inserts': len(results),
+                      'rows': sum(result['rows'] for result in results if result['committed']),
+                      'failed_sheets': sorted({result['sheet'] for result in results if not result['committed']}),
+                      'workers': workers}
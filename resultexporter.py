@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:31:44 2026
+
+@author: cjmauro
+"""
+
+import os
+import re
+import argparse
+import pandas as pd
+
+try:
+       import pyarrow as pa
+       import pyarrow.parquet as parquet
+except ImportError:
+       pa = None
+
+
+class ResultExporter():
+       '''
+       Writes the result of a query to a csv or parquet file one chunk of
+       chunk_rows at a time, so a full Routesheets dump or a large report never
+       sits in memory.  Chunks come from SqlDataHandler.iter_result_frames().
+       Files are written under a temp name and moved into place when complete.
+       Parquet needs pyarrow, the column types are taken from the first chunk.
+       '''
+
+       def __init__(self, sql_data, chunk_rows=50000):
+
+              self.sql_data = sql_data
+              self.chunk_rows = chunk_rows
+
+
+       def export_query(self, select_statement: str, output_path: str, *params) -> int:
+              '''Writes the result of select_statement to output_path, as parquet if it ends in .parquet.  Returns the number of rows.'''
+              frames = self.sql_data.iter_result_frames(select_statement, *params, chunk_rows=self.chunk_rows)
+              temp_path = f'{output_path}.tmp'
+              try:
+                     if str(output_path).lower().endswith('.parquet'):
+                            rows = self.write_parquet(frames, temp_path)
+                     else:
+                            rows = self.write_csv(frames, temp_path)
+              except BaseException:
+                     if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                     raise
+              os.replace(temp_path, output_path)
+              return rows
+
+
+       def export_import(self, table: str, importid: int, output_path: str) -> int:
+              '''Writes every row loaded under importid.'''
+              select_statement = self.sql_data.create_select_statement('*', table, 'ImportID = ?')
+              return self.export_query(select_statement, output_path, importid)
+
+
+       def export_query_file(self, query_path: str, output_path: str, table=None) -> int:
+              '''
+              Writes the result of a saved query such as ServiceDiscrepancyReport.SQL.
+              The saved reports read the Routesheets table, table runs them over
+              another one instead.
+              '''
+              return self.export_query(read_query_file(query_path, table), output_path)
+
+
+       def write_csv(self, frames, output_path: str) -> int:
+              rows = 0
+              with open(output_path, 'w', newline='', encoding='utf-8') as output_file:
+                     for frame in frames:
+                            frame.to_csv(output_file, header=not rows, index=False)
+                            rows += len(frame.index)
+              return rows
+
+
+       def write_parquet(self, frames, output_path: str) -> int:
+              if pa is None:
+                     raise ImportError('Exporting to parquet requires pyarrow.  Install it with: pip install pyarrow')
+              rows = 0
+              writer = None
+              try:
+                     for frame in frames:
+                            table = self.build_arrow_table(frame, writer.schema if writer else None)
+                            if writer is None:
+                                   writer = parquet.ParquetWriter(output_path, table.schema)
+                            writer.write_table(table)
+                            rows += len(frame.index)
+              finally:
+                     if writer:
+                            writer.close()
+              return rows
+
+
+       def build_arrow_table(self, frame, schema=None):
+              '''Converts a chunk to an Arrow table, matching schema when given.  Columns with no type yet are stored as text.'''
+              arrays = []
+              for position in range(frame.shape[1]):
+                     column = frame.iloc[:, position]
+                     field_type = schema.field(position).type if schema is not None else None
+                     try:
+                            array = pa.array(column, type=field_type, from_pandas=True)
+                     except (pa.ArrowInvalid, pa.ArrowTypeError):
+                            if field_type is not None and not (pa.types.is_string(field_type) or pa.types.is_large_string(field_type)):
+                                   raise ValueError(f'Column {frame.columns[position]} no longer fits {field_type} in a later chunk')
+                            array = None
+                     if array is None or pa.types.is_null(array.type):
+                            array = pa.array(column.map(lambda value: None if pd.isna(value) else str(value)), type=field_type or pa.string())
+                     arrays.append(array)
+              return pa.Table.from_arrays(arrays, names=[str(column) for column in frame.columns])
+
+
+
+def read_query_file(query_path: str, table=None) -> str:
+       #the saved reports open with a ''' description that SQL Server would not run
+       with open(query_path, encoding='utf-8') as query_file:
+              query = query_file.read()
+       query = re.sub(r"^\s*'''.*?'''", '', query, count=1, flags=re.DOTALL).strip()
+       if table:
+              query = re.sub(r'\bFROM\s+Routesheets\b', lambda match: f'FROM {table}', query, flags=re.IGNORECASE)
+       return query
+
+
+
+if __name__ == '__main__':
+       from routesheetcli import CONNECTION_STRING_VARIABLE
+
+       parser = argparse.ArgumentParser(description='Export a query result to csv or parquet in chunks.')
+       parser.add_argument('output_path', help='file to write, parquet if it ends in .parquet, otherwise csv')
+       parser.add_argument('--connection-string', default=os.environ.get(CONNECTION_STRING_VARIABLE),
+                           help=f'ODBC connection string, defaults to ${CONNECTION_STRING_VARIABLE}')
+       parser.add_argument('--query-file', help='saved query to run, e.g. ServiceDiscrepancyReport.SQL')
+       parser.add_argument('--table', help='table to dump the rows of one import from, or for --query-file to read instead of Routesheets')
+       parser.add_argument('--importid', type=int, help='ImportID to dump from --table')
+       parser.add_argument('--chunk-rows', type=int, default=50000)
+       args = parser.parse_args()
+
+       if not args.connection_string:
+              parser.error('a connection string is required')
+       if bool(args.query_file) == (args.importid is not None) or (args.importid is not None and not args.table):
+              parser.error('give either --query-file or both --table and --importid')
+
+       import pyodbc as db
+       from sqldatahandler import SqlDataHandler
+
+       sql_data = SqlDataHandler(db.connect(args.connection_string))
+       exporter = ResultExporter(sql_data, args.chunk_rows)
+       try:
+              if args.query_file:
+                     rows = exporter.export_query_file(args.query_file, args.output_path, args.table)
+              else:
+                     rows = exporter.export_import(args.table, args.importid, args.output_path)
+       finally:
+              sql_data.sql_connector.close()
+       print(f'{rows} rows written to {args.output_path}')
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:20:53 2026
+
+@author: cjmauro
+"""
+
+import os
+import sys
+import json
+import argparse
+
+
+#the connection string can come from the environment so passwords stay out of config files
+CONNECTION_STRING_VARIABLE = 'ROUTESHEET_CONNECTION_STRING'
+
+REQUIRED_SETTINGS = ('connection_string', 'directory', 'table', 'field_map')
+
+#key is the setting, value is its type, same names as the options of main()
+LOAD_SETTINGS = {'importid': int,
+                 'parse_workers': int,
+                 'chunk_rows': int,
+                 'chunk_bytes': int,
+                 'bulk_staging_directory': str,
+                 'manifest_path': str,
+                 'cache_directory': str,
+                 'stream_chunk_size': int,
+                 'pipeline_queue_size': int,
+                 'insert_workers': int,
+                 'report_path': str,
+                 'trace_memory': bool,
+                 'profile_path': str,
+                 'quarantine_path': str,
+                 'discrepancy_report_path': str,
+                 'discrepancy_state_path': str,
+                 'parse_service_codes': bool,
+                 'delta': bool,
+                 'watch': bool,
+                 'poll_interval': float,
+                 'settle_seconds': float}
+
+#run report settings cover one run, and every batch of a watched folder picks its own ImportID
+NOT_WATCH_SETTINGS = ('importid', 'report_path', 'trace_memory', 'profile_path')
+
+#polling settings of watch, a sharded load polls the work manifest as well but has no files to settle
+POLL_SETTINGS = ('poll_interval', 'settle_seconds')
+
+#load into a SQLite file instead of SQL Server, see run_local()
+LOCAL_SETTINGS = {'local_database': str,
+                  'local_report_path': str}
+
+#the local table starts empty on every run and has no BULK INSERT, MERGE or connection pool
+NOT_LOCAL_SETTINGS = ('bulk_staging_directory', 'insert_workers', 'manifest_path', 'delta', 'watch', 'poll_interval',
+                      'settle_seconds')
+
+#share one load between several processes or hosts, see run_shard_coordinator() and run_shard_worker()
+SHARD_SETTINGS = {'shard_directory': str,
+                  'shard_role': str,
+                  'shard_worker': str,
+                  'stale_seconds': float}
+
+SHARD_ROLES = ('coordinator', 'worker')
+
+#every worker loads one sheet at a time, so settings that span a whole run or keep files of their own do not apply
+NOT_SHARD_SETTINGS = ('watch', 'settle_seconds', 'manifest_path', 'insert_workers', 'report_path', 'trace_memory',
+                      'profile_path', 'discrepancy_report_path', 'discrepancy_state_path', 'local_database')
+
+
+def build_parser() -> argparse.ArgumentParser:
+       parser = argparse.ArgumentParser(description='Load a folder of routesheets into SQL Server without the login and '
+                                                    + 'folder windows, for scheduled jobs.  Settings come from --config '
+                                                    + 'and are overridden by the options given here.',
+                                        epilog='Example config: {"connection_string": "DRIVER={ODBC Driver 18 for SQL Server};...", '
+                                               + '"directory": "D:/Routesheets", "table": "dbo.Routesheets", '
+                                               + '"field_map": {"Job Key": "JobKey", ...}, "parse_workers": 4}.  '
+                                               + 'field_map may also be the path to a JSON file holding the map.')
+       parser.add_argument('--config', help='JSON file of settings')
+       parser.add_argument('--connection-string', help=f'ODBC connection string, defaults to ${CONNECTION_STRING_VARIABLE}')
+       parser.add_argument('--directory', help='folder of Excel routesheets to load')
+       parser.add_argument('--table', help='table to insert into')
+       parser.add_argument('--field-map', help='JSON file mapping Excel headers to table fields')
+       parser.add_argument('--local-database', help='load into this SQLite file instead of SQL Server, no connection string needed')
+       parser.add_argument('--local-report-path', help='with --local-database, write the service discrepancy report here')
+       parser.add_argument('--shard-directory', help='shared folder of the work manifest for a load spread over several machines')
+       parser.add_argument('--shard-role', choices=SHARD_ROLES, help='with --shard-directory, coordinate the load or work on it')
+       parser.add_argument('--shard-worker', help='name of this worker in the work manifest, defaults to <host>-<process id>')
+       parser.add_argument('--stale-seconds', type=float, help='take over a claimed sheet that has not finished after this long')
+       for setting, setting_type in LOAD_SETTINGS.items():
+              option = '--' + setting.replace('_', '-')
+              if setting_type is bool:
+                     parser.add_argument(option, action='store_true', default=None)
+              else:
+                     parser.add_argument(option, type=setting_type)
+       return parser
+
+
+def load_config(config_path: str) -> dict:
+       with open(config_path, encoding='utf-8') as config_file:
+              config = json.load(config_file)
+       if not isinstance(config, dict):
+              raise ValueError(f'{config_path} must hold a JSON object of settings')
+       unknown = sorted(set(config) - set(REQUIRED_SETTINGS) - set(LOAD_SETTINGS) - set(LOCAL_SETTINGS) - set(SHARD_SETTINGS))
+       if unknown:
+              raise ValueError(f'Unknown settings in {config_path}: {unknown}')
+       return config
+
+
+def resolve_settings(args) -> dict:
+       '''Merges the config file, the environment and the command line, in that order.  Raises ValueError if anything required is missing.'''
+       settings = load_config(args.config) if args.config else {}
+       if os.environ.get(CONNECTION_STRING_VARIABLE):
+              settings['connection_string'] = os.environ[CONNECTION_STRING_VARIABLE]
+       for setting in REQUIRED_SETTINGS + tuple(LOAD_SETTINGS) + tuple(LOCAL_SETTINGS) + tuple(SHARD_SETTINGS):
+              value = getattr(args, setting, None)
+              if value is not None:
+                     settings[setting] = value
+
+       if isinstance(settings.get('field_map'), str):
+              with open(settings['field_map'], encoding='utf-8') as field_map_file:
+                     settings['field_map'] = json.load(field_map_file)
+
+       local = bool(settings.get('local_database'))
+       if local:
+              #the local file stands in for the server, so a connection string from the environment is not used
+              settings.pop('connection_string', None)
+       missing = [setting for setting in REQUIRED_SETTINGS if not settings.get(setting)
+                  and not (local and setting == 'connection_string')]
+       if missing:
+              raise ValueError(f'Missing settings: {missing}')
+       if not os.path.isdir(settings['directory']):
+              raise ValueError(f'{settings["directory"]} is not a folder')
+       if settings.get('watch'):
+              if not settings.get('manifest_path'):
+                     raise ValueError('watch needs a manifest_path')
+              not_watch = [setting for setting in NOT_WATCH_SETTINGS if settings.get(setting)]
+              if not_watch:
+                     raise ValueError(f'{not_watch} do not apply to watch')
+       if local:
+              not_local = [setting for setting in NOT_LOCAL_SETTINGS if settings.get(setting)]
+              if not_local:
+                     raise ValueError(f'{not_local} need SQL Server and do not apply to local_database')
+       elif settings.get('local_report_path'):
+              raise ValueError('local_report_path needs a local_database')
+       if not (settings.get('watch') or settings.get('shard_directory')):
+              not_polling = [setting for setting in POLL_SETTINGS if settings.get(setting) is not None]
+              if not_polling:
+                     raise ValueError(f'{not_polling} need watch or a shard_directory')
+       if settings.get('shard_directory'):
+              if settings.get('shard_role') not in SHARD_ROLES:
+                     raise ValueError(f'shard_directory needs a shard_role of {" or ".join(SHARD_ROLES)}')
+              not_shard = [setting for setting in NOT_SHARD_SETTINGS if settings.get(setting)]
+              if settings['shard_role'] == 'worker' and settings.get('importid') is not None:
+                     #the coordinator reserves it once for every worker
+                     not_shard.append('importid')
+              if not_shard:
+                     raise ValueError(f'{not_shard} do not apply to a sharded load')
+       else:
+              shard_only = [setting for setting in SHARD_SETTINGS if settings.get(setting) is not None]
+              if shard_only:
+                     raise ValueError(f'{shard_only} need a shard_directory')
+       return settings
+
+
+def main(argv=None) -> int:
+       '''
+       Returns 0 when every sheet loaded, 1 when some failed and 2 when the
+       settings are wrong.  With watch it runs until stopped with Ctrl+C.
+       With local_database it loads into that SQLite file instead of SQL Server.
+       With shard_directory the coordinator returns once every worker is done.
+       '''
+       parser = build_parser()
+       args = parser.parse_args(argv)
+       try:
+              settings = resolve_settings(args)
+       except (OSError, ValueError) as error:
+              parser.print_usage(sys.stderr)
+              print(f'{parser.prog}: error: {error}', file=sys.stderr)
+              return 2
+
+       #pandas, pyodbc and the rest of the ETL are only imported once the settings are known to be good
+       from armadillo_routesheets_etl import run_headless, run_local
+
+       if settings.get('local_database'):
+              routesheets_failed_to_insert = run_local(settings.pop('local_database'), settings.pop('directory'),
+                                                       settings.pop('field_map'), settings.pop('table'), **settings)
+       else:
+              routesheets_failed_to_insert = run_headless(settings.pop('connection_string'), settings.pop('directory'),
+                                                          settings.pop('field_map'), settings.pop('table'), **settings)
+       return 1 if routesheets_failed_to_insert else 0
+
+
+
+if __name__ == '__main__':
+       sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:52:19 2026
+
+@author: cjmauro
+"""
+
+import os
+import random
+import argparse
+import openpyxl
+
+
+#headers of a routesheet, in the order they appear on the sheet
+ROUTESHEET_COLUMNS = ('JobKey', 'Customer', 'Address', 'City', 'Latitude', 'Longitude', 'ProductType',
+                      'Service', 'ServiceFrequency', 'Quantity', 'Notes')
+
+BRANCHES = ('CLB', 'PCF', 'SWE')
+SERVICE_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+#(Service, ServiceFrequency, visits per day, days per week) as they are written on the routesheets
+SERVICES = (('1X', '1x/week', 1, 1), ('2X', '2x/week', 1, 2), ('3X', '3x/week', 1, 3),
+            ('5X', '5x/week', 1, 5), ('2X2', '2x/week twice daily', 2, 2), ('EOW', 'Every other week', 1, 1),
+            ('On call', 'On call', 1, 1), ('As needed', 'As needed', 1, 1), ('MONTHLY', 'Monthly', 1, 1))
+
+PRODUCT_TYPES = ('Standard Restroom', 'ADA Restroom', 'Hand Wash Station', 'Holding Tank', 'Trailer Unit', 'Roll Off')
+CITIES = {'CLB': ('Columbus', 29.70, -96.54), 'PCF': ('Point Comfort', 28.68, -96.56), 'SWE': ('Sweeney', 29.04, -95.70)}
+STREETS = ('Main St', 'FM 1093', 'Hwy 35', 'County Rd 12', 'Industrial Blvd', "O'Connor Rd", 'Plant Rd (Gate 4)')
+
+
+class RoutesheetGenerator():
+       '''
+       Writes synthetic routesheet workbooks shaped like the real ones: one
+       workbook per branch and service day named '<branch> <day>.xlsx', one
+       sheet per route, and one row per visit.  Each job is given a service
+       frequency and placed on that many days of its route, so the workbooks
+       line up the way the discrepancy report expects, apart from a share of
+       jobs (discrepancy_rate) that are missing a visit.  Sheets also carry the
+       blank rows, quotes and parentheses the cleaning steps have to deal with.
+       The same seed always gives the same workbooks.
+       '''
+
+       def __init__(self, branches=BRANCHES, service_days=SERVICE_DAYS[:5], routes=4, rows=200,
+                    discrepancy_rate=0.02, seed=0):
+
+              self.branches = tuple(branches)
+              self.service_days = tuple(service_days)
+              self.routes = routes
+
+              #roughly how many rows each route sheet gets
+              self.rows = rows
+              self.discrepancy_rate = discrepancy_rate
+              self.random = random.Random(seed)
+
+
+       def write_workbooks(self, directory: str) -> list:
+              '''Writes every workbook into directory.  Returns their filepaths.'''
+              os.makedirs(directory, exist_ok=True)
+              filepaths = []
+              for branch in self.branches:
+                     #key is the service day, value is {route name: [rows]}
+                     days = {day: {} for day in self.service_days}
+                     for route in range(1, self.routes + 1):
+                            route_name = f'Route {route}'
+                            for day in self.service_days:
+                                   days[day][route_name] = []
+                            self.add_route_jobs(branch, route, days)
+
+                     for day, routes in days.items():
+                            filepath = os.path.join(directory, f'{branch} {day}.xlsx')
+                            self.write_workbook(filepath, routes)
+                            filepaths.append(filepath)
+              return filepaths
+
+
+       def add_route_jobs(self, branch: str, route: int, days: dict):
+              route_name = f'Route {route}'
+              visits_per_job = sum(visits * min(days_per_week, len(self.service_days)) for _, _, visits, days_per_week in SERVICES) / len(SERVICES)
+              jobs = max(1, round(self.rows * len(self.service_days) / visits_per_job))
+
+              for job in range(jobs):
+                     service, service_frequency, visits, days_per_week = self.random.choice(SERVICES)
+                     job_days = self.random.sample(self.service_days, min(days_per_week, len(self.service_days)))
+                     row = self.build_row(branch, route, job, service, service_frequency)
+                     for day in job_days:
+                            for visit in range(visits):
+                                   days[day][route_name].append(row)
+                     if job_days and self.random.random() < self.discrepancy_rate:
+                            #a visit left off one of the sheets, which the discrepancy report should catch
+                            days[job_days[0]][route_name].pop()
+
+
+       def build_row(self, branch: str, route: int, job: int, service: str, service_frequency: str) -> list:
+              city, latitude, longitude = CITIES.get(branch, (branch, 29.0, -96.0))
+              return [f'{route}{job:05d}-{self.random.randint(1, 9)}',
+                      f'{self.random.choice(("Dow", "Formosa", "Lone Star", "Gulf Coast", "Matagorda"))} {self.random.choice(("Plant", "Site", "Yard", "Co."))}',
+                      f'{self.random.randint(100, 9999)} {self.random.choice(STREETS)}',
+                      city,
+                      round(latitude + self.random.uniform(-0.2, 0.2), 6),
+                      round(longitude + self.random.uniform(-0.2, 0.2), 6),
+                      self.random.choice(PRODUCT_TYPES),
+                      service,
+                      service_frequency,
+                      self.random.randint(1, 4),
+                      self.random.choice(('', 'Gate code 1234', 'Call before arrival', '"Key" in lockbox'))]
+
+
+       def write_workbook(self, filepath: str, routes: dict):
+              #write only mode streams rows straight to disk so large benchmarks stay cheap to build
+              workbook = openpyxl.Workbook(write_only=True)
+              for route_name, rows in routes.items():
+                     worksheet = workbook.create_sheet(route_name)
+                     worksheet.append(list(ROUTESHEET_COLUMNS))
+                     for position, row in enumerate(rows):
+                            if position and position % 50 == 0:
+                                   #blank and nearly blank rows are thrown out by dropna(thresh=10)
+                                   worksheet.append([None] * len(ROUTESHEET_COLUMNS))
+                                   worksheet.append(row[:3] + [None] * (len(ROUTESHEET_COLUMNS) - 3))
+                            worksheet.append(list(row))
+              workbook.save(filepath)
+
+
+
+if __name__ == '__main__':
+       parser = argparse.ArgumentParser(description='Write synthetic routesheet workbooks for benchmarks and testing.')
+       parser.add_argument('directory', help='folder to write the workbooks to')
+       parser.add_argument('--branches', nargs='+', default=list(BRANCHES))
+       parser.add_argument('--days', type=int, default=5, help='number of service days, starting Monday')
+       parser.add_argument('--routes', type=int, default=4, help='routes (sheets) per workbook')
+       parser.add_argument('--rows', type=int, default=200, help='approximate rows per route sheet')
+       parser.add_argument('--discrepancy-rate', type=float, default=0.02)
+       parser.add_argument('--seed', type=int, default=0)
+       args = parser.parse_args()
+
+       generator = RoutesheetGenerator(args.branches, SERVICE_DAYS[:args.days], args.routes, args.rows,
+                                       args.discrepancy_rate, args.seed)
+       filepaths = generator.write_workbooks(args.directory)
+       print(f'Wrote {len(filepaths)} workbooks to {args.directory}')
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:20:44 2026
+
+@author: cjmauro
+"""
+
+import queue
+import threading
+import traceback
+import pandas as pd
+
+
+class RoutesheetPipeline():
+       '''
+       Reads and cleans routesheets on a background thread while the caller
+       inserts them, connected by a bounded queue.  When the queue is full the
+       reader waits, so no more than queue_size sheets (or streamed chunks) are
+       held in memory between the two sides.
+
+       Wraps a workbook source such as iter_parsed_workbooks() or
+       iter_streamed_workbooks() and is iterated the same way, yielding
+       (filepath, parsed_sheets) so RoutesheetLoader can consume it unchanged.
+       Parse errors are passed through with their sheet as before.  pyodbc
+       releases the GIL while it waits on the server, so parsing keeps going
+       during inserts.
+       '''
+
+       def __init__(self, workbooks, queue_size=4):
+
+              #generator of (filepath, parsed_sheets), run on the producer thread
+              self.workbooks = workbooks
+              self.sheet_queue = queue.Queue(maxsize=queue_size)
+
+              #set when the loading side stops early so the producer can exit
+              self.stop_event = threading.Event()
+              self.producer = threading.Thread(target=self.produce, name='routesheet-reader', daemon=True)
+
+              #track open messages so anything the consumer leaves unread can be skipped
+              self.workbook_open = False
+              self.stream_open = False
+              self.finished = False
+
+
+       def __iter__(self):
+              self.producer.start()
+              try:
+                     while not self.finished:
+                            kind, payload = self.get()
+                            if kind != 'workbook':
+                                   continue
+                            self.workbook_open = True
+                            yield payload, self.iter_sheets()
+                            self.drain_workbook()
+              finally:
+                     self.stop_event.set()
+                     self.producer.join()
+
+
+       def produce(self):
+              try:
+                     for filepath, parsed_sheets in self.workbooks:
+                            self.put('workbook', filepath)
+                            for sheet_name, sheet_data, parse_error in parsed_sheets:
+                                   if sheet_data is None or isinstance(sheet_data, pd.DataFrame):
+                                          self.put('sheet', (sheet_name, sheet_data, parse_error))
+                                   else:
+                                          self.produce_stream(sheet_name, sheet_data, parse_error)
+                            self.put('end_workbook', None)
+              except StopPipeline:
+                     return
+              except Exception as error:
+                     self.put_final('error', error)
+              self.put_final('done', None)
+
+
+       def produce_stream(self, sheet_name, chunks, parse_error):
+              #streamed sheets are passed on chunk by chunk so memory stays bounded
+              self.put('stream', (sheet_name, parse_error))
+              try:
+                     for chunk in chunks:
+                            self.put('chunk', chunk)
+              except StopPipeline:
+                     raise
+              except Exception:
+                     self.put('chunk_error', traceback.format_exc())
+              self.put('end_stream', None)
+
+
+       def put(self, kind: str, payload):
+              while not self.stop_event.is_set():
+                     try:
+                            self.sheet_queue.put((kind, payload), timeout=0.1)
+                            return
+                     except queue.Full:
+                            continue
+              raise StopPipeline()
+
+
+       def put_final(self, kind: str, payload):
+              try:
+                     self.put(kind, payload)
+              except StopPipeline:
+                     pass
+
+
+       def get(self) -> tuple:
+              kind, payload = self.sheet_queue.get()
+              if kind in ('done', 'error'):
+                     #the producer is gone, nothing else is coming
+                     self.finished = True
+                     self.workbook_open = False
+                     self.stream_open = False
+                     if kind == 'error':
+                            raise payload
+              return kind, payload
+
+
+       def iter_sheets(self):
+              while self.workbook_open:
+                     kind, payload = self.get()
+                     if kind == 'end_workbook':
+                            self.workbook_open = False
+                     elif kind == 'sheet':
+                            yield payload
+                     elif kind == 'stream':
+                            sheet_name, parse_error = payload
+                            self.stream_open = True
+                            yield sheet_name, self.iter_chunks(), parse_error
+                            self.drain_stream()
+
+
+       def iter_chunks(self):
+              while self.stream_open:
+                     kind, payload = self.get()
+                     if kind == 'end_stream':
+                            self.stream_open = False
+                     elif kind == 'chunk_error':
+                            raise RuntimeError(f'Reading stopped part way through the sheet:\n{payload}')
+                     else:
+                            yield payload
+
+
+       def drain_stream(self):
+              #skip chunks of a sheet the loader gave up on
+              while self.stream_open:
+                     kind, payload = self.get()
+                     if kind == 'end_stream':
+                            self.stream_open = False
+
+
+       def drain_workbook(self):
+              while self.workbook_open:
+                     kind, payload = self.get()
+                     if kind == 'end_workbook':
+                            self.workbook_open = False
+                     elif kind == 'stream':
+                            self.stream_open = True
+                            self.drain_stream()
+
+
+
+class StopPipeline(Exception):
+       '''Raised on the producer thread when the loading side has stopped.'''
+       pass
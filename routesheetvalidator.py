@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:14:05 2026
+
+@author: cjmauro
+"""
+
+import os
+import re
+import csv
+import json
+import numpy as np
+import pandas as pd
+from exceldatahandler import SHEET_CONSTANTS
+
+
+class RoutesheetValidator():
+       '''
+       Checks a cleaned sheet before anything is sent to the database, so one
+       bad row no longer rolls back the whole sheet.  Rows with problems are
+       written to a quarantine csv with the reasons and the rest of the sheet
+       is passed on to be inserted.  The row checks are vectorized per column:
+
+        *numeric_columns holding text, which is how misaligned rows show up
+        *a minus sign anywhere but the front of a number
+        *coordinates outside coordinate_bounds, or inside them once the sign
+         is flipped (a dropped minus sign)
+
+       Duplicate headers and headers missing from the field map would break
+       every row of the sheet, so those quarantine the whole sheet and raise
+       RoutesheetValidationError.
+       '''
+
+       def __init__(self, field_map: dict, quarantine_path: str, numeric_columns=('Latitude', 'Longitude', 'Quantity'),
+                    coordinate_bounds=None):
+
+              self.field_map = field_map
+              self.quarantine_path = str(quarantine_path)
+              self.numeric_columns = tuple(numeric_columns)
+
+              #key is the column name, value is the (lowest, highest) value allowed
+              self.coordinate_bounds = coordinate_bounds or {'Latitude': (-90, 90), 'Longitude': (-180, 180)}
+
+              #key is the sheet label, value is the number of rows quarantined from it
+              self.quarantined_rows = {}
+
+
+       def validate(self, dataframe, sheet_label: str):
+              '''Returns the rows of dataframe that passed.  Failed rows are written to the quarantine file.'''
+              sheet_errors = self.check_headers(dataframe)
+              if sheet_errors:
+                     self.quarantine(dataframe, np.full(len(dataframe.index), '; '.join(sheet_errors), dtype=object), sheet_label)
+                     raise RoutesheetValidationError(f'{sheet_label} was quarantined: {"; ".join(sheet_errors)}')
+
+              reasons = np.full(len(dataframe.index), '', dtype=object)
+              for position in range(dataframe.shape[1]):
+                     name = str(dataframe.columns[position]).strip()
+                     if name in self.numeric_columns or name in self.coordinate_bounds:
+                            self.check_numeric_column(dataframe.iloc[:, position], name, reasons)
+
+              bad_rows = reasons != ''
+              if not bad_rows.any():
+                     return dataframe
+              self.quarantine(dataframe[bad_rows], reasons[bad_rows], sheet_label)
+              print(f'{bad_rows.sum()} rows of {sheet_label} failed validation and were quarantined to {self.quarantine_path}\n')
+              return dataframe[~bad_rows]
+
+
+       def check_headers(self, dataframe) -> list:
+              sheet_errors = []
+              columns = [str(column) for column in dataframe.columns]
+
+              #pandas renames repeated headers to 'name.1', 'name.2', ...
+              duplicates = sorted({column for column in columns if columns.count(column) > 1}
+                                  | {match.group(1) for match in map(re.compile(r'^(.+)\.\d+$').match, columns)
+                                     if match and match.group(1) in columns})
+              if duplicates:
+                     sheet_errors.append(f'duplicate column headers {duplicates}')
+
+              fields = list(dataframe.attrs.get(SHEET_CONSTANTS, {})) + columns
+              unmapped = [field for field in fields if self.field_map.get(str(field).strip()) is None
+                          and not any(str(field).startswith(f'{duplicate}.') for duplicate in duplicates)]
+              if unmapped:
+                     sheet_errors.append(f'headers missing from the field map {unmapped}')
+              return sheet_errors
+
+
+       def check_numeric_column(self, column, name: str, reasons):
+              numeric = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+              present = column.notna().to_numpy()
+
+              not_numeric = present & np.isnan(numeric)
+              if not_numeric.any():
+                     text = column.astype(str).str.strip()
+                     misplaced_minus = not_numeric & text.str.contains(r'.-', regex=True).to_numpy()
+                     self.add_reason(reasons, misplaced_minus, f'{name} has a minus sign in the wrong spot')
+                     self.add_reason(reasons, not_numeric & ~misplaced_minus, f'{name} is not a number, the columns may be misaligned')
+
+              if name not in self.coordinate_bounds:
+                     return
+              lowest, highest = self.coordinate_bounds[name]
+              with np.errstate(invalid='ignore'):
+                     #empty cells are NaN and pass, a 0 is a real value and is checked like any other
+                     checked = ~np.isnan(numeric)
+                     out_of_range = checked & ((numeric < lowest) | (numeric > highest))
+                     sign_flipped = out_of_range & (-numeric >= lowest) & (-numeric <= highest)
+              self.add_reason(reasons, sign_flipped, f'{name} has the wrong sign')
+              self.add_reason(reasons, out_of_range & ~sign_flipped, f'{name} is outside {lowest} to {highest}')
+
+
+       def add_reason(self, reasons, mask, reason: str):
+              if mask.any():
+                     reasons[mask] = [f'{existing}; {reason}' if existing else reason for existing in reasons[mask]]
+
+
+       def quarantine(self, dataframe, reasons, sheet_label: str):
+              '''Appends the rows to the quarantine csv along with their Excel row number and reasons.'''
+              write_header = not os.path.exists(self.quarantine_path) or not os.path.getsize(self.quarantine_path)
+              columns = [str(column) for column in dataframe.columns]
+              with open(self.quarantine_path, 'a', newline='', encoding='utf-8') as quarantine_file:
+                     writer = csv.writer(quarantine_file)
+                     if write_header:
+                            writer.writerow(['sheet', 'row', 'reasons', 'values'])
+                     for index, reason, values in zip(dataframe.index, reasons, dataframe.itertuples(index=False, name=None)):
+                            #the index counts data rows from 0 and the header is Excel row 1
+                            excel_row = index + 2 if isinstance(index, (int, np.integer)) else index
+                            writer.writerow([sheet_label, excel_row, reason, json.dumps(dict(zip(columns, values)), default=str)])
+              self.quarantined_rows[sheet_label] = self.quarantined_rows.get(sheet_label, 0) + len(dataframe.index)
+
+
+
+class RoutesheetValidationError(Exception):
+       '''Raised when a whole sheet fails validation and nothing from it is inserted.'''
+       pass
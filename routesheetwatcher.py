@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:58:12 2026
+
+@author: cjmauro
+"""
+
+import os
+import time
+
+
+class RoutesheetWatcher():
+       '''
+       Polls a routesheet folder and its subfolders for new or modified Excel
+       workbooks.  Each poll is one os.scandir pass per folder that only stats
+       files, nothing is opened or hashed.  A workbook is handed out once its
+       size and modified time have held still for settle_seconds, so files that
+       are still being copied or saved are not read half written.  Excel's
+       '~$' owner files are ignored.  Workbooks are handed out again only when
+       they change after that.
+       '''
+
+       def __init__(self, directory: str, poll_interval=2.0, settle_seconds=5.0):
+
+              self.directory = str(directory)
+              self.poll_interval = poll_interval
+              self.settle_seconds = settle_seconds
+
+              #key is the filepath, value is the (size, modified time) it was handed out with
+              self.handed_out = {}
+
+              #key is the filepath, value is ((size, modified time), when it was first seen like that)
+              self.settling = {}
+
+
+       def scan(self) -> dict:
+              '''Returns {filepath: (size, modified time)} for every workbook under the folder.'''
+              workbooks = {}
+              directories = [self.directory]
+              while directories:
+                     try:
+                            entries = list(os.scandir(directories.pop()))
+                     except OSError:
+                            #a subfolder can be removed between polls
+                            continue
+                     for entry in entries:
+                            try:
+                                   if entry.is_dir(follow_symlinks=False):
+                                          directories.append(entry.path)
+                                   elif entry.is_file() and is_excel_file(entry.name):
+                                          stat = entry.stat()
+                                          workbooks[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                            except OSError:
+                                   continue
+              return workbooks
+
+
+       def poll(self) -> list:
+              '''Returns the workbooks that are new or changed and have settled since they were handed out last.'''
+              now = time.monotonic()
+              workbooks = self.scan()
+              settled = []
+              for filepath, signature in workbooks.items():
+                     if self.handed_out.get(filepath) == signature:
+                            continue
+                     settling_signature, first_seen = self.settling.get(filepath, (None, None))
+                     if settling_signature != signature:
+                            #new or still changing, start the clock again
+                            self.settling[filepath] = (signature, now)
+                     elif now - first_seen >= self.settle_seconds:
+                            del self.settling[filepath]
+                            self.handed_out[filepath] = signature
+                            settled.append(filepath)
+
+              #forget deleted workbooks so they load again if they come back
+              for filepath in set(self.handed_out) - set(workbooks):
+                     del self.handed_out[filepath]
+              for filepath in set(self.settling) - set(workbooks):
+                     del self.settling[filepath]
+              return sorted(settled)
+
+
+       def forget(self, filepaths: list):
+              '''Hands the workbooks out again once they settle, for a batch that failed to load.'''
+              for filepath in filepaths:
+                     self.handed_out.pop(filepath, None)
+
+
+       def iter_batches(self):
+              '''Polls forever, yielding each non empty list of settled workbooks.'''
+              while True:
+                     filepaths = self.poll()
+                     if filepaths:
+                            yield filepaths
+                     time.sleep(self.poll_interval)
+
+
+
+def is_excel_file(filename: str) -> bool:
+       #'~$Book.xlsx' is the lock file Excel keeps next to an open workbook
+       return '.xls' in filename.lower() and not filename.startswith('~$')
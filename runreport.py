@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:08:31 2026
+
+@author: cjmauro
+"""
+
+import os
+import csv
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+#columns of the per stage records, in the order they are written to csv
+STAGE_FIELDS = ('file', 'sheet', 'stage', 'seconds', 'rows', 'rows_per_second', 'bytes', 'peak_memory_bytes', 'status')
+
+
+class RunReport():
+       '''
+       Times each stage of an ETL run (workbook open, sheet parse, clean,
+       add_required_columns, staging, insert and commit) per file and sheet,
+       along with the rows and bytes it handled.  With trace_memory the peak
+       memory of each stage is taken from tracemalloc, and with profile_path
+       the run is profiled with cProfile and the stats are dumped there.
+       The records are written out as a JSON or csv run report so slow sheets
+       and regressions between runs can be found.
+
+       Stages may be recorded from the pipeline and insert worker threads.
+       tracemalloc tracks the whole process, so peak memory is only exact for
+       stages that don't overlap, and cProfile only follows the main thread.
+       '''
+
+       def __init__(self, enabled=True, trace_memory=False, profile_path=None):
+
+              #a disabled report records nothing, so instrumented code can always call stage()
+              self.enabled = enabled
+              self.trace_memory = trace_memory and enabled
+              self.profile_path = profile_path if enabled else None
+
+              #one dict per timed stage, see STAGE_FIELDS
+              self.stages = []
+              self.lock = threading.Lock()
+
+              self.profiler = None
+              self.started_at = None
+              self.time_start = None
+              self.total_seconds = None
+
+
+       def start(self):
+              if not self.enabled:
+                     return
+              self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+              self.time_start = time.perf_counter()
+              if self.trace_memory and not tracemalloc.is_tracing():
+                     tracemalloc.start()
+              if self.profile_path:
+                     self.profiler = cProfile.Profile()
+                     self.profiler.enable()
+
+
+       def stop(self):
+              if not self.enabled or self.time_start is None:
+                     return
+              self.total_seconds = round(time.perf_counter() - self.time_start, 4)
+              if self.profiler:
+                     self.profiler.disable()
+                     self.profiler.dump_stats(self.profile_path)
+                     print(f'Profile written to {self.profile_path}')
+                     self.profiler = None
+              if self.trace_memory and tracemalloc.is_tracing():
+                     tracemalloc.stop()
+
+
+       @contextmanager
+       def stage(self, stage_name: str, file='', sheet='', rows=None, bytes=None):
+              '''
+              Times the body of a with block as one stage.  Yields a dict where the
+              block can fill in 'rows' and 'bytes' once it knows them.  A stage that
+              raises is recorded with status 'failed' and the error is passed on.
+              '''
+              measures = {'rows': rows, 'bytes': bytes}
+              if not self.enabled:
+                     yield measures
+                     return
+
+              if self.trace_memory and tracemalloc.is_tracing():
+                     tracemalloc.reset_peak()
+              time_start = time.perf_counter()
+              status = 'failed'
+              try:
+                     yield measures
+                     status = 'ok'
+              finally:
+                     seconds = time.perf_counter() - time_start
+                     peak_memory = tracemalloc.get_traced_memory()[1] if self.trace_memory and tracemalloc.is_tracing() else None
+                     self.record(stage_name, file, sheet, seconds, measures['rows'], measures['bytes'], peak_memory, status)
+
+
+       def record(self, stage_name: str, file, sheet, seconds: float, rows=None, bytes=None, peak_memory=None, status='ok'):
+              if not self.enabled:
+                     return
+              rows_per_second = round(rows / seconds, 1) if rows and seconds else None
+              stage = {'file': os.path.basename(str(file)) if file else '',
+                       'sheet': str(sheet) if sheet is not None else '',
+                       'stage': stage_name,
+                       'seconds': round(seconds, 6),
+                       'rows': rows,
+                       'rows_per_second': rows_per_second,
+                       'bytes': bytes,
+                       'peak_memory_bytes': peak_memory,
+                       'status': status}
+              with self.lock:
+                     self.stages.append(stage)
+
+
+       def extend(self, stages: list):
+              #records made in another process, such as a parse worker
+              if self.enabled and stages:
+                     with self.lock:
+                            self.stages.extend(stages)
+
+
+       def summarize(self) -> dict:
+              '''Totals per stage, summed over every file and sheet.'''
+              with self.lock:
+                     stages = list(self.stages)
+              totals = {}
+              for stage in stages:
+                     total = totals.setdefault(stage['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+                                                                'peak_memory_bytes': None, 'failed': 0})
+                     total['count'] += 1
+                     total['seconds'] += stage['seconds']
+                     total['rows'] += stage['rows'] or 0
+                     total['bytes'] += stage['bytes'] or 0
+                     if stage['peak_memory_bytes'] is not None:
+                            total['peak_memory_bytes'] = max(total['peak_memory_bytes'] or 0, stage['peak_memory_bytes'])
+                     if stage['status'] != 'ok':
+                            total['failed'] += 1
+              for total in totals.values():
+                     total['seconds'] = round(total['seconds'], 4)
+                     total['rows_per_second'] = round(total['rows'] / total['seconds'], 1) if total['rows'] and total['seconds'] else None
+              return totals
+
+
+       def slowest_sheets(self, count=5) -> list:
+              '''Returns (seconds, sheet label) for the sheets that took longest over all their stages.'''
+              sheet_seconds = {}
+              with self.lock:
+                     for stage in self.stages:
+                            if stage['sheet']:
+                                   #loading stages carry the full '{file} - {sheet}' label as their sheet
+                                   sheet_label = f'{stage["file"]} - {stage["sheet"]}' if stage['file'] else stage['sheet']
+                                   sheet_seconds[sheet_label] = sheet_seconds.get(sheet_label, 0.0) + stage['seconds']
+              return sorted(((round(seconds, 4), sheet_label) for sheet_label, seconds in sheet_seconds.items()), reverse=True)[:count]
+
+
+       def write(self, report_path: str):
+              '''Writes the run report as csv when report_path ends in .csv, otherwise as JSON.'''
+              if not self.enabled:
+                     return
+              with self.lock:
+                     stages = list(self.stages)
+              if str(report_path).lower().endswith('.csv'):
+                     with open(report_path, 'w', newline='', encoding='utf-8') as report_file:
+                            writer = csv.DictWriter(report_file, fieldnames=STAGE_FIELDS)
+                            writer.writeheader()
+                            writer.writerows(stages)
+              else:
+                     report = {'started_at': self.started_at,
+                               'seconds': self.total_seconds,
+                               'totals': self.summarize(),
+                               'stages': stages}
+                     with open(report_path, 'w', encoding='utf-8') as report_file:
+                            json.dump(report, report_file, indent=1)
+              print(f'Run report written to {report_path}')
+
+
+       def print_summary(self):
+              if not self.enabled:
+                     return
+              print('Stage timings:')
+              for stage_name, total in self.summarize().items():
+                     print(f' {stage_name}: {total["seconds"]} seconds over {total["count"]}, {total["rows"]} rows'
+                           + (f', {total["rows_per_second"]} rows/sec' if total['rows_per_second'] else ''))
+              slowest_sheets = self.slowest_sheets()
+              if slowest_sheets:
+                     print('Slowest sheets:')
+                     for seconds, sheet_label in slowest_sheets:
+                            print(f' {sheet_label}: {seconds} seconds')
+
+
+
+#shared by code that is called without a report, records nothing
+NO_REPORT = RunReport(enabled=False)
@@ -51,6 +51,7 @@ class ServerLoginWindow():
               connection_string = self.parse_connection_string_from_input()
               sql_connection = db.connect(connection_string)
               self.sqldatahandler.set_sql_connector(sql_connection)
+              self.sqldatahandler.set_connection_string(connection_string)
               self.root.destroy()
        
        
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:47:26 2026
+
+@author: cjmauro
+"""
+
+import re
+import collections
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+
+#columns added to each sheet, they must be in the field map and the table
+#ServiceUnparsed stays last, the end of run summary names it
+SERVICE_COLUMNS = ('VisitsPerDay', 'DaysPerWeek', 'FrequencyDaysPerWeek', 'IsOnCall', 'ServiceUnparsed')
+
+#the patterns follow ServiceDiscrepancyReport.SQL's CASEs, so the normalized report finds the same rows
+#[Service] LIKE '_[xX]%', and LIKE '_[xX]2%' for twice a day: '3X2' is three days a week twice a day, '5X' five days once a day
+TIMES_WEEKLY_PATTERN = re.compile(r'^.[xX](2)?')
+#CAST(LEFT(ServiceFrequency,1) AS INT), where SQL Server casts '' and a space to 0
+FREQUENCY_DIGIT_PATTERN = re.compile(r'^([0-9]|\s|$)')
+#the services the MaxOrd CASE expects once, EOW, as needed and on call anywhere, the rest as the whole code
+ONCE_ONLY_PATTERN = re.compile(r'EOW|AS.*NEEDED|ON.*CALL', re.IGNORECASE)
+ONCE_ONLY_SERVICES = frozenset(('', 'NONE', '%OAM%', '1M', 'MONTHLY'))
+ON_CALL_PATTERN = re.compile(r'ON.*CALL|AS.*NEEDED', re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def parse_service_code(service, service_frequency) -> tuple:
+       '''
+       Parses a Service code and its ServiceFrequency into (visits per day,
+       days per week, frequency days per week, is on call, unparsed), None
+       standing for an empty cell.
+
+       Days per week comes from the Service code and divides the product count
+       into the report's Quantity, it is 1 for anything but 'NX' codes.
+       Frequency days per week comes from ServiceFrequency and gives the
+       expected number of occurrences with visits per day, it is 1 for less
+       than weekly and on call services.  The two are kept apart so products
+       whose Service and ServiceFrequency disagree still show up in the report.
+
+       A Service that SQL Server could not divide by, or a ServiceFrequency
+       that is missing or starts with something SQL Server can't cast where
+       one is needed, is unparsed.
+       Routesheets repeat a handful of codes, so results are cached and each
+       distinct pair is only parsed once.
+       '''
+       service_text = '' if service is None else service
+       times_weekly = TIMES_WEEKLY_PATTERN.match(service_text)
+       twice_daily = bool(times_weekly and times_weekly.group(1))
+       visits_per_day = 2 if twice_daily else 1
+       is_on_call = int(bool(ON_CALL_PATTERN.search(service_text)))
+
+       days_per_week = 1
+       if times_weekly:
+              #CAST(LEFT(TRIM([Service]),1) AS INT), which SQL Server can't divide by unless it is 1 to 9
+              service_digit = service_text.strip()[:1]
+              if not ('1' <= service_digit <= '9'):
+                     return 0, 0, 0, is_on_call, 1
+              days_per_week = int(service_digit)
+
+       once_only = service is not None and (ONCE_ONLY_PATTERN.search(service_text)
+                                            or service_text.rstrip().upper() in ONCE_ONLY_SERVICES)
+       if once_only and not twice_daily:
+              return visits_per_day, days_per_week, 1, is_on_call, 0
+
+       frequency_digit = None if service_frequency is None else FREQUENCY_DIGIT_PATTERN.match(service_frequency)
+       if frequency_digit is None:
+              #the report has no expected number of occurrences, but the Quantity can still be worked out
+              return visits_per_day, days_per_week, 0, is_on_call, 1
+       return visits_per_day, days_per_week, int(frequency_digit.group(1).strip() or 0), is_on_call, 0
+
+
+
+class ServiceFrequencyParser():
+       '''
+       Adds numeric VisitsPerDay, DaysPerWeek, FrequencyDaysPerWeek, IsOnCall
+       and ServiceUnparsed columns to a sheet from its free text Service and ServiceFrequency
+       columns, so reports can work on plain integers instead of LIKE patterns.
+       Only the distinct (Service, ServiceFrequency) pairs of a sheet are parsed,
+       then the results are spread back over the rows.  Unparsed codes are
+       counted so they can be reported at the end of a run.
+       '''
+
+       def __init__(self):
+
+              #key is (Service, ServiceFrequency), value is how many rows had it
+              self.unparsed_codes = collections.Counter()
+
+
+       def add_columns(self, dataframe):
+              '''Returns the dataframe with the service columns added at the end.'''
+              services = self.get_column(dataframe, 'Service')
+              if services is None:
+                     return dataframe
+              service_frequencies = self.get_column(dataframe, 'ServiceFrequency')
+              if service_frequencies is None:
+                     service_frequencies = pd.Series(None, index=dataframe.index, dtype=object)
+              parsed = pd.DataFrame(self.parse_columns(services, service_frequencies), columns=list(SERVICE_COLUMNS),
+                                    index=dataframe.index)
+
+              #one concat instead of inserting the columns one by one, the sheet constants are kept in attrs
+              parsed_dataframe = pd.concat([dataframe, parsed], axis=1)
+              parsed_dataframe.attrs = dataframe.attrs
+              return parsed_dataframe
+
+
+       def parse_columns(self, services, service_frequencies):
+              '''Returns an integer array with one row per value and one column per SERVICE_COLUMNS entry.'''
+              service_codes, service_values = self.factorize_text(services)
+              frequency_codes, frequency_values = self.factorize_text(service_frequencies)
+
+              #one code per (Service, ServiceFrequency) pair, without building a MultiIndex for every sheet
+              pair_keys, codes, pair_counts = np.unique(service_codes * len(frequency_values) + frequency_codes,
+                                                         return_inverse=True, return_counts=True)
+              distinct_pairs = [(service_values[key // len(frequency_values)], frequency_values[key % len(frequency_values)])
+                                for key in pair_keys.tolist()]
+              parsed_pairs = np.array([parse_service_code(*pair) for pair in distinct_pairs],
+                                      dtype='int64').reshape(-1, len(SERVICE_COLUMNS))
+
+              for position in np.flatnonzero(parsed_pairs[:, -1] == 1):
+                     self.unparsed_codes[distinct_pairs[position]] += int(pair_counts[position])
+              return parsed_pairs[codes.reshape(-1)]
+
+
+       def factorize_text(self, column):
+              #codes into the distinct values as text, with None standing in for an empty cell
+              codes, values = pd.factorize(column, use_na_sentinel=True)
+              values = [str(value) for value in values] + [None]
+              return np.where(codes < 0, len(values) - 1, codes), values
+
+
+       def get_column(self, dataframe, name: str):
+              #first column with the name, a repeated header is caught by validation
+              for position, column in enumerate(dataframe.columns):
+                     if str(column).strip() == name:
+                            return dataframe.iloc[:, position]
+              return None
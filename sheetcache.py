@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:48:09 2026
+
+@author: cjmauro
+"""
+
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+import traceback
+import pandas as pd
+
+try:
+       import pyarrow as pa
+       import pyarrow.feather as feather
+except ImportError:
+       pa = None
+
+
+#part of every entry name, bumped whenever the cleaned sheets change shape so
+#entries written by an older version are never read back (v2: empty cells stay NaN instead of 0,
+#v3: the sheet's row index is kept)
+CACHE_FORMAT = 'v3'
+
+#column the sheet's index is stored in, next to the positional data columns '0', '1', ...
+INDEX_COLUMN = 'index'
+
+
+class SheetCache():
+       '''
+       Stores cleaned sheets as Arrow IPC (feather) files so an unchanged sheet
+       can be memory-mapped back in instead of being parsed out of the xlsx
+       again.  Entries are keyed by the workbook's path, mtime and size (or its
+       content hash when use_content_hash is True) plus the sheet name, so
+       editing a workbook invalidates its entries automatically.  The least
+       recently used entries are evicted once the cache grows past max_bytes.
+       '''
+
+       def __init__(self, cache_directory: str, max_bytes=2 * 1024**3, use_content_hash=False):
+
+              if pa is None:
+                     raise ImportError('SheetCache requires pyarrow.  Install it with: pip install pyarrow')
+
+              self.cache_directory = str(cache_directory)
+              self.max_bytes = max_bytes
+              self.use_content_hash = use_content_hash
+              os.makedirs(self.cache_directory, exist_ok=True)
+
+
+       def get(self, filepath: str, sheet_name: str):
+              '''Returns the cached dataframe for a sheet, or None when it is not cached.'''
+              entry_path = self.entry_path(filepath, sheet_name)
+              try:
+                     table = feather.read_table(entry_path, memory_map=True)
+              except (FileNotFoundError, OSError):
+                     return None
+              self.touch(entry_path)
+              #integer_object_nulls keeps whole numbers next to empty cells as ints, as read_excel gave them
+              dataframe = table.drop([INDEX_COLUMN]).to_pandas(integer_object_nulls=True)
+              #original headers are kept in the schema metadata since they can repeat
+              dataframe.columns = json.loads(table.schema.metadata[b'routesheet_columns'])
+              #the rows dropped in cleaning leave gaps, the index still counts the sheet's rows for the Excel row numbers
+              dataframe.index = pd.Index(table.column(INDEX_COLUMN).to_numpy())
+              return dataframe
+
+
+       def put(self, filepath: str, sheet_name: str, dataframe) -> bool:
+              '''Caches a cleaned sheet.  Returns False if it could not be stored.'''
+              self.remove_entries(self.workbook_prefix(filepath) + self.hash_text(str(sheet_name)) + '_*.arrow')
+              entry_path = self.entry_path(filepath, sheet_name)
+              try:
+                     table = self.dataframe_to_table(dataframe)
+                     temp_path = f'{entry_path}.{os.getpid()}.tmp'
+                     feather.write_feather(table, temp_path, compression='uncompressed')
+                     os.replace(temp_path, entry_path)
+              except Exception:
+                     traceback.print_exc()
+                     print(f'Could not cache {filepath} - {sheet_name}, it will be parsed again next time.\n')
+                     return False
+              self.evict()
+              return True
+
+
+       def get_sheet_names(self, filepath: str):
+              '''Returns the cached sheet names of a workbook so it need not be opened, or None.'''
+              try:
+                     with open(self.entry_path(filepath, None, extension='.json'), encoding='utf-8') as sheet_names_file:
+                            return json.load(sheet_names_file)
+              except (FileNotFoundError, ValueError):
+                     return None
+
+
+       def put_sheet_names(self, filepath: str, sheet_names: list):
+              self.remove_entries(self.workbook_prefix(filepath) + '*.json')
+              with open(self.entry_path(filepath, None, extension='.json'), 'w', encoding='utf-8') as sheet_names_file:
+                     json.dump(list(sheet_names), sheet_names_file)
+
+
+       def invalidate(self, filepath=None):
+              '''Removes every entry for one workbook, or the whole cache when no filepath is given.'''
+              if filepath:
+                     self.remove_entries(self.workbook_prefix(filepath) + '*')
+              else:
+                     self.remove_entries('*.arrow')
+                     self.remove_entries('*.json')
+
+
+       def evict(self):
+              entries = []
+              for entry_path in glob.glob(os.path.join(glob.escape(self.cache_directory), '*.arrow')):
+                     try:
+                            entry_stat = os.stat(entry_path)
+                     except FileNotFoundError:
+                            continue #removed by another worker
+                     entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+
+              cache_size = sum(size for _, size, _ in entries)
+              for _, size, entry_path in sorted(entries):
+                     if cache_size <= self.max_bytes:
+                            break
+                     self.remove_file(entry_path)
+                     cache_size -= size
+
+
+       def dataframe_to_table(self, dataframe):
+              columns = {}
+              for position in range(dataframe.shape[1]):
+                     column = dataframe.iloc[:, position]
+                     try:
+                            columns[str(position)] = pa.array(column, from_pandas=True)
+                     except (pa.ArrowInvalid, pa.ArrowTypeError):
+                            #mixed types can't share an Arrow type, the loader only needs their string form
+                            columns[str(position)] = pa.array(column.map(lambda value: None if pd.isna(value) else str(value)), type=pa.string())
+              columns[INDEX_COLUMN] = pa.array(dataframe.index.to_numpy())
+              table = pa.table(columns)
+              return table.replace_schema_metadata({'routesheet_columns': json.dumps([str(column) for column in dataframe.columns])})
+
+
+       def entry_path(self, filepath: str, sheet_name, extension='.arrow') -> str:
+              name = self.workbook_prefix(filepath)
+              if sheet_name is not None:
+                     name += self.hash_text(str(sheet_name)) + '_'
+              return os.path.join(self.cache_directory, name + self.workbook_version(filepath) + '_' + CACHE_FORMAT + extension)
+
+
+       def workbook_prefix(self, filepath: str) -> str:
+              return self.hash_text(os.path.abspath(filepath)) + '_'
+
+
+       def workbook_version(self, filepath: str) -> str:
+              if self.use_content_hash:
+                     content_hash = hashlib.sha256()
+                     with open(filepath, 'rb') as workbook:
+                            for block in iter(lambda: workbook.read(1024 * 1024), b''):
+                                   content_hash.update(block)
+                     return content_hash.hexdigest()[:16]
+              workbook_stat = os.stat(filepath)
+              return self.hash_text(f'{workbook_stat.st_mtime_ns}|{workbook_stat.st_size}')
+
+
+       def hash_text(self, text: str) -> str:
+              return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+       def touch(self, entry_path: str):
+              #mtime doubles as last-used time for eviction
+              try:
+                     os.utime(entry_path)
+              except FileNotFoundError:
+                     pass
+
+
+       def remove_entries(self, pattern: str):
+              for entry_path in glob.glob(os.path.join(glob.escape(self.cache_directory), pattern)):
+                     self.remove_file(entry_path)
+
+
+       def remove_file(self, entry_path: str):
+              try:
+                     os.remove(entry_path)
+              except FileNotFoundError:
+                     pass
+
+
+
+if __name__ == '__main__':
+       parser = argparse.ArgumentParser(description='Manage the parsed routesheet cache.')
+       parser.add_argument('cache_directory', help='folder holding the cached sheets')
+       parser.add_argument('--invalidate', nargs='*', metavar='WORKBOOK',
+                           help='drop cached sheets for the given workbooks, or everything when none are given')
+       args = parser.parse_args()
+
+       if args.invalidate is None:
+              parser.print_help()
+              sys.exit(1)
+
+       sheet_cache = SheetCache(args.cache_directory)
+       if args.invalidate:
+              for workbook_path in args.invalidate:
+                     sheet_cache.invalidate(workbook_path)
+                     print(f'Cache cleared for {workbook_path}')
+       else:
+              sheet_cache.invalidate()
+              print(f'Cache cleared: {args.cache_directory}')
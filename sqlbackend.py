@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:42:07 2026
+
+@author: cjmauro
+"""
+
+import re
+
+
+class SqlServerBackend():
+       '''
+       Builds the statements SqlDataHandler runs in SQL Server's dialect.  This
+       is the default backend, see SqlDataHandler.set_backend().
+       '''
+
+       def table_name(self, table_name: str) -> str:
+              return table_name
+
+
+       def create_select_statement(self, columns: str, table_name: str, where='') -> str:
+              select_statement = f'SELECT {columns} FROM {table_name}'
+              if where:
+                     select_statement += f' WHERE {where}'
+              return select_statement
+
+
+       def read_column_types(self, cursor, table_name: str) -> list:
+              '''Returns (field name, data type, max length, precision, scale) for every column of the table.'''
+              schema, _, table = table_name.replace('[', '').replace(']', '').rpartition('.')
+              select_statement = ('SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE '
+                                  + 'FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?')
+              params = [table]
+              if schema:
+                     select_statement += ' AND TABLE_SCHEMA = ?'
+                     params.append(schema.split('.')[-1])
+              return cursor.execute(select_statement, params).fetchall()
+
+
+       def build_input_sizes(self, sqldatahandler, field_types: list) -> list:
+              '''Turns column types into the (sql type, size, decimal digits) tuples pyodbc's setinputsizes() takes.'''
+              #imported here since column types are only known on SQL Server, other connectors don't need pyodbc
+              import pyodbc as db
+              input_sizes = []
+              for data_type, max_length, precision, scale in field_types:
+                     if data_type in sqldatahandler.integer_types:
+                            input_sizes.append((db.SQL_BIGINT if data_type == 'bigint' else db.SQL_INTEGER, 0, 0))
+                     elif data_type in sqldatahandler.float_types:
+                            input_sizes.append((db.SQL_DOUBLE, 0, 0))
+                     elif data_type in sqldatahandler.character_types:
+                            #-1 is (max), which pyodbc takes as size 0
+                            input_sizes.append((db.SQL_WVARCHAR, max(max_length or 0, 0), 0))
+                     else:
+                            #dates and everything else are sent as text for the server to convert
+                            input_sizes.append((db.SQL_WVARCHAR, 100, 0))
+              return input_sizes
+
+
+       def execute_stored_procedure(self, cursor, proc_name: str, *args):
+              placeholders = ', '.join('?' for arg in args)
+              return cursor.execute(f'EXEC {proc_name} {placeholders}', list(args))
+
+
+
+class SqliteBackend():
+       '''
+       Runs SqlDataHandler against a local SQLite file (see SqliteConnector),
+       so a folder can be loaded and checked without a SQL Server.  Schema
+       names are dropped from table names, so dbo.Routesheets and
+       dbo.MostRecentImport are the Routesheets table and MostRecentImport view
+       that create_schema() makes.  SQLite has no stored procedures, local
+       stand-ins written in Python are added with register_procedure().
+       '''
+
+       #SQLite declared types and the SQL Server types SqlDataHandler binds them as
+       column_types = {'INTEGER': ('bigint', None, 19, 0),
+                       'REAL': ('float', None, 53, None),
+                       'TEXT': ('nvarchar', -1, None, None)}
+
+       top_pattern = re.compile(r'^\s*top\s+(\d+)\s+', re.IGNORECASE)
+
+       def __init__(self):
+
+              #key is the procedure name without schema, lowercased
+              #value is a function called with the cursor and the procedure's arguments
+              self.procedures = {}
+
+
+       def table_name(self, table_name: str) -> str:
+              return table_name.replace('[', '').replace(']', '').rpartition('.')[2]
+
+
+       def create_select_statement(self, columns: str, table_name: str, where='') -> str:
+              #SELECT TOP n becomes LIMIT n
+              top = self.top_pattern.match(columns)
+              if top:
+                     columns = columns[top.end():]
+              select_statement = f'SELECT {columns} FROM {table_name}'
+              if where:
+                     select_statement += f' WHERE {where}'
+              if top:
+                     select_statement += f' LIMIT {top.group(1)}'
+              return select_statement
+
+
+       def read_column_types(self, cursor, table_name: str) -> list:
+              columns = cursor.execute(f'PRAGMA table_info({self.table_name(table_name)})').fetchall()
+              return [(column[1],) + self.column_types.get(str(column[2]).upper(), self.column_types['TEXT']) for column in columns]
+
+
+       def build_input_sizes(self, sqldatahandler, field_types: list) -> list:
+              #SQLite binds by value, there are no sizes to declare
+              return []
+
+
+       def register_procedure(self, proc_name: str, procedure):
+              self.procedures[self.table_name(proc_name).lower()] = procedure
+
+
+       def execute_stored_procedure(self, cursor, proc_name: str, *args):
+              procedure = self.procedures.get(self.table_name(proc_name).lower())
+              if procedure is None:
+                     raise LookupError(f'{proc_name} has no local version, add one with register_procedure()')
+              return procedure(cursor, *args)
+
+
+       def create_schema(self, cursor, table_name: str, field_types: dict, importid_field='ImportID'):
+              '''
+              Creates an empty table from field_types, {field name: SQLite type},
+              replacing any table of that name, and the MostRecentImport view
+              get_importid() reads.  The view hands out the ImportID after the
+              highest one in the table's importid_field.
+              '''
+              table_name = self.table_name(table_name)
+              field_definitions = ', '.join(f'{field} {field_type or "TEXT"}' for field, field_type in field_types.items())
+              cursor.execute('DROP VIEW IF EXISTS MostRecentImport')
+              cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
+              cursor.execute(f'CREATE TABLE {table_name} ({field_definitions})')
+              cursor.execute(f'CREATE VIEW MostRecentImport AS SELECT COALESCE(MAX({importid_field}), 0) + 1 AS ImportID FROM {table_name}')
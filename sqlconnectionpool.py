@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:02:31 2026
+
+@author: cjmauro
+"""
+
+import queue
+import threading
+
+
+class SqlConnectionPool():
+       '''
+       Hands out up to size connections opened from one connection string.
+       Connections are opened on first use and reused after they are released,
+       so parallel inserts never pay for reconnecting.  acquire() blocks once
+       all connections are checked out, which caps concurrency at size.
+       '''
+
+       def __init__(self, connection_string: str, size=4, connect=None):
+
+              self.connection_string = connection_string
+              self.size = size
+
+              #function that opens a new connection, pyodbc.connect unless a stand-in is given
+              if connect is None:
+                     import pyodbc as db
+                     connect = db.connect
+              self.connect = connect
+
+              self.idle_connections = queue.LifoQueue()
+              self.all_connections = []
+              self.lock = threading.Lock()
+
+
+       def acquire(self):
+              try:
+                     return self.idle_connections.get_nowait()
+              except queue.Empty:
+                     pass
+
+              with self.lock:
+                     if len(self.all_connections) < self.size:
+                            sql_connector = self.connect(self.connection_string)
+                            self.all_connections.append(sql_connector)
+                            return sql_connector
+
+              #pool is at capacity, wait for a connection to come back
+              return self.idle_connections.get()
+
+
+       def release(self, sql_connector):
+              self.idle_connections.put(sql_connector)
+
+
+       def close_all(self):
+              with self.lock:
+                     for sql_connector in self.all_connections:
+                            try:
+                                   sql_connector.close()
+                            except Exception:
+                                   pass
+                     self.all_connections.clear()
+                     self.idle_connections = queue.LifoQueue()
@@ -5,11 +5,15 @@ Created on Tue Sep 26 10:22:23 2023
 @author: cjmauro
 """
 
-import pyodbc as db
 import numpy as np
+import pandas as pd
 import re #regex
-import sys
+import os
+import tempfile
 import traceback
+from bulkloader import write_staging_file
+from exceldatahandler import SHEET_CONSTANTS
+from sqlbackend import SqlServerBackend
 
 class SqlDataHandler():
        
@@ -18,6 +22,9 @@ class SqlDataHandler():
               #DB Connection
               self.sql_connector = sql_connector
 
+              #kept so extra connections can be opened for parallel inserts
+              self.connection_string = None
+
               #Cursor used for executing statements in the DB
               if self.sql_connector:
                      self.cursor = self.sql_connector.cursor()
@@ -33,6 +40,21 @@ class SqlDataHandler():
 
               self.rows_to_insert = []
 
+              #Optional bulk path, see set_bulk_loader()
+              self.bulk_loader = None
+              self.staging_directory = None
+
+              #dialect of the statements built here, see set_backend()
+              self.backend = SqlServerBackend()
+
+              #key is the table name, value is {field name: (data type, max length, precision, scale)}
+              #read once per table from INFORMATION_SCHEMA, or given with set_column_types()
+              self.column_types = {}
+
+              #key is (table name, tuple of incoming headers in order)
+              #value is the insert plan built for that layout, see get_insert_plan()
+              self.insert_plans = {}
+
 
        def raise_bad_field_map_exception(self, bad_field_map):
               raise TypeError
@@ -44,11 +66,52 @@ class SqlDataHandler():
               self.cursor = self.sql_connector.cursor()
                      
               
+       def set_connection_string(self, connection_string: str):
+              self.connection_string = connection_string
+
+
+       def copy_with_connector(self, sql_connector):
+              '''
+              Returns a new SqlDataHandler on another connection that shares this
+              handler's field map and bulk loader.  Used by insert workers that
+              each own a pooled connection.
+              '''
+              sqldatahandler = SqlDataHandler(sql_connector, self.field_map)
+              sqldatahandler.set_connection_string(self.connection_string)
+              sqldatahandler.set_bulk_loader(self.bulk_loader, self.staging_directory)
+              sqldatahandler.set_backend(self.backend)
+              sqldatahandler.column_types = self.column_types
+              sqldatahandler.insert_plans = self.insert_plans
+              return sqldatahandler
+
+
+       def set_bulk_loader(self, bulk_loader, staging_directory=None):
+              '''
+              bulk_loader is an object with a load(sqldatahandler, staging_path, table_name, field_names)
+              method, such as bulkloader.SqlServerBulkLoader.  staging_directory is where
+              staging files are written (the system temp folder when None).
+              '''
+              self.bulk_loader = bulk_loader
+              self.staging_directory = staging_directory
+
+
+       def set_backend(self, backend):
+              '''
+              backend builds the statements that differ between databases, such as
+              sqlbackend.SqliteBackend for a local SQLite file.  SQL Server's
+              sqlbackend.SqlServerBackend is used when none is set.
+              '''
+              self.backend = backend
+              self.column_types.clear()
+              self.insert_plans.clear()
+
+
        def set_field_map(self, field_map):
               #key should be an external field name
               #value should be the corresponding field name from a table of the db specified by the connector
               if isinstance(field_map, dict):
                      self.field_map = field_map
+                     self.insert_plans.clear()
               else:
                      self.raise_bad_field_map_exception()
                      
@@ -66,10 +129,15 @@ class SqlDataHandler():
               
 
        def insert_rows_to_table(self, row: dict, table_name: str):
-              insert_statement = self.create_insert_statement(row, table_name) 
+              insert_plan = self.get_insert_plan(row, table_name)
+              insert_statement = insert_plan['statement']
+              input_sizes = insert_plan['input_sizes']
               try:
                      self.sql_connector.autocommit = False
                      self.cursor.fast_executemany = True
+                     if input_sizes:
+                            #declared sizes stop pyodbc guessing them from the first row
+                            self.cursor.setinputsizes(input_sizes)
                      self.cursor.executemany(f'{insert_statement}', self.rows_to_insert)
               except:
                      traceback.print_exc()
@@ -83,10 +151,38 @@ class SqlDataHandler():
               finally:
                      self.sql_connector.autocommit = True
                      self.cursor.fast_executemany = False
+                     if input_sizes:
+                            self.cursor.setinputsizes(None)
                      self.rows_to_insert.clear()
-                     print(f'SQLDataHandler returned to initial state')
+                     print('SQLDataHandler returned to initial state')
                 
               
+       def bulk_insert_rows_to_table(self, row, table_name: str):
+              '''
+              Writes the staged rows to a csv staging file and loads it with a
+              single bulk statement.  Falls back to the parameterized
+              insert_rows_to_table() when no bulk loader is set or the bulk load fails.
+              '''
+              if not self.bulk_loader:
+                     return self.insert_rows_to_table(row, table_name)
+
+              field_names = self.get_insert_plan(row, table_name)['field_names']
+              staging_file, staging_path = tempfile.mkstemp(suffix='.csv', prefix='routesheet_', dir=self.staging_directory)
+              os.close(staging_file)
+              try:
+                     write_staging_file(self.rows_to_insert, staging_path, len(field_names))
+                     self.bulk_loader.load(self, staging_path, self.backend.table_name(table_name), field_names)
+              except:
+                     traceback.print_exc()
+                     print(f'Bulk load into {table_name} failed, falling back to parameterized insert...')
+                     self.insert_rows_to_table(row, table_name)
+              else:
+                     print(f'Bulk load committed {len(self.rows_to_insert)} rows to {table_name}')
+                     self.rows_to_insert.clear()
+              finally:
+                     os.remove(staging_path)
+
+
        def create_insert_statement(self, row, table_name):
               '''
               if self.row_is_empty(row):
@@ -95,17 +191,49 @@ class SqlDataHandler():
               else:
               '''
               #this will not work if the order of objects in dict are changed or no longer guaranteed
-              field_names = self.build_field_names_string(row)
-              value_placeholders = self.build_value_placeholders_string(row)                     
-              insert_statement = f'INSERT INTO {table_name} {field_names} VALUES {value_placeholders}'
-              return insert_statement
+              return self.get_insert_plan(row, table_name)['statement']
+
+
+       def get_insert_plan(self, row, table_name: str) -> dict:
+              '''
+              Returns the insert plan for a table and header layout, building it
+              the first time the layout is seen.  Nearly every routesheet shares
+              the same headers, so the statement, mapped field names and parameter
+              types are worked out once and reused for every later sheet.
+              '''
+              signature = (table_name, self.get_external_fields(row))
+              insert_plan = self.insert_plans.get(signature)
+              if insert_plan is None:
+                     insert_plan = self.build_insert_plan(signature[1], table_name)
+                     self.insert_plans[signature] = insert_plan
+              return insert_plan
+
+
+       def build_insert_plan(self, external_fields: tuple, table_name: str) -> dict:
+              field_names = [self.field_map.get(field.strip()) for field in external_fields]
+              unmapped_fields = [field for field, field_name in zip(external_fields, field_names) if field_name is None]
+              if unmapped_fields:
+                     #checked once per layout, this used to surface as a 'None' column in the statement
+                     raise KeyError(f'No field map entry for {", ".join(repr(field) for field in unmapped_fields)} '
+                                    + f'when inserting into {table_name}')
+
+              value_placeholders = ','.join('?' for field in field_names)
+              column_types = self.get_column_types(table_name)
+              field_types = [column_types.get(self.normalize_field_name(field)) for field in field_names]
+              if not all(field_types):
+                     #bind untyped unless every field's type is known
+                     field_types = []
+              return {'statement': f'INSERT INTO {self.backend.table_name(table_name)} ({",".join(field_names)}) VALUES ({value_placeholders})',
+                      'field_names': field_names,
+                      'field_types': field_types,
+                      'input_sizes': self.build_input_sizes(field_types)}
        
        
        def row_is_empty(self, row):
               #Row is considered empty if it contains all null or missing values
               external_fields = tuple(row.keys())
               values = tuple(row.get(field) for field in external_fields)
-              null_values = ('None', 'nan', '', None, np.NaN)
+              null_values = ('None', 'nan', '', None, np.nan)
               is_empty = False
               for value in values:
                      if value not in null_values:
@@ -124,6 +252,10 @@ class SqlDataHandler():
               def wrapper(*args, **kwargs):
                      scrubbed_data = []
                      for dirty_data in func(*args, **kwargs):
+                            if pd.api.types.is_scalar(dirty_data) and pd.isna(dirty_data):
+                                   #missing values are bound as NULL
+                                   scrubbed_data.append(None)
+                                   continue
                             scrubbed_data.append(re.sub('\"|\'|\(|\)', '', str(dirty_data)))
                      return scrubbed_data
               return wrapper
@@ -135,7 +267,7 @@ class SqlDataHandler():
               table-level field names.  The string is meant to be used in a sql insert 
               statement as the fields of the table that values are being inserted into.
               '''
-              external_fields = tuple(row.keys())
+              external_fields = self.get_external_fields(row)
               internal_fields = ''
               for field in external_fields:
                      internal_fields += f'{self.field_map.get(field.strip())},'
@@ -143,8 +275,23 @@ class SqlDataHandler():
               return internal_fields
        
        
+       def get_mapped_field_names(self, row) -> list:
+              #table-level field names in the same order as the incoming fields
+              return [self.field_map.get(field.strip()) for field in self.get_external_fields(row)]
+
+
+       def get_external_fields(self, row) -> tuple:
+              #sheet constants (see ExcelDataHandler.set_sheet_constant) are bound in front of the columns
+              return tuple(str(field) for field in self.get_sheet_constants(row)) + tuple(str(field) for field in row.keys())
+
+
+       def get_sheet_constants(self, row) -> dict:
+              #plain dict rows have no attrs
+              return getattr(row, 'attrs', {}).get(SHEET_CONSTANTS, {})
+
+
        def build_value_placeholders_string(self, row):
-              external_fields = tuple(row.keys())
+              external_fields = self.get_external_fields(row)
               value_placeholders = ''
               for field in external_fields:
                      value_placeholders += '?,'
@@ -154,11 +301,146 @@ class SqlDataHandler():
        @scrub_data
        def build_values_to_insert_list(self, row):
               external_fields = tuple(row.keys())
-              values_to_insert = [str(row.get(field)) if field in ('Latitude', 'Longitude') else row.get(field) for field in external_fields]
-              return values_to_insert
+              values_to_insert = [row.get(field) for field in external_fields]
+              return list(self.get_sheet_constants(row).values()) + values_to_insert
+
+
+       def add_dataframe_to_insert(self, dataframe, table_name=None):
+              '''
+              Batch counterpart of add_row_to_insert().  Stages every row of a
+              dataframe at once, working column by column instead of building a
+              Series per row.  The column order of the dataframe must match the
+              header passed to insert_rows_to_table().
+              '''
+              self.rows_to_insert.extend(self.build_values_to_insert_frame(dataframe, table_name))
+
+
+       def build_values_to_insert_frame(self, dataframe, table_name=None) -> list:
+              '''
+              Returns one parameter tuple per dataframe row, holding the same
+              values build_values_to_insert_list() gives for that row.
+              Columns are read by position so duplicate headers are kept.
+              When table_name is given and its column types are known, columns
+              bound for numeric fields are passed as numbers straight from a
+              typed array instead of being stringified cell by cell.
+              Sheet constants are converted once and repeated for every row.
+              '''
+              field_types = self.get_insert_plan(dataframe, table_name)['field_types'] if table_name else []
+              sheet_constants = self.get_sheet_constants(dataframe)
+              num_rows = len(dataframe.index)
+              columns = []
+              for position, value in enumerate(sheet_constants.values()):
+                     field_type = field_types[position] if field_types else None
+                     columns.append(self.bind_column(pd.Series([value], dtype=object), field_type) * num_rows)
+              for position in range(dataframe.shape[1]):
+                     field_type = field_types[len(sheet_constants) + position] if field_types else None
+                     columns.append(self.bind_column(dataframe.iloc[:, position], field_type))
+              return list(zip(*columns))
+
+
+       def bind_column(self, column, field_type=None) -> list:
+              values = self.convert_numeric_column(column, field_type[0]) if field_type else None
+              return values if values is not None else self.scrub_column(column)
+
+
+       scrub_pattern = re.compile('\"|\'|\(|\)')
+
+       def scrub_column(self, column) -> list:
+              '''
+              Vectorized scrub_data: converts a whole column to strings and strips
+              quotes and parentheses in one pass.  Missing values come back as
+              None so they are bound as NULL.
+              '''
+              missing = column.isna().to_numpy()
+              if column.dtype == object:
+                     #object columns can hold mixed types, so str() each cell to match the row path exactly
+                     text = column.map(str)
+              else:
+                     text = column.astype(str)
+              values = text.str.replace(self.scrub_pattern, '', regex=True).tolist()
+              if missing.any():
+                     values = [None if is_missing else value for value, is_missing in zip(values, missing)]
+              return values
 
 
        
+       #target column types whose values are bound as numbers instead of strings
+       integer_types = ('int', 'bigint', 'smallint', 'tinyint')
+       float_types = ('float', 'real', 'decimal', 'numeric', 'money', 'smallmoney')
+       character_types = ('nvarchar', 'varchar', 'nchar', 'char', 'ntext', 'text')
+
+       def convert_numeric_column(self, column, data_type: str):
+              '''
+              Converts a column bound for a numeric field into a list of Python
+              ints or floats (None for missing values) in one vectorized pass.
+              Returns None when the field isn't numeric or the column holds text
+              that isn't a number, so it goes through scrub_column() and the
+              server rejects it as it did before.
+              '''
+              if data_type not in self.integer_types + self.float_types:
+                     return None
+              numeric = pd.to_numeric(column, errors='coerce')
+              missing = numeric.isna().to_numpy()
+              if (missing & column.notna().to_numpy()).any():
+                     return None
+
+              numbers = numeric.to_numpy(dtype='float64', na_value=np.nan)
+              if data_type in self.integer_types:
+                     present = numbers[~missing]
+                     if (present != np.floor(present)).any():
+                            return None
+                     values = np.where(missing, 0, numbers).astype('int64').tolist()
+              else:
+                     values = numbers.tolist()
+              if missing.any():
+                     values = [None if is_missing else value for value, is_missing in zip(values, missing)]
+              return values
+
+
+       def set_column_types(self, table_name: str, column_types: dict):
+              '''
+              Declares the column types of a table by hand, for example from the
+              field map, instead of reading them from INFORMATION_SCHEMA.
+              column_types maps each field name to (data type, max length, precision, scale).
+              '''
+              self.column_types[table_name] = {self.normalize_field_name(field): column_type for field, column_type in column_types.items()}
+              #plans already built for the table were typed with the old metadata
+              for signature in [signature for signature in self.insert_plans if signature[0] == table_name]:
+                     del self.insert_plans[signature]
+
+
+       def get_column_types(self, table_name: str) -> dict:
+              if table_name not in self.column_types:
+                     self.column_types[table_name] = self.read_column_types(table_name)
+              return self.column_types[table_name]
+
+
+       def read_column_types(self, table_name: str) -> dict:
+              try:
+                     rows = self.backend.read_column_types(self.cursor, table_name)
+              except Exception:
+                     #no metadata to read (e.g. a stand-in database), values are bound untyped as before
+                     return {}
+              return {self.normalize_field_name(row[0]): (str(row[1]).lower(), row[2], row[3], row[4]) for row in rows}
+
+
+       def get_field_types(self, row, table_name: str) -> list:
+              '''Returns the column type of each mapped field in row order, or an empty list if any are unknown.'''
+              return self.get_insert_plan(row, table_name)['field_types']
+
+
+       def normalize_field_name(self, field) -> str:
+              #SQL Server field names are case insensitive and may be bracketed in the field map
+              return str(field).replace('[', '').replace(']', '').strip().lower()
+
+
+       def build_input_sizes(self, field_types: list) -> list:
+              '''Turns column types into the (sql type, size, decimal digits) tuples pyodbc's setinputsizes() takes.'''
+              if not field_types:
+                     return []
+              return self.backend.build_input_sizes(self, field_types)
+
+
        def select_data_from_table(self, columns='Top 100 *', table=''):
               #Selects Top 100 * by default as a safety measure
               select_statement = self.create_select_statement(columns, table)
@@ -166,9 +448,8 @@ class SqlDataHandler():
               return result_set
               
 
-       def create_select_statement(self, columns='Top 100 *', table=''):
-              select_statement = f'SELECT {columns} FROM {table}'
-              return select_statement
+       def create_select_statement(self, columns='Top 100 *', table='', where=''):
+              return self.backend.create_select_statement(columns, self.backend.table_name(table), where)
  
              
        '''
@@ -183,7 +464,37 @@ class SqlDataHandler():
               return rows
 
 
+       def iter_result_set(self, select_statement, *params, fetch_size=10000):
+              '''Yields the rows of a query, fetching fetch_size at a time instead of holding them all like get_result_set().'''
+              for columns, rows in self.iter_result_batches(select_statement, *params, fetch_size=fetch_size):
+                     yield from rows
+
+
+       def iter_result_frames(self, select_statement, *params, chunk_rows=10000):
+              '''Yields the result of a query as dataframes of up to chunk_rows rows, named after the result columns.'''
+              for columns, rows in self.iter_result_batches(select_statement, *params, fetch_size=chunk_rows):
+                     yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+
+
+       def iter_result_batches(self, select_statement, *params, fetch_size=10000):
+              #a cursor of its own, so self.cursor can still be used between batches
+              cursor = self.sql_connector.cursor()
+              try:
+                     print(select_statement)
+                     cursor.execute(select_statement, *params)
+                     columns = [column[0] for column in cursor.description]
+                     rows = cursor.fetchmany(fetch_size)
+
+                     #an empty result still gives one empty batch, so exports get their header
+                     yield columns, rows
+                     while rows:
+                            rows = cursor.fetchmany(fetch_size)
+                            if rows:
+                                   yield columns, rows
+              finally:
+                     cursor.close()
+
+
        def execute_stored_procedure(self, proc_name: str, *args: str):
-              placeholders = ' '.join(['?' for arg in args])
-              params = ' '.join([arg for arg in args])
-              self.cursor.execute(f'{proc_name} {placeholders}', params)
+              #each argument is bound as its own parameter
+              return self.backend.execute_stored_procedure(self.cursor, proc_name, *args)
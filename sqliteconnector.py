@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:02:15 2026
+
+@author: cjmauro
+"""
+
+import sqlite3
+
+
+class SqliteConnector():
+       '''
+       Local stand-in for a pyodbc connection backed by a SQLite database file.
+       Exposes the parts of the pyodbc API that SqlDataHandler relies on
+       (cursor(), autocommit, commit/rollback on the cursor, fast_executemany)
+       so loads can be checked without a SQL Server.
+       '''
+
+       def __init__(self, database=':memory:'):
+
+              #path to the SQLite file, needed by tools that open the database themselves
+              self.database = str(database)
+              self.connection = sqlite3.connect(self.database)
+
+              #mirrors pyodbc: when True every statement is committed as it runs
+              self.autocommit = True
+
+
+       def cursor(self):
+              return SqliteCursor(self)
+
+
+       def commit(self):
+              self.connection.commit()
+
+
+       def rollback(self):
+              self.connection.rollback()
+
+
+       def close(self):
+              self.connection.close()
+
+
+
+class SqliteCursor():
+
+       def __init__(self, sqliteconnector):
+              self.sqliteconnector = sqliteconnector
+              self.cursor = sqliteconnector.connection.cursor()
+
+              #accepted for compatibility with pyodbc, SQLite has nothing to toggle
+              self.fast_executemany = False
+
+
+       def execute(self, statement: str, *params):
+              #pyodbc accepts parameters either spread out or as a single sequence
+              if len(params) == 1 and isinstance(params[0], (list, tuple)):
+                     params = params[0]
+              self.cursor.execute(statement, params)
+              self.commit_if_autocommit()
+              return self
+
+
+       def executemany(self, statement: str, rows):
+              self.cursor.executemany(statement, rows)
+              self.commit_if_autocommit()
+              return self
+
+
+       def commit_if_autocommit(self):
+              if self.sqliteconnector.autocommit:
+                     self.sqliteconnector.commit()
+
+
+       def setinputsizes(self, sizes):
+              #SQLite binds by value, input sizes are ignored
+              pass
+
+
+       def fetchone(self):
+              return self.cursor.fetchone()
+
+
+       def fetchmany(self, size=1):
+              return self.cursor.fetchmany(size)
+
+
+       def fetchall(self):
+              return self.cursor.fetchall()
+
+
+       @property
+       def description(self):
+              return self.cursor.description
+
+
+       def commit(self):
+              self.sqliteconnector.commit()
+
+
+       def rollback(self):
+              self.sqliteconnector.rollback()
+
+
+       def close(self):
+              self.cursor.close()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:14:05 2026
+
+@author: cjmauro
+"""
+
+import shutil
+import pytest
+from bulkloader import write_staging_file, SqliteBulkLoader
+from sqldatahandler import SqlDataHandler
+from sqliteconnector import SqliteConnector
+
+
+FIELD_NAMES = ['Branch', 'Notes', 'Latitude', 'Quantity']
+
+#NULL and '' must stay apart, and commas, quotes from other fields and line breaks must survive the csv
+ROWS = [('', None, 29.5, 3),
+        (None, '', None, 0),
+        ('North, East', 'first line\nsecond line', -81.25, None),
+        ('.', ' ', 0.0, 12)]
+
+
+def open_table(database_path):
+       sql_data = SqlDataHandler(SqliteConnector(str(database_path)))
+       sql_data.cursor.execute('CREATE TABLE Routesheets (Branch TEXT, Notes TEXT, Latitude REAL, Quantity INTEGER)')
+       sql_data.sql_connector.commit()
+       return sql_data
+
+
+def read_table(sql_data):
+       return sql_data.cursor.execute('SELECT Branch, Notes, Latitude, Quantity FROM Routesheets ORDER BY rowid').fetchall()
+
+
+@pytest.fixture
+def staging_path(tmp_path):
+       #a space in the folder name is where an unquoted .import path breaks
+       staging_directory = tmp_path / 'staging files'
+       staging_directory.mkdir()
+       return staging_directory / 'routesheet rows.csv'
+
+
+def test_round_trip_through_sqlite_shell(tmp_path, staging_path):
+       if not shutil.which('sqlite3'):
+              pytest.skip('the sqlite3 shell is not installed')
+       sql_data = open_table(tmp_path / 'routesheets.db')
+       write_staging_file(ROWS, str(staging_path), len(FIELD_NAMES))
+
+       SqliteBulkLoader().load(sql_data, str(staging_path), 'Routesheets', FIELD_NAMES)
+       assert read_table(sql_data) == ROWS
+
+
+def test_round_trip_without_shell(tmp_path, staging_path):
+       sql_data = open_table(tmp_path / 'routesheets.db')
+       write_staging_file(ROWS, str(staging_path), len(FIELD_NAMES))
+
+       bulk_loader = SqliteBulkLoader()
+       bulk_loader.sqlite_executable = None
+       bulk_loader.load(sql_data, str(staging_path), 'Routesheets', FIELD_NAMES)
+       assert read_table(sql_data) == ROWS
+
+
+def test_load_without_shell_matches_shell(tmp_path, staging_path):
+       if not shutil.which('sqlite3'):
+              pytest.skip('the sqlite3 shell is not installed')
+       write_staging_file(ROWS, str(staging_path), len(FIELD_NAMES))
+       shell_data = open_table(tmp_path / 'shell.db')
+       SqliteBulkLoader().load(shell_data, str(staging_path), 'Routesheets', FIELD_NAMES)
+       python_data = open_table(tmp_path / 'python.db')
+       SqliteBulkLoader().load_without_shell(python_data, str(staging_path), 'Routesheets', FIELD_NAMES)
+
+       assert read_table(shell_data) == read_table(python_data)
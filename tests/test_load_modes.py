@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:31:52 2026
+
+@author: cjmauro
+"""
+
+import sqlite3
+import pytest
+from benchmark import run_benchmark, BENCHMARK_TABLE
+from routesheetgenerator import RoutesheetGenerator
+
+
+#every way of loading a folder, which must all leave the same rows behind
+LOAD_MODES = {'bulk': ({}, True),
+              'chunked': ({'chunk_rows': 7}, False),
+              'chunked_bytes': ({'chunk_bytes': 2000}, False),
+              'streamed': ({'stream_chunk_size': 5}, False),
+              'pipelined': ({'pipeline_queue_size': 2}, False),
+              'parse_workers': ({'parse_workers': 2}, False),
+              'insert_workers': ({'insert_workers': 2}, False),
+              'parse_service_codes': ({'parse_service_codes': True}, False)}
+
+
+@pytest.fixture(scope='module')
+def routesheet_filepaths(tmp_path_factory):
+       directory = tmp_path_factory.mktemp('routesheets')
+       return RoutesheetGenerator(branches=('CLB', 'PCF'), service_days=('Monday', 'Tuesday'), routes=2, rows=15,
+                                  seed=7).write_workbooks(str(directory))
+
+
+def load_table(filepaths: list, database_path, load_options: dict, bulk=False) -> list:
+       result = run_benchmark(filepaths, str(database_path), load_options, bulk=bulk)
+       assert not result['failed_sheets']
+       with sqlite3.connect(str(database_path)) as connection:
+              columns = [row[1] for row in connection.execute(f'PRAGMA table_info({BENCHMARK_TABLE})')]
+              rows = connection.execute(f'SELECT * FROM {BENCHMARK_TABLE}').fetchall()
+       #rows come back in load order, which differs between modes
+       return columns, sorted(rows, key=repr)
+
+
+@pytest.fixture(scope='module')
+def plain_table(routesheet_filepaths, tmp_path_factory):
+       return load_table(routesheet_filepaths, tmp_path_factory.mktemp('plain') / 'plain.db', {})
+
+
+@pytest.mark.parametrize('mode', sorted(LOAD_MODES))
+def test_load_mode_matches_plain_load(mode, routesheet_filepaths, plain_table, tmp_path):
+       load_options, bulk = LOAD_MODES[mode]
+       columns, rows = load_table(routesheet_filepaths, tmp_path / f'{mode}.db', load_options, bulk)
+       plain_columns, plain_rows = plain_table
+       assert rows
+
+       if mode == 'parse_service_codes':
+              #the parsed columns are extra, everything else must match
+              content_positions = [position for position, column in enumerate(columns) if column not in
+                                 ('VisitsPerDay', 'DaysPerWeek', 'FrequencyDaysPerWeek', 'IsOnCall', 'ServiceUnparsed')]
+              rows = sorted((tuple(row[position] for position in content_positions) for row in rows), key=repr)
+              plain_rows = sorted((tuple(row[position] for position in content_positions) for row in plain_rows), key=repr)
+       assert rows == plain_rows
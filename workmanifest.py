@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:37:18 2026
+
+@author: cjmauro
+"""
+
+import os
+import json
+import time
+import socket
+
+
+class WorkManifest():
+       '''
+       File based work queue in a shared folder, so several processes or hosts
+       can load one folder of routesheets under a single ImportID.
+
+       The coordinator publishes job.json once, holding the ImportID, the table
+       and a unit of work per workbook sheet.  Workers claim a unit by creating
+       claims/<unit>.<attempt>.claim with O_CREAT | O_EXCL, which only one of
+       them can do even across hosts, and write results/<unit>.json once the
+       unit is loaded or has failed.  Files are only ever created, never
+       rewritten in place, so a worker that dies leaves nothing half written.
+
+       A claim with no result after stale_seconds is taken over by creating
+       the claim for the next attempt.  stale_seconds must be longer than any
+       one sheet takes to load, otherwise a slow sheet can be loaded twice.
+       Claims are aged against the share's own clock, so hosts whose clocks
+       disagree still agree on which claims are stale.
+       '''
+
+       def __init__(self, directory: str, worker=None, stale_seconds=3600.0):
+
+              self.directory = str(directory)
+              self.stale_seconds = stale_seconds
+
+              #names this process in claims and results, unique per host and process
+              self.worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+
+              self.job_path = os.path.join(self.directory, 'job.json')
+              self.claims_directory = os.path.join(self.directory, 'claims')
+              self.results_directory = os.path.join(self.directory, 'results')
+
+              #the published job, see load_job()
+              self.job = None
+
+
+       def publish(self, importid: int, table: str, units: list) -> dict:
+              '''
+              Publishes the job.  units holds (filename, sheet name) pairs, where a
+              sheet name of None stands for the whole workbook.  Raises
+              FileExistsError if a job was already published to the folder.
+              '''
+              os.makedirs(self.claims_directory, exist_ok=True)
+              os.makedirs(self.results_directory, exist_ok=True)
+
+              #only one coordinator can create the lock, job.json is then written whole before workers see it
+              try:
+                     os.close(os.open(os.path.join(self.directory, 'job.lock'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+              except FileExistsError:
+                     raise FileExistsError(f'A job was already published to {self.directory}, use a new or empty folder') from None
+              job = {'importid': int(importid),
+                     'table': table,
+                     'coordinator': self.worker,
+                     'published': time.time(),
+                     'units': [{'unit': f'{position:05d}', 'file': filename, 'sheet': sheet_name}
+                               for position, (filename, sheet_name) in enumerate(units)]}
+              self.write_json(self.job_path, job)
+              self.job = job
+              return job
+
+
+       def load_job(self):
+              '''Returns the published job, or None if there is none yet.'''
+              if self.job is None and os.path.exists(self.job_path):
+                     with open(self.job_path, encoding='utf-8') as job_file:
+                            self.job = json.load(job_file)
+              return self.job
+
+
+       def wait_for_job(self, poll_interval=2.0) -> dict:
+              while self.load_job() is None:
+                     time.sleep(poll_interval)
+              return self.job
+
+
+       def claim(self):
+              '''
+              Claims the next unit that has no result and is unclaimed or stale.
+              Returns the unit with its attempt number, or None when there is
+              nothing to claim right now.
+              '''
+              results = set(self.list_results())
+              attempts = self.list_claims()
+              now = self.share_time()
+              for unit in self.job['units']:
+                     if unit['unit'] in results:
+                            continue
+                     attempt = 0
+                     if unit['unit'] in attempts:
+                            latest_attempt, claimed_at = attempts[unit['unit']]
+                            if now - claimed_at < self.stale_seconds:
+                                   continue
+                            attempt = latest_attempt + 1
+                     if self.create_claim(unit['unit'], attempt):
+                            return dict(unit, attempt=attempt)
+              return None
+
+
+       def create_claim(self, unit: str, attempt: int) -> bool:
+              try:
+                     claim_file = os.open(self.claim_path(unit, attempt), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+              except FileExistsError:
+                     #another worker got there first
+                     return False
+              with os.fdopen(claim_file, 'w', encoding='utf-8') as claim:
+                     json.dump({'worker': self.worker, 'claimed': time.time()}, claim)
+              return True
+
+
+       def is_superseded(self, unit: dict) -> bool:
+              '''True if the claim went stale and another worker has taken the unit over since.'''
+              latest_attempt = self.list_claims().get(unit['unit'], (unit['attempt'], None))[0]
+              return latest_attempt > unit['attempt']
+
+
+       def record(self, unit: dict, failed_sheets: list, seconds: float):
+              '''Records a claimed unit as committed, or failed with the sheets that failed to insert.'''
+              self.write_json(os.path.join(self.results_directory, f'{unit["unit"]}.json'),
+                              {'unit': unit['unit'],
+                               'file': unit['file'],
+                               'sheet': unit['sheet'],
+                               'worker': self.worker,
+                               'attempt': unit['attempt'],
+                               'status': 'failed' if failed_sheets else 'committed',
+                               'failed': list(failed_sheets),
+                               'seconds': round(seconds, 4)})
+
+
+       def results(self) -> dict:
+              '''Returns {unit: result} for every unit that has finished.'''
+              results = {}
+              for unit in self.list_results():
+                     with open(os.path.join(self.results_directory, f'{unit}.json'), encoding='utf-8') as result_file:
+                            results[unit] = json.load(result_file)
+              return results
+
+
+       def remaining(self) -> int:
+              return len(self.job['units']) - len(self.list_results())
+
+
+       def is_finished(self) -> bool:
+              return self.remaining() == 0
+
+
+       def list_results(self) -> list:
+              return [name[:-len('.json')] for name in os.listdir(self.results_directory) if name.endswith('.json')]
+
+
+       def list_claims(self) -> dict:
+              '''Returns {unit: (latest attempt, when it was claimed)}.'''
+              attempts = {}
+              for entry in os.scandir(self.claims_directory):
+                     unit, _, rest = entry.name.partition('.')
+                     attempt, _, extension = rest.partition('.')
+                     if extension != 'claim' or not attempt.isdigit():
+                            continue
+                     attempt = int(attempt)
+                     if attempt >= attempts.get(unit, (-1, None))[0]:
+                            try:
+                                   attempts[unit] = (attempt, entry.stat().st_mtime)
+                            except OSError:
+                                   continue
+              return attempts
+
+
+       def share_time(self) -> float:
+              '''
+              Returns the time on the share, read back from the mtime of a file
+              this worker has just written there.  Claim mtimes are stamped by the
+              same clock, where time.time() on another host can be minutes off.
+              '''
+              clock_path = os.path.join(self.directory, f'{self.worker}.clock')
+              with open(clock_path, 'w', encoding='utf-8') as clock_file:
+                     clock_file.write(self.worker)
+              return os.stat(clock_path).st_mtime
+
+
+       def claim_path(self, unit: str, attempt: int) -> str:
+              return os.path.join(self.claims_directory, f'{unit}.{attempt}.claim')
+
+
+       def write_json(self, path: str, contents: dict):
+              #written under a name of its own and moved into place, so readers never see half a file
+              temp_path = f'{path}.{self.worker}.tmp'
+              with open(temp_path, 'w', encoding='utf-8') as json_file:
+                     json.dump(contents, json_file, indent=1)
+              os.replace(temp_path, path)